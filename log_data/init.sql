@@ -8,5 +8,16 @@ CREATE TABLE public.etl_log (
 	table_name varchar NULL,
 	etl_date timestamp NOT NULL,
 	error_msg varchar NULL,
+	-- Performance metrics of a tracked stage (helper/metrics.py), NULL on other events
+	wall_seconds float8 NULL,
+	cpu_seconds float8 NULL,
+	rows_in int8 NULL,
+	rows_out int8 NULL,
+	bytes_in int8 NULL,
+	bytes_out int8 NULL,
+	peak_rss_mb float8 NULL,
+	peak_traced_mb float8 NULL,
 	CONSTRAINT etl_log_tmp_pk PRIMARY KEY (log_id)
-);
\ No newline at end of file
+);
+
+CREATE INDEX etl_log_stage_metrics_idx ON public.etl_log (step, component, etl_date) WHERE wall_seconds IS NOT NULL;
\ No newline at end of file
@@ -0,0 +1,23 @@
+-- Performance metrics of the tracked pipeline stages (helper/metrics.py), one set per etl_log event.
+-- Events logged without metrics leave these columns NULL.
+-- Run once against the log database, e.g.
+--   psql -d log_car -f log_data/migrations/001_etl_log_metrics.sql
+
+BEGIN;
+
+ALTER TABLE public.etl_log
+	ADD COLUMN IF NOT EXISTS wall_seconds float8 NULL,
+	ADD COLUMN IF NOT EXISTS cpu_seconds float8 NULL,
+	ADD COLUMN IF NOT EXISTS rows_in int8 NULL,
+	ADD COLUMN IF NOT EXISTS rows_out int8 NULL,
+	ADD COLUMN IF NOT EXISTS bytes_in int8 NULL,
+	ADD COLUMN IF NOT EXISTS bytes_out int8 NULL,
+	ADD COLUMN IF NOT EXISTS peak_rss_mb float8 NULL,
+	ADD COLUMN IF NOT EXISTS peak_traced_mb float8 NULL;
+
+-- Stage reports read the events with metrics of one stage over time
+CREATE INDEX IF NOT EXISTS etl_log_stage_metrics_idx
+	ON public.etl_log (step, component, etl_date)
+	WHERE wall_seconds IS NOT NULL;
+
+COMMIT;
@@ -1,3 +1,115 @@
-from src.staging_pipeline import staging_pipeline
-from src.warehouse_pipeline import warehouse_pipeline
-from src.modelling.linear_regression import linear_regression
\ No newline at end of file
+import argparse
+import os
+import sys
+from datetime import datetime
+
+# Pipeline modules import each other relative to src (e.g. `from helper.utils import ...`)
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "src"))
+
+# The pipeline modules (and pandas, sqlalchemy, the Google and MinIO clients, scikit-learn) are
+# imported when a stage runs, so `--help` and argument errors answer without loading them
+
+STAGES = ["staging", "warehouse", "modelling"]
+
+def staging_pipeline(**kwargs):
+    from staging_pipeline import staging_pipeline
+    return staging_pipeline(**kwargs)
+
+def warehouse_pipeline(**kwargs):
+    from warehouse_pipeline import warehouse_pipeline
+    return warehouse_pipeline(**kwargs)
+
+def modelling_pipeline(**kwargs):
+    from modelling_pipeline import modelling_pipeline
+    return modelling_pipeline(**kwargs)
+
+def run_pipeline(stages: list, chunksize: int = None, full_refresh: bool = False, max_workers: int = None, executor: str = None,
+                 default_timeout: float = None) -> dict:
+    """
+    Runs the requested stages in order (each one's graph runs its independent tasks concurrently)
+    and prints the critical path report of every stage.
+    """
+    from helper.dag import DagError
+
+    runners = {
+        "staging": lambda: staging_pipeline(chunksize=chunksize, full_refresh=full_refresh, max_workers=max_workers, executor=executor,
+                                            default_timeout=default_timeout),
+        "warehouse": lambda: warehouse_pipeline(chunksize=chunksize, max_workers=max_workers, executor=executor, default_timeout=default_timeout),
+        "modelling": lambda: modelling_pipeline(default_timeout=default_timeout),
+    }
+
+    results = {}
+    for stage in stages:
+        try:
+            results[stage] = runners[stage]()
+        except DagError as e:
+            print(f"== {stage} (failed)\n{e.result.report()}")
+            raise
+        print(f"== {stage}\n{results[stage].report()}")
+    return results
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Car sales data and ML pipeline")
+    parser.add_argument("stages", nargs="*", metavar="stage", help=f"stages to run: {', '.join(STAGES)} (default: all)")
+    parser.add_argument("--chunksize", type=int, default=None, help="stream car_sales in chunks of this many rows")
+    parser.add_argument("--full-refresh", action="store_true", help="reload the whole source car_sales table")
+    parser.add_argument("--workers", type=int, default=None, help="tasks running at the same time (default PIPELINE_WORKERS or 4)")
+    parser.add_argument("--executor", choices=["thread", "process"], default=None, help="pool running the tasks (default PIPELINE_EXECUTOR or thread)")
+    parser.add_argument("--timeout", type=float, default=None, metavar="SECONDS",
+                        help="timeout of the tasks without one of their own (default PIPELINE_TASK_TIMEOUT or none)")
+    parser.add_argument("--profile", nargs="?", const=os.path.join("profiles", datetime.now().strftime("%Y%m%d-%H%M%S")), default=None,
+                        metavar="DIR", help="profile every task into DIR (default profiles/<timestamp>, or PIPELINE_PROFILE_DIR)")
+    parser.add_argument("--run-id", nargs="?", const=datetime.now().strftime("%Y%m%d-%H%M%S"), default=None, metavar="ID",
+                        help="keep every task result under runs/ID (PIPELINE_RUN_DIR) so the run can be resumed (default ID: <timestamp>)")
+    parser.add_argument("--resume", metavar="ID", help="resume run ID from its failed tasks, with the stages and options it was started with")
+    args = parser.parse_args(argv)
+
+    unknown = [stage for stage in args.stages if stage not in STAGES]
+    if unknown:
+        parser.error(f"unknown stage(s): {', '.join(unknown)}")
+    if args.resume and (args.run_id or args.stages or args.chunksize or args.full_refresh):
+        parser.error("--resume reruns the stages and options the run was started with, it takes no stage, --run-id, --chunksize or --full-refresh")
+
+    from helper.utils import load_env
+    load_env()
+
+    # Read by the DAG runner, and inherited by the workers of a process pool
+    if args.profile:
+        os.environ['PIPELINE_PROFILE_DIR'] = args.profile
+
+    # Keep the declared order whatever order the stages were given in
+    stages = [stage for stage in STAGES if stage in args.stages or not args.stages]
+    options = {"stages": stages, "chunksize": args.chunksize, "full_refresh": args.full_refresh}
+    if not (args.run_id or args.resume):
+        run_pipeline(stages, chunksize=args.chunksize, full_refresh=args.full_refresh, max_workers=args.workers, executor=args.executor,
+                     default_timeout=args.timeout)
+        return
+
+    # Checkpointed run: every task result is kept, a resumed run only runs what didn't succeed
+    from helper.run_store import RunStore
+    try:
+        run = RunStore(args.run_id or args.resume)
+    except ValueError as e:
+        parser.error(str(e))
+    if args.run_id and run.exists():
+        parser.error(f"run {run.run_id} already exists, resume it with --resume {run.run_id}")
+    if args.resume:
+        if not run.exists():
+            parser.error(f"no run {run.run_id} in {os.path.dirname(run.run_dir)}")
+        print(run.summary())
+        options = run.read_manifest()["args"]
+
+    # Read by the DAG runner
+    os.environ['PIPELINE_RUN_ID'] = run.run_id
+    run.start(options)
+    try:
+        run_pipeline(options["stages"], chunksize=options["chunksize"], full_refresh=options["full_refresh"],
+                     max_workers=args.workers, executor=args.executor, default_timeout=args.timeout)
+    except Exception:
+        run.finish("failed")
+        print(f"run {run.run_id} failed, resume it with: python pipeline.py --resume {run.run_id}")
+        raise
+    run.finish("success")
+
+if __name__ == "__main__":
+    main()
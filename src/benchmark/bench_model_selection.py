@@ -0,0 +1,60 @@
+import argparse
+import json
+import os
+import time
+import numpy as np
+from modelling.model_selection import cross_validate, load_candidates, fold_ids, best_candidate
+
+def make_matrix(n_rows: int, seed: int = 42):
+    """
+    Preprocessed car price features (year, condition, odometer, mmr) and a price with noise.
+    """
+    rng = np.random.default_rng(seed)
+    X = rng.normal(size=(n_rows, 4))
+    y = 14000 + X @ np.asarray([2500.0, 800.0, -1500.0, 7000.0]) + 300 * X[:, 3] ** 2 + rng.normal(0, 1500, n_rows)
+    return X, y
+
+def bench_model_selection(n_rows: int, workers: int, candidates: list, n_folds: int, seed: int = 42) -> dict:
+    X, y = make_matrix(n_rows, seed)
+    folds = fold_ids(np.arange(n_rows), n_folds)
+
+    started = time.perf_counter()
+    results = cross_validate(X, y, folds, candidates, max_workers=workers)
+    seconds = time.perf_counter() - started
+    best = best_candidate(results)
+    return {
+        "rows": n_rows,
+        "workers": workers,
+        "fits": len(candidates) * n_folds,
+        "seconds": round(seconds, 3),
+        # Time the fits took in total: the ideal wall-clock on one core
+        "fit_seconds": round(sum(result["seconds"] for result in results), 3),
+        "best": f"{best['name']} {best['params']}",
+    }
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Model selection benchmark: cross validation wall-clock per number of workers")
+    parser.add_argument("--rows", type=int, nargs="+", default=[200_000])
+    parser.add_argument("--workers", type=int, nargs="+", default=sorted({1, 2, os.cpu_count() or 1}))
+    parser.add_argument("--candidates", help="model selection config (default: modelling/model_candidates.json)")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--output", help="write the results as JSON to this file")
+    args = parser.parse_args(argv)
+
+    config = load_candidates(args.candidates)
+    results = []
+    for n_rows in args.rows:
+        baseline = None
+        for workers in args.workers:
+            result = bench_model_selection(n_rows, workers, config["candidates"], config["n_folds"], args.seed)
+            baseline = baseline or result["seconds"]
+            result["speedup"] = round(baseline / result["seconds"], 2)
+            results.append(result)
+            print(json.dumps(result))
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=4)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,317 @@
+import argparse
+import json
+import os
+import platform
+import resource
+import shutil
+import tempfile
+import time
+import tracemalloc
+import numpy as np
+import pandas as pd
+import sklearn
+import sqlalchemy
+from sklearn.linear_model import LinearRegression
+from benchmark.synthetic import make_car_brand, make_us_state, make_source_car_sales
+from helper.bulk_load import copy_upsert
+from helper.utils import set_db_connection, flush_etl_log
+from staging.extract.extract_db import extract_database
+from staging.transform.transform_car_sales import transform_datatype_car_sales
+from staging.load.load_staging import load_staging
+from warehouse.extract.extract_stg import extract_staging
+from warehouse.transform.transform_car_sales import transform_car_sales
+from warehouse.transform.data_quality import QuarantineStore
+from warehouse.load.load_wh import load_warehouse
+from modelling.extract.extract_warehouse import extract_warehouse_incremental
+from modelling.incremental_ols import TrainingState
+from modelling.linear_regression import FEATURES, TARGET
+from modelling.preprocessing.preprocessing_data import process_preprocessing
+from modelling.preprocessing.splitting_data import split_data
+
+# Bookkeeping tables of the embedded stand-in, as in staging_data / warehouse_data / log_data init.sql
+SQLITE_CHECKPOINT_TABLE = """
+    CREATE TABLE IF NOT EXISTS etl_checkpoint (
+        step TEXT NOT NULL, component TEXT NOT NULL, table_name TEXT NOT NULL,
+        max_created_at TIMESTAMP, max_id INTEGER, updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP NOT NULL,
+        PRIMARY KEY (step, component, table_name)
+    )
+"""
+SQLITE_LOG_TABLE = """
+    CREATE TABLE IF NOT EXISTS etl_log (
+        id INTEGER PRIMARY KEY, step TEXT, component TEXT, status TEXT, table_name TEXT, etl_date TIMESTAMP, error_msg TEXT,
+        wall_seconds REAL, cpu_seconds REAL, rows_in INTEGER, rows_out INTEGER, bytes_in INTEGER, bytes_out INTEGER,
+        peak_rss_mb REAL, peak_traced_mb REAL
+    )
+"""
+
+def measure(func, reset=None, repeat: int = 1):
+    """
+    Returns (result, seconds, cpu seconds, peak MiB allocated during the call). Time is the best of
+    repeat calls and memory comes from one more call, so tracemalloc overhead doesn't inflate the
+    timing. reset (not measured) runs before each call, for stages that write to a table.
+    """
+    seconds = cpu_seconds = float("inf")
+    for _ in range(repeat):
+        if reset:
+            reset()
+        start, start_cpu = time.perf_counter(), time.process_time()
+        result = func()
+        seconds = min(seconds, time.perf_counter() - start)
+        cpu_seconds = min(cpu_seconds, time.process_time() - start_cpu)
+        del result
+
+    if reset:
+        reset()
+    tracemalloc.start()
+    result = func()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return result, seconds, cpu_seconds, peak / 2**20
+
+class Databases:
+    """
+    The source, staging, warehouse and log databases of a benchmark run, registered as the shared
+    engines of the pipeline. Either SQLite files in a temporary directory (the embedded stand-in) or
+    Postgres databases given by URL, initialised with the repo's init.sql. Their car_sales tables are
+    emptied: only ever point them at scratch databases.
+    """
+    def __init__(self, work_dir: str, urls: dict = None):
+        self.urls = urls or {role: f"sqlite:///{os.path.join(work_dir, role)}.db"
+                             for role in ("source", "staging", "warehouse", "log")}
+        self.engines = {role: sqlalchemy.create_engine(url) for role, url in self.urls.items()}
+        self.backend = self.engines["source"].dialect.name
+        for role, engine in self.engines.items():
+            set_db_connection(role, engine)
+
+        if self.backend == "sqlite":
+            for role in ("staging", "warehouse"):
+                self.execute(role, SQLITE_CHECKPOINT_TABLE)
+            self.execute("log", SQLITE_LOG_TABLE)
+
+    def execute(self, role: str, statement: str):
+        with self.engines[role].begin() as connection:
+            connection.execute(sqlalchemy.text(statement))
+
+    def reset_table(self, role: str, table_name: str, frame: pd.DataFrame, key: str):
+        """
+        Empties table_name in role, (re)creating it after frame's columns on SQLite, and drops its checkpoints.
+        """
+        if self.backend != "sqlite":
+            self.execute(role, f"TRUNCATE TABLE {table_name}")
+        else:
+            # Like the Postgres tables: created_at is filled by its default when a load doesn't provide it
+            types = {"i": "INTEGER", "u": "INTEGER", "f": "REAL"}
+            columns = [f'"{col}" {types.get(dtype.kind, "TEXT")}' for col, dtype in frame.dtypes.items() if col != "created_at"]
+            self.execute(role, f"DROP TABLE IF EXISTS {table_name}")
+            self.execute(role, f"""
+                CREATE TABLE {table_name} ({", ".join(columns)},
+                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP NOT NULL, PRIMARY KEY ("{key}"))
+            """)
+            self.execute(role, f"CREATE INDEX {table_name}_keyset ON {table_name} (created_at, \"{key}\")")
+        if role in ("staging", "warehouse"):
+            self.execute(role, f"DELETE FROM etl_checkpoint WHERE table_name = '{table_name}'")
+
+    def fill_source(self, df: pd.DataFrame, chunksize: int = 100000):
+        self.reset_table("source", "car_sales", df, "id_sales")
+        if self.backend == "postgresql":
+            copy_upsert(con=self.engines["source"], df=df.set_index("id_sales"), table_name="car_sales")
+        else:
+            df.to_sql("car_sales", self.engines["source"], if_exists="append", index=False, chunksize=chunksize)
+
+    def upsert(self, role: str, df: pd.DataFrame, table_name: str, key: str) -> int:
+        """
+        Loads df into role with the pipeline's loader (COPY upsert) on Postgres, or with an
+        INSERT ... ON CONFLICT upsert on SQLite, where COPY doesn't exist.
+        """
+        if self.backend == "postgresql":
+            loader = load_staging if role == "staging" else load_warehouse
+            loader(df, "public", table_name, key)
+            return len(df)
+
+        # Both loaders leave created_at to the table default
+        df = df.drop(columns="created_at", errors="ignore")
+        columns = ", ".join(f'"{col}"' for col in df.columns)
+        updates = ", ".join(f'"{col}" = excluded."{col}"' for col in df.columns if col != key)
+        statement = (f"INSERT INTO {table_name} ({columns}) VALUES ({', '.join('?' * len(df.columns))}) "
+                     f'ON CONFLICT ("{key}") DO UPDATE SET {updates}')
+        raw_conn = self.engines[role].raw_connection()
+        try:
+            raw_conn.cursor().executemany(statement, df.itertuples(index=False, name=None))
+            raw_conn.commit()
+        finally:
+            raw_conn.close()
+        return len(df)
+
+    @property
+    def loader(self) -> str:
+        """
+        What the load stages measure: the pipeline's loaders, or the SQLite upsert standing in for them.
+        """
+        return "copy_upsert" if self.backend == "postgresql" else "sqlite_stand_in"
+
+    def dispose(self):
+        for engine in self.engines.values():
+            engine.dispose()
+
+def bench_pipeline(n_rows: int, databases: Databases, work_dir: str, seed: int = 42, repeat: int = 1) -> list:
+    """
+    Runs every pipeline stage once on n_rows synthetic rows, each stage on the output of the one
+    before, and returns one result per stage.
+    """
+    results = []
+
+    def stage(name, func, rows_in, reset=None, loader=None):
+        result, seconds, cpu_seconds, peak = measure(func, reset, repeat)
+        if result is None:
+            raise RuntimeError(f"Stage {name} failed, see the etl log")
+        rows_out = result if isinstance(result, int) else len(result)
+        results.append({
+            "rows": n_rows,
+            "stage": name,
+            "rows_in": rows_in,
+            "rows_out": rows_out,
+            "seconds": round(seconds, 4),
+            "cpu_seconds": round(cpu_seconds, 4),
+            "rows_per_second": round(rows_in / seconds) if seconds else None,
+            "peak_mib": round(peak, 1),
+        })
+        if loader:
+            # Not comparable with the same stage timed with another loader
+            results[-1]["loader"] = loader
+        print(json.dumps(results[-1]))
+        return result
+
+    # Step 1: Synthetic source table (not measured)
+    df_source = make_source_car_sales(n_rows, seed)
+    databases.fill_source(df_source)
+    df_car_brand, df_us_state = make_car_brand(), make_us_state()
+
+    # Step 2: Staging
+    df = stage("extract_source", lambda: extract_database("car_sales", full_refresh=True), n_rows)
+    df_staging = stage("transform_staging", lambda: transform_datatype_car_sales(df, typed=False), len(df))
+    stage("load_staging", lambda: databases.upsert("staging", df_staging, "car_sales", "id_sales"), len(df_staging),
+          reset=lambda: databases.reset_table("staging", "car_sales", df_staging, "id_sales"), loader=databases.loader)
+
+    # Step 3: Warehouse
+    df = stage("extract_staging", lambda: extract_staging("car_sales"), len(df_staging))
+    quarantine_dir = os.path.join(work_dir, "quarantine")
+    df_warehouse = stage("transform_warehouse",
+                         lambda: transform_car_sales(df, df_car_brand, df_us_state, engine="fast",
+                                                     quarantine=QuarantineStore("car_sales", quarantine_dir)),
+                         len(df))
+    stage("load_warehouse", lambda: databases.upsert("warehouse", df_warehouse, "car_sales", "id_sales_nk"), len(df_warehouse),
+          reset=lambda: databases.reset_table("warehouse", "car_sales", df_warehouse, "id_sales_nk"), loader=databases.loader)
+
+    # Step 4: Modelling
+    columns = FEATURES + [TARGET, "id_sales_nk"]
+    df = stage("extract_warehouse",
+               lambda: pd.concat(extract_warehouse_incremental("car_sales", columns=columns, chunksize=50000), ignore_index=True),
+               len(df_warehouse))
+    df = df.dropna(subset=FEATURES + [TARGET])
+    df_processed = stage("preprocess", lambda: process_preprocessing(df, FEATURES, TARGET), len(df))
+
+    def train_full():
+        X_train, X_test, y_train, y_test = split_data(df_processed, FEATURES, TARGET, id_column="id_sales_nk")
+        LinearRegression().fit(X_train, y_train)
+        return len(X_train)
+
+    def train_incremental():
+        state = TrainingState(FEATURES, TARGET)
+        rows = state.update(df)
+        state.model()
+        return rows
+
+    stage("train_full", train_full, len(df_processed))
+    stage("train_incremental", train_incremental, len(df))
+    return results
+
+def compare(results: list, baseline: list, tolerance: float, min_seconds: float = 0.05) -> list:
+    """
+    Seconds of every (rows, stage) relative to the baseline run, flagged as a regression when
+    slower by more than tolerance (0.1 is 10%). A stage that took less than min_seconds is too
+    short to time reliably and is never flagged. Load stages timed with another loader (the SQLite
+    stand-in against Postgres) are listed as skipped.
+    """
+    baseline_by_stage = {(result["rows"], result["stage"]): result for result in baseline}
+    comparison = []
+    for result in results:
+        previous = baseline_by_stage.get((result["rows"], result["stage"]))
+        if not previous or not previous["seconds"]:
+            continue
+        if previous.get("loader") != result.get("loader"):
+            comparison.append({"rows": result["rows"], "stage": result["stage"], "regression": False,
+                               "skipped": f"loader {result.get('loader')} against {previous.get('loader')} in the baseline"})
+            continue
+        before = previous["seconds"]
+        ratio = result["seconds"] / before
+        comparison.append({"rows": result["rows"], "stage": result["stage"], "baseline_seconds": before,
+                           "seconds": result["seconds"], "ratio": round(ratio, 3),
+                           "regression": ratio > 1 + tolerance and result["seconds"] >= min_seconds})
+    return comparison
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Pipeline benchmark: time and memory of every stage on synthetic car_sales")
+    parser.add_argument("--rows", type=int, nargs="+", default=[100_000, 1_000_000])
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--repeat", type=int, default=3, help="timed runs per stage, the fastest is kept")
+    for role in ("source", "staging", "warehouse", "log"):
+        parser.add_argument(f"--{role}-url", help=f"scratch Postgres database for {role} (default: embedded SQLite)")
+    parser.add_argument("--output", help="write the results as JSON to this file")
+    parser.add_argument("--baseline", help="results JSON of an earlier run to compare with")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="slowdown allowed before a stage counts as a regression")
+    parser.add_argument("--min-seconds", type=float, default=0.05, help="stages faster than this are never a regression")
+    parser.add_argument("--fail-on-regression", action="store_true", help="exit with status 1 on a regression")
+    args = parser.parse_args(argv)
+
+    urls = {role: getattr(args, f"{role}_url") for role in ("source", "staging", "warehouse", "log")}
+    if any(urls.values()) and not all(urls.values()):
+        parser.error("give all of --source-url, --staging-url, --warehouse-url and --log-url, or none")
+
+    work_dir = tempfile.mkdtemp(prefix="bench_pipeline_")
+    databases = Databases(work_dir, urls if all(urls.values()) else None)
+    try:
+        results = []
+        for n_rows in args.rows:
+            results.extend(bench_pipeline(n_rows, databases, work_dir, args.seed, args.repeat))
+        flush_etl_log()
+    finally:
+        databases.dispose()
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+    report = {
+        "meta": {
+            "backend": databases.backend,
+            "seed": args.seed,
+            "repeat": args.repeat,
+            "python": platform.python_version(),
+            "pandas": pd.__version__,
+            "numpy": np.__version__,
+            "sklearn": sklearn.__version__,
+            "cpu_count": os.cpu_count(),
+            "max_rss_mib": round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1),
+            "date": time.strftime("%Y-%m-%d %H:%M:%S"),
+        },
+        "results": results,
+    }
+
+    regressions = []
+    if args.baseline:
+        with open(args.baseline) as f:
+            report["comparison"] = compare(results, json.load(f)["results"], args.tolerance, args.min_seconds)
+        regressions = [c for c in report["comparison"] if c["regression"]]
+        for c in report["comparison"]:
+            if "skipped" in c:
+                print(f"{c['rows']:>10} {c['stage']:<20} skipped, {c['skipped']}")
+                continue
+            print(f"{c['rows']:>10} {c['stage']:<20} {c['baseline_seconds']:>9.3f}s -> {c['seconds']:>9.3f}s "
+                  f"x{c['ratio']:.2f}{'  REGRESSION' if c['regression'] else ''}")
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=4)
+
+    if regressions and args.fail_on_regression:
+        raise SystemExit(1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,156 @@
+import argparse
+import http.client
+import json
+import multiprocessing
+import os
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import joblib
+import numpy as np
+from sklearn.linear_model import LinearRegression
+import pandas as pd
+from modelling.preprocessing.preprocessor import CarPricePreprocessor
+
+FEATURES = ['year', 'condition', 'odometer', 'mmr']
+
+def make_model(directory: str, seed: int = 42):
+    """
+    Fits a car price model on synthetic rows and saves it with its preprocessing, like the trainer does.
+    """
+    rng = np.random.default_rng(seed)
+    n_rows = 10000
+    X = np.column_stack([rng.integers(1990, 2016, n_rows), rng.integers(10, 50, n_rows) / 10,
+                         rng.integers(0, 300000, n_rows), rng.normal(14000, 8000, n_rows).clip(500)])
+    y = X[:, 3] * rng.normal(1, 0.1, n_rows)
+    df = pd.DataFrame(X, columns=FEATURES)
+    preprocessor = CarPricePreprocessor(FEATURES).fit(df)
+    model = LinearRegression().fit(preprocessor.transform(df), y)
+
+    model_path = os.path.join(directory, "car_price_model.pkl")
+    preprocessing_path = os.path.join(directory, "car_price_preprocessing.json")
+    joblib.dump(model, model_path)
+    preprocessor.save(preprocessing_path)
+    return model_path, preprocessing_path
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+def start_service(port: int, model_path: str, preprocessing_path: str, workers: int, max_wait_ms: float):
+    src_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    process = subprocess.Popen([sys.executable, "-m", "modelling.serving.prediction_service", "--port", str(port),
+                                "--model", model_path, "--preprocessing", preprocessing_path,
+                                "--workers", str(workers), "--max-wait-ms", str(max_wait_ms)], cwd=src_dir)
+
+    # Wait until every worker could have bound the port
+    for _ in range(200):
+        try:
+            connection = http.client.HTTPConnection("127.0.0.1", port, timeout=1)
+            connection.request("GET", "/health")
+            status = connection.getresponse().status
+            connection.close()
+            if status == 200:
+                time.sleep(0.2 * workers)
+                return process
+        except OSError:
+            time.sleep(0.05)
+    process.kill()
+    raise RuntimeError("Prediction service didn't start")
+
+def client_process(port: int, threads: int, duration: float, batch: int, results):
+    """
+    threads keep-alive connections sending requests of batch records back to back for duration seconds.
+    """
+    record = {"year": 2012, "condition": 3.5, "odometer": 45000.0, "mmr": 13500.0}
+    body = json.dumps({"records": [record] * batch}).encode()
+    latencies = []
+    lock = threading.Lock()
+    stop = time.perf_counter() + duration
+
+    def run():
+        connection = http.client.HTTPConnection("127.0.0.1", port)
+        local = []
+        while time.perf_counter() < stop:
+            started = time.perf_counter()
+            connection.request("POST", "/predict", body=body, headers={"Content-Type": "application/json"})
+            response = connection.getresponse()
+            response.read()
+            local.append(time.perf_counter() - started)
+        with lock:
+            latencies.extend(local)
+
+    workers = [threading.Thread(target=run) for _ in range(threads)]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+    results.put(latencies)
+
+def run_load(port: int, clients: int, threads: int, duration: float, batch: int) -> dict:
+    results = multiprocessing.Queue()
+    processes = [multiprocessing.Process(target=client_process, args=(port, threads, duration, batch, results))
+                 for _ in range(clients)]
+    for process in processes:
+        process.start()
+    latencies = np.concatenate([np.asarray(results.get()) for _ in processes]) * 1000
+    for process in processes:
+        process.join()
+    return {
+        "requests": len(latencies),
+        "requests_per_sec": round(len(latencies) / duration, 1),
+        "records_per_sec": round(len(latencies) * batch / duration, 1),
+        "client_p50_ms": round(float(np.percentile(latencies, 50)), 3),
+        "client_p99_ms": round(float(np.percentile(latencies, 99)), 3),
+    }
+
+def bench_serving(workers: int, max_wait_ms: float, clients: int, threads: int, duration: float, batch: int,
+                  model_path: str, preprocessing_path: str) -> dict:
+    port = free_port()
+    process = start_service(port, model_path, preprocessing_path, workers, max_wait_ms)
+    try:
+        result = {"workers": workers, "max_wait_ms": max_wait_ms, "concurrency": clients * threads, "batch": batch}
+        result.update(run_load(port, clients, threads, duration, batch))
+
+        # Server side view of one worker (the one answering this connection)
+        connection = http.client.HTTPConnection("127.0.0.1", port)
+        connection.request("GET", "/stats")
+        result["server_stats"] = json.loads(connection.getresponse().read())
+        return result
+    finally:
+        process.terminate()
+        process.wait()
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Prediction service load test: one worker vs several")
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, max(2, os.cpu_count() or 1)])
+    parser.add_argument("--max-wait-ms", type=float, nargs="+", default=[0.0, 2.0])
+    parser.add_argument("--clients", type=int, default=2, help="load generator processes")
+    parser.add_argument("--threads", type=int, default=16, help="connections per load generator process")
+    parser.add_argument("--duration", type=float, default=10.0)
+    parser.add_argument("--batch", type=int, default=1, help="records per request")
+    parser.add_argument("--model", help="model to serve (default: a model fitted on synthetic data)")
+    parser.add_argument("--preprocessing", help="preprocessing of --model")
+    parser.add_argument("--output", help="write the results as JSON to this file")
+    args = parser.parse_args(argv)
+
+    with tempfile.TemporaryDirectory() as directory:
+        model_path, preprocessing_path = (args.model, args.preprocessing) if args.model else make_model(directory)
+        results = []
+        for workers in args.workers:
+            for max_wait_ms in args.max_wait_ms:
+                result = bench_serving(workers, max_wait_ms, args.clients, args.threads, args.duration, args.batch,
+                                       model_path, preprocessing_path)
+                results.append(result)
+                print(json.dumps(result))
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=4)
+
+if __name__ == "__main__":
+    main()
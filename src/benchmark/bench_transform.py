@@ -0,0 +1,70 @@
+import argparse
+import json
+import time
+import tracemalloc
+import pandas as pd
+from benchmark.synthetic import make_car_brand, make_us_state, make_staging_car_sales
+from warehouse.transform.transform_car_sales import transform_car_sales
+
+def measure(func, *args, **kwargs):
+    """
+    Returns (result, seconds, peak MiB allocated during the call). Time and memory come from two
+    separate calls, so tracemalloc overhead doesn't inflate the timing.
+    """
+    start = time.perf_counter()
+    result = func(*args, **kwargs)
+    seconds = time.perf_counter() - start
+    del result
+
+    tracemalloc.start()
+    result = func(*args, **kwargs)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return result, seconds, peak / 2**20
+
+def bench_transform(n_rows: int, seed: int = 42) -> dict:
+    """
+    Runs both warehouse transform engines on the same synthetic frame and checks they agree.
+    """
+    df = make_staging_car_sales(n_rows, seed)
+    df_car_brand = make_car_brand()
+    df_us_state = make_us_state()
+
+    # The reference engine modifies its input, give it a fresh copy every time
+    reference, ref_seconds, ref_peak = measure(
+        lambda: transform_car_sales(df.copy(), df_car_brand, df_us_state, engine='reference'))
+    fast, fast_seconds, fast_peak = measure(
+        lambda: transform_car_sales(df, df_car_brand, df_us_state, engine='fast'))
+
+    pd.testing.assert_frame_equal(reference, fast)
+
+    return {
+        "rows": n_rows,
+        "rows_out": len(fast),
+        "reference_seconds": round(ref_seconds, 3),
+        "fast_seconds": round(fast_seconds, 3),
+        "speedup": round(ref_seconds / fast_seconds, 2),
+        # The reference figure includes the input copy it needs (the fast engine doesn't)
+        "reference_peak_mib": round(ref_peak, 1),
+        "fast_peak_mib": round(fast_peak, 1),
+    }
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Warehouse transform benchmark: reference vs fast engine")
+    parser.add_argument("--rows", type=int, nargs="+", default=[1_000_000, 10_000_000])
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--output", help="write the results as JSON to this file")
+    args = parser.parse_args(argv)
+
+    results = []
+    for n_rows in args.rows:
+        result = bench_transform(n_rows, args.seed)
+        results.append(result)
+        print(json.dumps(result))
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=4)
+
+if __name__ == "__main__":
+    main()
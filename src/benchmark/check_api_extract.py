@@ -0,0 +1,99 @@
+import argparse
+import json
+import tempfile
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qs
+from helper.dim_cache import dimension_cache
+from staging.extract.extract_api import extract_api
+
+class StandInHandler(BaseHTTPRequestHandler):
+    """
+    Serves {"data": [...]} records built from the path and query, and answers a matching If-None-Match
+    with an empty 304. Like many APIs, the ETag is the version of the dataset, the same for every
+    path and query. Every response status is recorded on the server.
+    """
+    def do_GET(self):
+        url = urlparse(self.path)
+        query = parse_qs(url.query)
+        records = [{"path": url.path, "state": state, "version": self.server.version}
+                   for state in query.get("state", ["all"])]
+        body = json.dumps({"data": records}).encode()
+        etag = f'"v{self.server.version}"'
+
+        if self.headers.get("If-None-Match") == etag:
+            self.server.statuses.append(304)
+            self.send_response(304)
+            self.send_header("ETag", etag)
+            self.end_headers()
+            return
+
+        self.server.statuses.append(200)
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.send_header("ETag", etag)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+def run_checks(base_url: str, server) -> list:
+    """
+    Extracts from the stand-in server through every kind of change and returns (name, ok, detail) per check.
+    """
+    checks = []
+
+    def extract(path, params):
+        server.statuses.clear()
+        return extract_api(f"{base_url}{path}", params, "data")
+
+    first = extract("/states", {"state": "ca"})
+    checks.append(("first extract downloads", server.statuses == [200] and first["state"].tolist() == ["ca"],
+                   f"{server.statuses}, {first['state'].tolist()}"))
+
+    df = extract("/states", {"state": "ca"})
+    checks.append(("unchanged resource is a 304 from the cache", server.statuses == [304] and df.equals(first),
+                   f"{server.statuses}"))
+
+    df = extract("/states", {"state": "tx"})
+    checks.append(("new params download their own copy", server.statuses == [200] and df["state"].tolist() == ["tx"],
+                   f"{server.statuses}, {df['state'].tolist()}"))
+
+    df = extract("/states/v2", {"state": "ca"})
+    checks.append(("new URL downloads its own copy", server.statuses == [200] and df["path"].tolist() == ["/states/v2"],
+                   f"{server.statuses}, {df['path'].tolist()}"))
+
+    df = extract("/states", {"state": "ca"})
+    checks.append(("earlier request still revalidates its copy", server.statuses == [304] and df.equals(first),
+                   f"{server.statuses}"))
+
+    server.version += 1
+    df = extract("/states", {"state": "ca"})
+    checks.append(("changed resource is downloaded again", server.statuses == [200] and df["version"].tolist() == [server.version],
+                   f"{server.statuses}, version {df['version'].tolist()}"))
+    return checks
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="API extract check against a local HTTP stand-in server (ETag / 304)")
+    parser.parse_args(argv)
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), StandInHandler)
+    server.statuses, server.version = [], 1
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    try:
+        with tempfile.TemporaryDirectory() as cache_dir:
+            dimension_cache.cache_dir = cache_dir
+            checks = run_checks(f"http://127.0.0.1:{server.server_address[1]}", server)
+    finally:
+        server.shutdown()
+        server.server_close()
+
+    for name, ok, detail in checks:
+        print(f"{name:<50} {'ok' if ok else 'FAILED'}  {detail}")
+    if not all(ok for _, ok, _ in checks):
+        raise SystemExit(1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,108 @@
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+
+SRC_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+CLI = os.path.join(os.path.dirname(SRC_DIR), "pipeline.py")
+
+# What is imported (a module, or the CLI with arguments), the budget of its import time in seconds and
+# the heavy modules it must not import: they are loaded by the functions that use them
+CHECKS = [
+    {"name": "pipeline.py --help", "argv": [CLI, "--help"], "budget": 0.15,
+     "forbidden": ["pandas", "sqlalchemy", "dotenv", "minio", "gspread", "google.auth", "requests", "sklearn"]},
+    {"name": "helper.utils", "budget": 1.0,
+     "forbidden": ["sqlalchemy", "dotenv", "minio", "gspread", "requests", "sklearn"]},
+    {"name": "staging_pipeline", "budget": 1.0,
+     "forbidden": ["sqlalchemy", "dotenv", "minio", "gspread", "google.auth", "requests", "sklearn"]},
+    {"name": "warehouse_pipeline", "budget": 1.0,
+     "forbidden": ["sqlalchemy", "dotenv", "minio", "gspread", "google.auth", "requests", "sklearn"]},
+    {"name": "profiling.profiling", "budget": 1.0,
+     "forbidden": ["sqlalchemy", "dotenv", "minio", "gspread", "google.auth", "requests", "sklearn"]},
+    {"name": "modelling.linear_regression", "budget": 3.0,
+     "forbidden": ["sqlalchemy", "dotenv", "minio", "gspread", "requests"]},
+    {"name": "modelling_pipeline", "budget": 3.0,
+     "forbidden": ["sqlalchemy", "dotenv", "minio", "gspread", "requests"]},
+    {"name": "modelling.serving.prediction_service", "budget": 1.5,
+     "forbidden": ["sqlalchemy", "dotenv", "minio", "gspread", "requests", "sklearn"]},
+]
+
+def import_times(argv: list) -> dict:
+    """
+    Runs python -X importtime on argv in an empty working directory and returns the cumulative import
+    time of every module in seconds, the total of the top-level imports, and the files the run created
+    there (importing must not create the log directory, profiling reports...).
+    """
+    with tempfile.TemporaryDirectory() as work_dir:
+        env = dict(os.environ, PYTHONPATH=SRC_DIR)
+        proc = subprocess.run([sys.executable, "-X", "importtime"] + argv, cwd=work_dir, env=env,
+                              capture_output=True, text=True)
+        if proc.returncode != 0:
+            raise RuntimeError(f"{' '.join(argv)} failed:\n{proc.stderr[-2000:]}")
+        created = sorted(os.listdir(work_dir))
+
+    modules = {}
+    total = 0.0
+    for line in proc.stderr.splitlines():
+        # import time: self [us] | cumulative | imported package
+        if not line.startswith("import time:") or "imported package" in line:
+            continue
+        _, cumulative, name = line[len("import time:"):].split("|")
+        seconds = int(cumulative) / 1e6
+        modules[name.strip()] = seconds
+        if not name[1:].startswith(" "):
+            total += seconds
+    return {"total": total, "modules": modules, "created": created}
+
+def check(spec: dict, repeat: int = 3) -> dict:
+    """
+    Best-of-repeat import time of one check, with its forbidden imports and side effects.
+    """
+    argv = spec.get("argv") or ["-c", f"import {spec['name']}"]
+    try:
+        runs = [import_times(argv) for _ in range(repeat)]
+    except RuntimeError as e:
+        return {"name": spec["name"], "seconds": None, "budget": spec["budget"], "error": str(e), "ok": False}
+    best = min(runs, key=lambda run: run["total"])
+    forbidden = sorted(module for module in spec["forbidden"] if module in best["modules"])
+    return {
+        "name": spec["name"],
+        "seconds": round(best["total"], 4),
+        "budget": spec["budget"],
+        "forbidden_imports": forbidden,
+        "created_files": best["created"],
+        "ok": best["total"] <= spec["budget"] and not forbidden and not best["created"],
+        "slowest": sorted(best["modules"].items(), key=lambda item: -item[1])[:5],
+    }
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Startup time regression check (python -X importtime)")
+    parser.add_argument("--repeat", type=int, default=3, help="runs per check, the fastest counts")
+    parser.add_argument("--output", help="write the results as JSON to this file")
+    args = parser.parse_args(argv)
+
+    results = []
+    for spec in CHECKS:
+        result = check(spec, args.repeat)
+        results.append(result)
+        if "error" in result:
+            print(f"{result['name']:<40} {'-':>8}  import failed\n{result['error']}")
+            continue
+        problems = [f"over budget ({result['budget']}s)"] if result["seconds"] > result["budget"] else []
+        if result["forbidden_imports"]:
+            problems.append(f"imports {', '.join(result['forbidden_imports'])}")
+        if result["created_files"]:
+            problems.append(f"created {', '.join(result['created_files'])}")
+        print(f"{result['name']:<40} {result['seconds']:>7.3f}s  {'ok' if result['ok'] else '; '.join(problems)}")
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=4)
+
+    if not all(result["ok"] for result in results):
+        raise SystemExit(1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,101 @@
+import argparse
+import tempfile
+import time
+from helper.dim_cache import dimension_cache
+from staging.extract.extract_spreadsheet import extract_sheet
+
+HEADER = ['brand_car_id', 'brand_name']
+ROWS = [['1', 'kia'], ['2', 'nissan'], ['3', 'ford']]
+
+class FakeWorksheet:
+    def __init__(self, client):
+        self.client = client
+
+    def get_all_values(self):
+        self.client.requests.append("values")
+        return [list(row) for row in self.client.values]
+
+class FakeSpreadsheet:
+    def __init__(self, client):
+        self.client = client
+
+    def worksheet(self, name):
+        return FakeWorksheet(self.client)
+
+class FakeClient:
+    """
+    Stands in for an authorized gspread client: one spreadsheet whose values and revision the
+    checks edit, and the list of requests the extract made.
+    """
+    def __init__(self, values: list):
+        self.values = values
+        self.revision = 1
+        self.requests = []
+
+    def edit(self, values: list):
+        self.values = values
+        self.revision += 1
+
+    def get_file_drive_metadata(self, key_file):
+        self.requests.append("metadata")
+        return {"modifiedTime": f"2025-01-01T00:00:{self.revision:02d}Z"}
+
+    def open_by_key(self, key_file):
+        return FakeSpreadsheet(self)
+
+def extract(client):
+    client.requests = []
+    return extract_sheet("key", "car_brand", client=client)
+
+def run_checks() -> list:
+    """
+    Extracts the fake sheet through every kind of change and returns (name, ok, detail) per check.
+    """
+    checks = []
+    client = FakeClient([HEADER] + ROWS)
+    first = extract(client)
+    checks.append(("first extract downloads the sheet", client.requests == ["metadata", "values"] and len(first) == 3,
+                   f"{client.requests}, {len(first)} rows"))
+
+    df = extract(client)
+    checks.append(("unchanged sheet costs one metadata request", client.requests == ["metadata"] and df.equals(first),
+                   f"{client.requests}"))
+
+    # created_at has a one second resolution, wait so new rows get another one
+    time.sleep(1.1)
+    client.edit([HEADER] + ROWS + [['4', 'bmw']])
+    df = extract(client)
+    kept = df['created_at'].iloc[:3].tolist() == first['created_at'].tolist()
+    new = df['created_at'].iloc[3] != first['created_at'].iloc[0]
+    checks.append(("append keeps the created_at of the cached rows", len(df) == 4 and kept and new,
+                   f"{len(df)} rows, cached created_at kept: {kept}, new row stamped: {new}"))
+    appended = df
+
+    time.sleep(1.1)
+    client.edit([HEADER, ['1', 'KIA']] + ROWS[1:] + [['4', 'bmw'], ['5', 'audi']])
+    df = extract(client)
+    restamped = (df['created_at'] != appended['created_at'].iloc[0]).all()
+    checks.append(("edit with an append rebuilds the frame", len(df) == 5 and df['brand_name'].iloc[0] == 'KIA' and restamped,
+                   f"{len(df)} rows, first brand {df['brand_name'].iloc[0]!r}, every row restamped: {restamped}"))
+
+    time.sleep(1.1)
+    client.edit([HEADER, ['1', 'KIA'], ['2', 'nissan']])
+    df = extract(client)
+    checks.append(("deleted rows rebuild the frame", len(df) == 2, f"{len(df)} rows"))
+    return checks
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Spreadsheet extract check against a fake Google Sheets client")
+    parser.parse_args(argv)
+
+    with tempfile.TemporaryDirectory() as cache_dir:
+        dimension_cache.cache_dir = cache_dir
+        checks = run_checks()
+
+    for name, ok, detail in checks:
+        print(f"{name:<50} {'ok' if ok else 'FAILED'}  {detail}")
+    if not all(ok for _, ok, _ in checks):
+        raise SystemExit(1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,86 @@
+import numpy as np
+import pandas as pd
+
+# Value pools following the staging tables, and the dirty values mixed into them at realistic rates
+BRANDS = ['kia', 'nissan', 'chevrolet', 'ford', 'bmw', 'toyota', 'honda', 'hyundai', 'dodge', 'audi']
+BAD_BRANDS = ['unknown']
+STATES = ['ca', 'fl', 'pa', 'tx', 'ga', 'nj', 'il', 'nc', 'oh', 'tn', 'mo', 'mi', 'va', 'md', 'wi', 'qc']
+BAD_STATES = ['3vwd17aj5fm219943', '3vwd17aj5fm297123']
+COLORS = ['black', 'white', 'Gray', 'gray', 'silver', 'blue', 'red', 'off-white', 'WHITE']
+BAD_COLORS = ['—', '', '16633', '6388', None]
+INTERIORS = ['black', 'gray', 'Gray', 'beige', 'tan', 'off-white', 'green']
+BAD_INTERIORS = ['—', '', None]
+TRANSMISSIONS = ['automatic', 'automatic', 'automatic', 'manual']
+BAD_TRANSMISSIONS = ['']
+
+# Share of rows holding a dirty value, per column
+DIRTY_RATES = {'brand_car': 0.005, 'state': 0.001, 'color': 0.01, 'interior': 0.01, 'transmission': 0.03}
+
+def make_car_brand() -> pd.DataFrame:
+    """
+    Staging car_brand: one id per brand name.
+    """
+    return pd.DataFrame({
+        'brand_car_id': np.arange(1, len(BRANDS) + 1),
+        'brand_name': BRANDS,
+        'created_at': pd.Timestamp('2025-01-01'),
+    })
+
+def make_us_state() -> pd.DataFrame:
+    """
+    Staging us_state: one id per state code (the bad state codes have none).
+    """
+    return pd.DataFrame({
+        'id_state': np.arange(1, len(STATES) + 1),
+        'code': STATES,
+        'name': [code.upper() for code in STATES],
+        'created_at': pd.Timestamp('2025-01-01'),
+    })
+
+def _numeric_strings(values: np.ndarray, missing: np.ndarray) -> np.ndarray:
+    # Staging keeps numbers as varchar (str(float)), a missing value becomes 'nan'
+    strings = values.astype(str).astype(object)
+    strings[missing] = 'nan'
+    return strings
+
+def make_staging_car_sales(n_rows: int, seed: int = 42) -> pd.DataFrame:
+    """
+    Staging car_sales with n_rows rows, deterministic for a given seed.
+    Numbers are varchar like in staging, with the usual dirty values at DIRTY_RATES: '—', empty
+    strings, numeric colors and VIN-like state codes, next to mixed case colors.
+    """
+    rng = np.random.default_rng(seed)
+
+    def pick(pool, bad_pool, rate):
+        # Clean values share 1 - rate evenly, dirty values share rate
+        values = np.array(pool + bad_pool, dtype=object)
+        weights = [(1 - rate) / len(pool)] * len(pool) + [rate / len(bad_pool)] * len(bad_pool)
+        return values[rng.choice(len(values), size=n_rows, p=weights)]
+
+    mmr = rng.normal(14000, 8000, n_rows).clip(500).round(-1)
+
+    return pd.DataFrame({
+        'id_sales': np.arange(1, n_rows + 1),
+        'year': rng.integers(1990, 2016, n_rows).astype(str).astype(object),
+        'brand_car': pick(BRANDS, BAD_BRANDS, DIRTY_RATES['brand_car']),
+        'transmission': pick(TRANSMISSIONS, BAD_TRANSMISSIONS, DIRTY_RATES['transmission']),
+        'state': pick(STATES, BAD_STATES, DIRTY_RATES['state']),
+        'condition': _numeric_strings(rng.integers(10, 50, n_rows) / 10, rng.random(n_rows) < 0.02),
+        'odometer': _numeric_strings(rng.integers(0, 300000, n_rows).astype(float), rng.random(n_rows) < 0.01),
+        'color': pick(COLORS, BAD_COLORS, DIRTY_RATES['color']),
+        'interior': pick(INTERIORS, BAD_INTERIORS, DIRTY_RATES['interior']),
+        'mmr': _numeric_strings(mmr, rng.random(n_rows) < 0.005),
+        'sellingprice': _numeric_strings((mmr * rng.normal(1, 0.1, n_rows)).round(-2).clip(100), np.zeros(n_rows, dtype=bool)),
+        'created_at': pd.Timestamp('2025-01-01') + pd.to_timedelta(np.sort(rng.integers(0, 86400 * 30, n_rows)), unit='s'),
+    })
+
+def make_source_car_sales(n_rows: int, seed: int = 42) -> pd.DataFrame:
+    """
+    Source car_sales with n_rows rows: the same rows as make_staging_car_sales, with the numeric
+    columns still numeric (NaN where staging holds 'nan'), as they come out of the source database.
+    """
+    df = make_staging_car_sales(n_rows, seed)
+    for col in ['condition', 'odometer', 'mmr', 'sellingprice']:
+        df[col] = df[col].astype(np.float64)
+    df['year'] = df['year'].astype(np.int64)
+    return df
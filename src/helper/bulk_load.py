@@ -0,0 +1,128 @@
+import csv
+import io
+import os
+import uuid
+import pandas as pd
+from helper.checkpoint import write_checkpoint
+
+# Marker written (unquoted) for missing values. Text values are always quoted, so neither an empty
+# string nor the string "\N" is read as NULL
+COPY_NULL = r"\N"
+
+def quote_ident(name: str) -> str:
+    return '"' + str(name).replace('"', '""') + '"'
+
+def _write_csv_batch(batch: pd.DataFrame) -> io.StringIO:
+    """
+    Serializes one batch (key index included) to an in-memory CSV for COPY FROM STDIN.
+    Floats use 17 significant digits, so whole numbers are written without a
+    trailing .0 (they load into int columns) and every value round-trips exactly.
+    Every non-null value but ints is quoted, missing values are an unquoted COPY_NULL.
+    """
+    # pandas quotes na_rep like any string: write a placeholder, then swap its quoted form for COPY_NULL.
+    # Each missing value writes it once, more occurrences mean a value contains it: draw another one
+    missing = int(batch.isna().to_numpy().sum())
+    missing += sum(int(batch.index.get_level_values(level).isna().sum()) for level in range(batch.index.nlevels))
+    while True:
+        placeholder = f"null-{uuid.uuid4().hex}"
+        text = batch.to_csv(header=False, index=True, na_rep=placeholder, float_format="%.17g", quoting=csv.QUOTE_NONNUMERIC)
+        if text.count(placeholder) == missing:
+            return io.StringIO(text.replace(f'"{placeholder}"', COPY_NULL))
+
+def copy_upsert(con, df: pd.DataFrame, table_name: str, schema: str = "public", batch_size: int = None, checkpoint: dict = None) -> dict:
+    """
+    Upserts df into schema.table_name using the index of df as the conflict key, like pangres.upsert.
+
+    Rows are streamed with COPY FROM STDIN in batches of batch_size into a temporary table
+    (temporary tables skip the WAL), then merged into the target with a single
+    INSERT ... ON CONFLICT DO UPDATE. Everything runs in one transaction, together with the
+    etl_checkpoint row when checkpoint is given.
+
+    Returns the number of inserted and updated rows.
+    """
+    if batch_size is None:
+        batch_size = int(os.getenv('LOAD_BATCH_SIZE', 50000))
+
+    # ON CONFLICT can't touch the same row twice in one statement, keep the last occurrence
+    df = df[~df.index.duplicated(keep="last")]
+
+    key_cols = [name for name in df.index.names]
+    data_cols = [str(col) for col in df.columns]
+    all_cols = ", ".join(quote_ident(col) for col in key_cols + data_cols)
+    key_list = ", ".join(quote_ident(col) for col in key_cols)
+    target = f"{quote_ident(schema)}.{quote_ident(table_name)}"
+    tmp_table = quote_ident(f"tmp_{table_name}_{uuid.uuid4().hex[:8]}")
+
+    if data_cols:
+        updates = ", ".join(f"{quote_ident(col)} = EXCLUDED.{quote_ident(col)}" for col in data_cols)
+        on_conflict = f"DO UPDATE SET {updates}"
+    else:
+        on_conflict = "DO NOTHING"
+
+    merge_query = f"""
+        WITH merged AS (
+            INSERT INTO {target} ({all_cols})
+            SELECT {all_cols} FROM {tmp_table}
+            ON CONFLICT ({key_list}) {on_conflict}
+            RETURNING (xmax = 0) AS inserted
+        )
+        SELECT
+            COUNT(*) FILTER (WHERE inserted) AS inserted,
+            COUNT(*) FILTER (WHERE NOT inserted) AS updated
+        FROM merged
+    """
+
+    raw_conn = con.raw_connection()
+    try:
+        with raw_conn.cursor() as cursor:
+            # Same columns and defaults as the target, dropped when the transaction ends
+            cursor.execute(f"CREATE TEMP TABLE {tmp_table} (LIKE {target} INCLUDING DEFAULTS) ON COMMIT DROP")
+
+            # Stream the frame batch by batch, only one batch is serialized at a time
+            copy_query = f"COPY {tmp_table} ({all_cols}) FROM STDIN WITH (FORMAT csv, NULL '{COPY_NULL}')"
+            for start in range(0, len(df), batch_size):
+                cursor.copy_expert(copy_query, _write_csv_batch(df.iloc[start:start + batch_size]))
+
+            # Merge everything into the target at once
+            cursor.execute(merge_query)
+            inserted, updated = cursor.fetchone()
+
+            # The watermark moves only if the rows it describes are committed
+            if checkpoint is not None:
+                write_checkpoint(cursor, checkpoint)
+
+        raw_conn.commit()
+    except Exception:
+        raw_conn.rollback()
+        raise
+    finally:
+        raw_conn.close()
+
+    return {"inserted": int(inserted), "updated": int(updated)}
+
+def upsert_dataframe(con, df: pd.DataFrame, table_name: str, schema: str = "public", checkpoint: dict = None):
+    """
+    Upserts df with the loader picked by LOAD_METHOD: 'copy' (default) or 'pangres'.
+    Returns the inserted/updated counts ('pangres' doesn't report them and returns an empty dict).
+    With 'pangres' the checkpoint is written in a second transaction right after the upsert.
+    """
+    if os.getenv('LOAD_METHOD', 'copy').lower() == 'pangres':
+        from pangres import upsert
+
+        upsert(con=con,
+               df=df,
+               table_name=table_name,
+               schema=schema,
+               if_row_exists="update")
+
+        if checkpoint is not None:
+            raw_conn = con.raw_connection()
+            try:
+                with raw_conn.cursor() as cursor:
+                    write_checkpoint(cursor, checkpoint)
+                raw_conn.commit()
+            finally:
+                raw_conn.close()
+        return {}
+
+    return copy_upsert(con=con, df=df, table_name=table_name, schema=schema, checkpoint=checkpoint)
@@ -0,0 +1,90 @@
+import threading
+from helper.utils import get_db_connection
+
+# Checkpoints live in the database being loaded (etl_checkpoint in staging_data / warehouse_data init.sql),
+# so they are written in the same transaction as the rows they describe.
+CHECKPOINT_UPSERT = """
+    INSERT INTO etl_checkpoint (step, component, table_name, max_created_at, max_id, updated_at)
+    VALUES (%(step)s, %(component)s, %(table_name)s, %(max_created_at)s, %(max_id)s, now())
+    ON CONFLICT (step, component, table_name) DO UPDATE SET
+        max_created_at = EXCLUDED.max_created_at,
+        max_id = EXCLUDED.max_id,
+        updated_at = EXCLUDED.updated_at
+"""
+
+# In-process cache, a run reads each checkpoint from the database at most once
+_checkpoints = {}
+_checkpoints_lock = threading.Lock()
+
+def make_checkpoint(step: str, component: str, table_name: str, cursor: dict, key_columns: list) -> dict:
+    """
+    Builds the checkpoint of a load from the keyset cursor (created_at column, id column) of the last loaded row.
+    """
+    created_at_col, id_col = key_columns
+    return {
+        "step": step,
+        "component": component,
+        "table_name": table_name,
+        "max_created_at": cursor[created_at_col],
+        "max_id": cursor[id_col],
+    }
+
+def checkpoint_cursor(checkpoint: dict, key_columns: list):
+    """
+    Turns a checkpoint back into the keyset cursor to resume extraction from (None when there is no checkpoint).
+    """
+    if checkpoint is None:
+        return None
+    created_at_col, id_col = key_columns
+    return {created_at_col: checkpoint["max_created_at"], id_col: checkpoint["max_id"]}
+
+def read_checkpoint(db_type: str, step: str, component: str, table_name: str):
+    """
+    Returns the checkpoint of (step, component, table_name) stored in db_type, or None before the first load.
+    A primary key lookup, served from the in-process cache after the first read.
+    """
+    import sqlalchemy
+
+    key = (db_type, step, component, table_name)
+    if key in _checkpoints:
+        return _checkpoints[key]
+
+    conn = get_db_connection(db_type)
+    query = sqlalchemy.text("""
+        SELECT step, component, table_name, max_created_at, max_id
+        FROM etl_checkpoint
+        WHERE step = :step AND component = :component AND table_name = :table_name
+    """)
+    with conn.connect() as connection:
+        row = connection.execute(query, {"step": step, "component": component, "table_name": table_name}).mappings().first()
+
+    checkpoint = None
+    if row is not None:
+        checkpoint = dict(row)
+        if checkpoint["max_created_at"] is not None:
+            checkpoint["max_created_at"] = checkpoint["max_created_at"].isoformat()
+
+    with _checkpoints_lock:
+        _checkpoints[key] = checkpoint
+    return checkpoint
+
+def write_checkpoint(cursor, checkpoint: dict):
+    """
+    Upserts checkpoint with an open DB-API cursor, inside the caller's transaction.
+    """
+    cursor.execute(CHECKPOINT_UPSERT, checkpoint)
+
+def remember_checkpoint(db_type: str, checkpoint: dict):
+    """
+    Updates the in-process cache once the transaction that wrote checkpoint has committed.
+    """
+    key = (db_type, checkpoint["step"], checkpoint["component"], checkpoint["table_name"])
+    with _checkpoints_lock:
+        _checkpoints[key] = dict(checkpoint)
+
+def clear_checkpoint_cache():
+    """
+    Forgets the cached checkpoints, the next reads go to the database again.
+    """
+    with _checkpoints_lock:
+        _checkpoints.clear()
@@ -0,0 +1,268 @@
+import multiprocessing
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor, wait, FIRST_COMPLETED
+from helper.metrics import StageMetrics
+from helper.profiler import StackSampler, profile_dir, write_profile
+from helper.run_store import current_run
+from helper.utils import etl_log, flush_etl_log
+
+class Task:
+    """
+    One node of a pipeline graph.
+
+    func is called with kwargs plus, for every (parameter, task) pair in inputs, the result of
+    that upstream task. after lists extra upstream tasks that must finish first without passing
+    their result. timeout (seconds) overrides the run-wide default.
+    """
+    def __init__(self, name: str, func, inputs: dict = None, after: list = None, kwargs: dict = None, timeout: float = None):
+        self.name = name
+        self.func = func
+        self.inputs = inputs or {}
+        self.after = list(after or [])
+        self.kwargs = kwargs or {}
+        self.timeout = timeout
+
+    @property
+    def deps(self) -> list:
+        return list(dict.fromkeys(list(self.inputs.values()) + self.after))
+
+class DagError(Exception):
+    def __init__(self, message: str, result):
+        super().__init__(message)
+        self.result = result
+
+class DagResult:
+    """
+    Outcome of run_dag: results, status and timing of every task.
+    """
+    def __init__(self, tasks: dict):
+        self.tasks = tasks
+        self.results = {}
+        self.status = {}
+        self.errors = {}
+        # Tasks whose result was loaded from the checkpointed run instead of being run
+        self.resumed = []
+        self.started = {}
+        self.finished = {}
+        self.wall_time = 0.0
+
+    def duration(self, name: str) -> float:
+        if name not in self.started or name not in self.finished:
+            return 0.0
+        return self.finished[name] - self.started[name]
+
+    @property
+    def failed(self) -> list:
+        return [name for name, status in self.status.items() if status != "success"]
+
+    def critical_path(self) -> list:
+        """
+        Returns the chain of dependent tasks with the longest total duration, as (task, seconds) pairs.
+        """
+        longest = {}
+        previous = {}
+        for name in _topological_order(self.tasks):
+            best_dep = max(self.tasks[name].deps, key=lambda dep: longest[dep], default=None)
+            longest[name] = self.duration(name) + (longest[best_dep] if best_dep else 0.0)
+            previous[name] = best_dep
+
+        path = []
+        name = max(longest, key=longest.get, default=None)
+        while name is not None:
+            path.append((name, self.duration(name)))
+            name = previous[name]
+        return list(reversed(path))
+
+    def report(self) -> str:
+        """
+        Human readable summary: status and duration of every task, then the critical path.
+        """
+        lines = [f"{'task':<32} {'status':<10} {'seconds':>9}"]
+        for name in _topological_order(self.tasks):
+            status = "resumed" if name in self.resumed else self.status.get(name, 'pending')
+            lines.append(f"{name:<32} {status:<10} {self.duration(name):>9.2f}")
+
+        path = self.critical_path()
+        busy = sum(self.duration(name) for name in self.tasks)
+        lines.append("")
+        lines.append(f"wall time {self.wall_time:.2f}s, task time {busy:.2f}s, "
+                     f"critical path {sum(seconds for _, seconds in path):.2f}s")
+        lines.append("critical path: " + " -> ".join(f"{name} ({seconds:.2f}s)" for name, seconds in path))
+        return "\n".join(lines)
+
+def _topological_order(tasks: dict) -> list:
+    order = []
+    state = {}
+
+    def visit(name):
+        if state.get(name) == "done":
+            return
+        if state.get(name) == "visiting":
+            raise ValueError(f"Cycle in pipeline graph at task {name}")
+        state[name] = "visiting"
+        for dep in tasks[name].deps:
+            if dep not in tasks:
+                raise ValueError(f"Task {name} depends on unknown task {dep}")
+            visit(dep)
+        state[name] = "done"
+        order.append(name)
+
+    for name in tasks:
+        visit(name)
+    return order
+
+def _call(func, kwargs: dict, stage: StageMetrics = None, profile: tuple = None):
+    # Runs in the worker, so the timestamps cover execution only (wall clock, comparable across processes)
+    # and the stage is measured where it runs; it comes back with the result and is logged by the caller.
+    # With profile (directory, task name), the task is sampled and its profile written by the worker.
+    # A process pool worker exits with os._exit, without atexit: the events the task logged are written
+    # before its result is returned.
+    started = time.time()
+    if stage is not None:
+        stage.start()
+    sampler = StackSampler(profile[1]).start() if profile else None
+    try:
+        result = func(**kwargs)
+    finally:
+        if sampler is not None:
+            sampler.stop()
+        if stage is not None:
+            stage.stop()
+        if sampler is not None:
+            write_profile(sampler, *profile)
+        if multiprocessing.parent_process() is not None:
+            flush_etl_log()
+    return result, started, time.time(), stage
+
+def _log_unfinished(step: str, task: Task, status: str, seconds: float, error: Exception):
+    # The measurements of a task that raised stay in its worker, only the time since submission is known
+    stage = StageMetrics(step, task.name, task.kwargs.get("table_name"))
+    stage.wall_seconds = round(seconds, 4)
+    etl_log(stage.log_msg(status, error))
+
+def run_dag(tasks: list, max_workers: int = None, executor: str = None, default_timeout: float = None, step: str = None) -> DagResult:
+    """
+    Runs tasks as soon as all their upstream tasks succeeded, up to max_workers at a time,
+    on a thread pool or, with executor='process', a process pool (functions, arguments and
+    results must then be picklable).
+
+    A task that fails or exceeds its timeout marks every downstream task as skipped, the
+    independent branches still run. A timed out task can't be interrupted, it is abandoned.
+    Tasks without a timeout of their own get default_timeout (PIPELINE_TASK_TIMEOUT seconds, none by default).
+    Raises DagError (carrying the DagResult) when any task didn't succeed.
+
+    With step, every task logs an etl_log event (component: the task name) with its performance
+    metrics, see helper.metrics. In the profiling mode (PIPELINE_PROFILE_DIR), every task is
+    sampled and gets a flame graph, collapsed stacks and a hot-function summary in <dir>/<step>/.
+
+    In a checkpointed run (PIPELINE_RUN_ID, see helper.run_store), every result is saved under
+    <run>/<step>/, and a task whose saved result is valid and whose upstream tasks were all
+    resumed isn't run again: its result is loaded. A resumed run restarts from the failed tasks.
+    """
+    if max_workers is None:
+        max_workers = int(os.getenv('PIPELINE_WORKERS', 4))
+    if executor is None:
+        executor = os.getenv('PIPELINE_EXECUTOR', 'thread')
+    if default_timeout is None and os.getenv('PIPELINE_TASK_TIMEOUT'):
+        default_timeout = float(os.getenv('PIPELINE_TASK_TIMEOUT'))
+
+    tasks = {task.name: task for task in tasks}
+    order = _topological_order(tasks)
+    profile_root = profile_dir()
+    run = current_run()
+    run_step = step or "dag"
+    result = DagResult(tasks)
+
+    # Resume from the checkpointed run: reuse a result only when everything upstream was reused too
+    if run is not None:
+        for name in order:
+            if all(dep in result.resumed for dep in tasks[name].deps) and run.is_valid(run_step, name):
+                try:
+                    result.results[name] = run.load(run_step, name)
+                except Exception as e:
+                    print(f"Can't load the result of {run_step}/{name}, running it again. Cause: {str(e)}")
+                    continue
+                result.status[name] = "success"
+                result.resumed.append(name)
+                result.started[name] = result.finished[name] = time.time()
+    pool_class = ProcessPoolExecutor if executor == "process" else ThreadPoolExecutor
+
+    pool = pool_class(max_workers=max_workers)
+    run_started = time.time()
+    running = {}
+    try:
+        while True:
+            # Skip tasks below a failure, submit the ones whose inputs are ready
+            for name in order:
+                if name in result.status or name in running.values():
+                    continue
+                deps = tasks[name].deps
+                if any(result.status.get(dep) not in (None, "success") for dep in deps):
+                    result.status[name] = "skipped"
+                    if run is not None:
+                        run.mark(run_step, name, "skipped")
+                elif all(result.status.get(dep) == "success" for dep in deps) and len(running) < max_workers:
+                    task = tasks[name]
+                    kwargs = dict(task.kwargs)
+                    kwargs.update({param: result.results[dep] for param, dep in task.inputs.items()})
+                    stage = StageMetrics(step, name, task.kwargs.get("table_name")) if step else None
+                    profile = (os.path.join(profile_root, step or "dag"), name) if profile_root else None
+                    future = pool.submit(_call, task.func, kwargs, stage, profile)
+                    running[future] = name
+                    result.started[name] = time.time()
+
+            if not running:
+                break
+
+            # Wake up on the first completion or the nearest deadline
+            deadlines = {}
+            for future, name in running.items():
+                timeout = tasks[name].timeout or default_timeout
+                if timeout:
+                    deadlines[future] = result.started[name] + timeout
+            wait_for = max(0.0, min(deadlines.values()) - time.time()) if deadlines else None
+            done, _ = wait(list(running), timeout=wait_for, return_when=FIRST_COMPLETED)
+
+            for future in done:
+                name = running.pop(future)
+                try:
+                    value, started, finished, stage = future.result()
+                    result.results[name] = value
+                    result.started[name] = started
+                    result.finished[name] = finished
+                    result.status[name] = "success"
+                    if run is not None:
+                        run.save(run_step, name, value)
+                    if stage is not None:
+                        stage.observe([result.results[dep] for dep in tasks[name].inputs.values()], value)
+                        etl_log(stage.log_msg("success"))
+                except Exception as e:
+                    result.finished[name] = time.time()
+                    result.errors[name] = e
+                    result.status[name] = "failed"
+                    if run is not None:
+                        run.mark(run_step, name, "failed", e)
+                    if step:
+                        _log_unfinished(step, tasks[name], "failed", result.duration(name), e)
+
+            now = time.time()
+            for future, deadline in deadlines.items():
+                if future in running and now >= deadline:
+                    name = running.pop(future)
+                    future.cancel()
+                    result.finished[name] = now
+                    result.errors[name] = TimeoutError(f"Task {name} exceeded its timeout")
+                    result.status[name] = "timeout"
+                    if run is not None:
+                        run.mark(run_step, name, "timeout", result.errors[name])
+                    if step:
+                        _log_unfinished(step, tasks[name], "timeout", result.duration(name), result.errors[name])
+    finally:
+        # Don't wait for abandoned (timed out) tasks
+        pool.shutdown(wait=not result.failed, cancel_futures=True)
+        result.wall_time = time.time() - run_started
+
+    if result.failed:
+        raise DagError(f"Pipeline tasks did not succeed: {', '.join(result.failed)}", result)
+    return result
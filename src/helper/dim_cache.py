@@ -0,0 +1,159 @@
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+import pandas as pd
+
+class DimensionCache:
+    """
+    Local cache of small, rarely changing dimension tables (us_state, car_brand).
+
+    Each dimension is kept as a Parquet file plus a JSON metadata file holding the content hash
+    and the validator it was fetched with (row count and max(created_at), an ETag, a sheet revision...).
+    get() serves the cached frame when the caller's cheap validator still matches, and only
+    calls fetch() otherwise. derived() memoizes structures built from a dimension (lookup
+    indexes) per content version, so a cache hit skips rebuilding them too.
+    A cache that can't be read or written never fails the pipeline, it just fetches.
+    """
+    def __init__(self, cache_dir: str = None, max_age: float = None):
+        self.cache_dir = cache_dir or os.getenv('DIM_CACHE_DIR', os.path.join('cache', 'dimensions'))
+        # Safety net for sources whose validator can miss an in-place update
+        self.max_age = max_age if max_age is not None else float(os.getenv('DIM_CACHE_MAX_AGE', 86400))
+        self._frames = {}
+        self._derived = {}
+        self._lock = threading.Lock()
+
+    def _paths(self, name: str):
+        return os.path.join(self.cache_dir, f"{name}.parquet"), os.path.join(self.cache_dir, f"{name}.json")
+
+    def read_meta(self, name: str):
+        """
+        Returns the metadata of the cached dimension, or None when it isn't cached.
+        """
+        _, meta_path = self._paths(name)
+        try:
+            with open(meta_path) as f:
+                return json.load(f)
+        except (FileNotFoundError, ValueError):
+            return None
+
+    def load(self, name: str):
+        """
+        Returns the cached frame of name (None when missing or corrupted).
+        """
+        meta = self.read_meta(name)
+        if meta is None:
+            return None
+
+        # Already deserialized in this process
+        cached_hash, cached = self._frames.get(name, (None, None))
+        if cached is not None and cached_hash == meta['content_hash']:
+            return cached
+
+        data_path, _ = self._paths(name)
+        try:
+            df = pd.read_parquet(data_path)
+        except Exception as e:
+            logging.error(f"Can't read cached dimension {name}. Cause: {str(e)}")
+            return None
+        if content_hash(df) != meta['content_hash']:
+            logging.error(f"Cached dimension {name} doesn't match its content hash, ignoring it")
+            return None
+
+        with self._lock:
+            self._frames[name] = (meta['content_hash'], df)
+        return df
+
+    def store(self, name: str, df: pd.DataFrame, validator: dict) -> pd.DataFrame:
+        """
+        Saves df with the validator it was fetched with and returns it.
+        """
+        meta = {
+            "name": name,
+            "content_hash": content_hash(df),
+            "validator": validator,
+            "rows": len(df),
+            "stored_at": time.time(),
+        }
+        data_path, meta_path = self._paths(name)
+        try:
+            os.makedirs(self.cache_dir, exist_ok=True)
+
+            # Write to temporary files first, readers never see half a file
+            df.to_parquet(f"{data_path}.tmp", index=False)
+            with open(f"{meta_path}.tmp", "w") as f:
+                json.dump(meta, f, indent=4, default=str)
+            os.replace(f"{data_path}.tmp", data_path)
+            os.replace(f"{meta_path}.tmp", meta_path)
+        except Exception as e:
+            logging.error(f"Can't cache dimension {name}. Cause: {str(e)}")
+
+        with self._lock:
+            self._frames[name] = (meta['content_hash'], df)
+        return df
+
+    def age(self, name: str) -> float:
+        """
+        Seconds since name was cached, infinite when it isn't cached.
+        """
+        meta = self.read_meta(name)
+        if meta is None:
+            return float('inf')
+        return time.time() - meta.get('stored_at', 0)
+
+    def is_fresh(self, name: str, validator: dict) -> bool:
+        """
+        True when name is cached with the same validator and is younger than max_age.
+        """
+        meta = self.read_meta(name)
+        if meta is None or validator is None:
+            return False
+        same_version = json.loads(json.dumps(validator, default=str)) == meta.get('validator')
+        return same_version and self.age(name) < self.max_age
+
+    def get(self, name: str, validator: dict, fetch) -> pd.DataFrame:
+        """
+        Returns the cached frame when validator still matches, otherwise fetch() and cache its result.
+        """
+        if self.is_fresh(name, validator):
+            df = self.load(name)
+            if df is not None:
+                return df
+
+        df = fetch()
+
+        # A failed or empty fetch is never cached
+        if df is None or df.empty:
+            return df
+        return self.store(name, df, validator)
+
+    def derived(self, name: str, tag: str, build):
+        """
+        Returns build(df) for the current version of dimension name, built once per content hash.
+        """
+        content, df = self._frames.get(name, (None, None))
+        if df is None:
+            df = self.load(name)
+            content, _ = self._frames.get(name, (None, None))
+        if df is None:
+            return None
+
+        key = (name, tag, content)
+        if key not in self._derived:
+            value = build(df)
+            with self._lock:
+                self._derived[key] = value
+        return self._derived[key]
+
+def content_hash(df: pd.DataFrame) -> str:
+    """
+    Hash of the columns and values of df (not the index).
+    """
+    digest = hashlib.sha256(json.dumps([str(col) for col in df.columns]).encode())
+    digest.update(pd.util.hash_pandas_object(df, index=False).to_numpy().tobytes())
+    return digest.hexdigest()
+
+# Shared by every extractor of the process
+dimension_cache = DimensionCache()
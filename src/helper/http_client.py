@@ -0,0 +1,96 @@
+import hashlib
+import json
+import os
+import threading
+import pandas as pd
+
+# requests and urllib3 are imported with the first session, the pipelines that don't call an API never load them
+
+# One session per process: connections (and TLS handshakes) are reused across requests
+_session = None
+_session_lock = threading.Lock()
+
+def _retry_settings() -> "Retry":
+    """
+    Retry policy from the environment: transient errors and throttling are retried with exponential backoff.
+    """
+    from urllib3.util.retry import Retry
+
+    return Retry(
+        total=int(os.getenv('HTTP_RETRIES', 3)),
+        backoff_factor=float(os.getenv('HTTP_BACKOFF', 0.5)),
+        status_forcelist=(429, 500, 502, 503, 504),
+        allowed_methods=("GET", "HEAD"),
+        respect_retry_after_header=True,
+        raise_on_status=False,
+    )
+
+def get_http_session() -> "requests.Session":
+    """
+    Returns the shared HTTP session, created on first use.
+    """
+    global _session
+    if _session is None:
+        with _session_lock:
+            if _session is None:
+                import requests
+                from requests.adapters import HTTPAdapter
+
+                session = requests.Session()
+                adapter = HTTPAdapter(max_retries=_retry_settings())
+                session.mount("http://", adapter)
+                session.mount("https://", adapter)
+                _session = session
+    return _session
+
+def set_http_session(session: "requests.Session"):
+    """
+    Replaces the shared session (a preconfigured or test session), None to go back to the default one.
+    """
+    global _session
+    with _session_lock:
+        _session = session
+
+def conditional_get(url: str, params: dict = None, validator: dict = None, timeout: float = None) -> "requests.Response":
+    """
+    GET url through the shared session. With the validator of a cached copy (its ETag / Last-Modified),
+    the request is conditional and an unchanged resource comes back as an empty 304.
+    Raises requests.HTTPError on any other error status.
+    """
+    headers = {}
+    if validator:
+        if validator.get("ETag"):
+            headers["If-None-Match"] = validator["ETag"]
+        if validator.get("Last-Modified"):
+            headers["If-Modified-Since"] = validator["Last-Modified"]
+
+    resp = get_http_session().get(url, params=params or None, headers=headers,
+                                  timeout=timeout or float(os.getenv('HTTP_TIMEOUT', 30)))
+    resp.raise_for_status()  # Raises error if status is 4xx/5xx, a 304 goes through
+    return resp
+
+def request_key(url: str, params: dict = None) -> str:
+    """
+    Short hash of url and its query parameters, so cached copies of different requests never mix.
+    """
+    request = json.dumps([url, sorted((str(key), str(value)) for key, value in (params or {}).items())])
+    return hashlib.sha1(request.encode()).hexdigest()[:12]
+
+def response_validator(resp: "requests.Response"):
+    """
+    Returns the ETag / Last-Modified of a response, None when the server sends neither.
+    """
+    validator = {key: resp.headers[key] for key in ("ETag", "Last-Modified") if key in resp.headers}
+    return validator or None
+
+def json_records_frame(payload, data_name: str) -> pd.DataFrame:
+    """
+    Builds a DataFrame straight from the records under data_name, without an intermediate frame of the
+    whole document. payload is either an object holding the list of records, or a list of objects
+    each holding one record.
+    """
+    if isinstance(payload, dict):
+        records = payload[data_name]
+    else:
+        records = [item[data_name] for item in payload]
+    return pd.DataFrame(records)
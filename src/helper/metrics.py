@@ -0,0 +1,250 @@
+import argparse
+import os
+import sys
+import threading
+import time
+import tracemalloc
+from contextlib import contextmanager
+from datetime import datetime
+import pandas as pd
+from helper.utils import ETL_METRIC_COLUMNS, etl_log, flush_etl_log, get_db_connection, load_env
+
+# Stages being tracked in this process: the process-wide peaks are reset when the first one starts
+_active = 0
+_active_lock = threading.Lock()
+_started_tracing = False
+
+def _tracemalloc_enabled() -> bool:
+    # Tracing Python allocations slows the pipeline down noticeably, it is opt-in
+    return os.getenv('ETL_METRICS_TRACEMALLOC', 'false').lower() in ('1', 'true', 'yes')
+
+def _peak_rss_mb() -> float:
+    # Linux: high-water mark since the last reset, elsewhere the peak of the whole process
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    import resource
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / 2**20 if sys.platform == "darwin" else peak / 1024
+
+def _reset_peak_rss():
+    try:
+        with open("/proc/self/clear_refs", "w") as f:
+            f.write("5")
+    except OSError:
+        pass
+
+def frame_bytes(df: pd.DataFrame, sample_rows: int = 1000) -> int:
+    """
+    In-memory size of df. Object (string) columns are measured on an evenly spaced sample of
+    sample_rows rows and extrapolated, measuring every string would cost more than the stage itself.
+    """
+    usage = df.memory_usage(index=False)
+    objects = [col for col in df.columns if df[col].dtype == object]
+    total = usage.drop(objects).sum()
+    if objects and len(df):
+        sample = df[objects].iloc[::max(1, len(df) // sample_rows)]
+        total += sample.memory_usage(index=False, deep=True).sum() * len(df) / len(sample)
+    return int(total)
+
+def row_count(value):
+    """
+    Rows held by a stage input or result: a frame, the inserted/updated counts of a loader, a row
+    count or a list of any of these (the results of a streamed stage). None when unknown.
+    """
+    if isinstance(value, pd.DataFrame):
+        return len(value)
+    if isinstance(value, dict) and ("inserted" in value or "updated" in value):
+        return int(value.get("inserted", 0)) + int(value.get("updated", 0))
+    if isinstance(value, int) and not isinstance(value, bool):
+        return value
+    if isinstance(value, list):
+        counts = [row_count(item) for item in value]
+        return sum(count for count in counts if count is not None) if any(count is not None for count in counts) else None
+    return None
+
+class StageMetrics:
+    """
+    Performance of one run of a stage, logged as the metric columns of its etl_log event: wall and
+    CPU seconds, rows and bytes in and out, and the peak RSS and traced memory (ETL_METRICS_TRACEMALLOC)
+    of the process while it ran.
+
+    CPU time is the time of the thread running the stage, work it hands to other threads or processes
+    isn't counted. The peaks are process-wide: stages running at the same time share them.
+    """
+    def __init__(self, step: str, component: str, table_name: str = None):
+        self.step = step
+        self.component = component
+        self.table_name = table_name
+        for col in ETL_METRIC_COLUMNS:
+            setattr(self, col, None)
+
+    def start(self) -> "StageMetrics":
+        global _active, _started_tracing
+        with _active_lock:
+            if _active == 0:
+                _reset_peak_rss()
+                if _tracemalloc_enabled() and not tracemalloc.is_tracing():
+                    tracemalloc.start()
+                    _started_tracing = True
+                elif tracemalloc.is_tracing():
+                    tracemalloc.reset_peak()
+            _active += 1
+        self._started = time.perf_counter()
+        self._started_cpu = time.thread_time()
+        return self
+
+    def stop(self) -> "StageMetrics":
+        global _active, _started_tracing
+        self.wall_seconds = round(time.perf_counter() - self._started, 4)
+        self.cpu_seconds = round(time.thread_time() - self._started_cpu, 4)
+        with _active_lock:
+            self.peak_rss_mb = round(_peak_rss_mb(), 1)
+            if tracemalloc.is_tracing():
+                self.peak_traced_mb = round(tracemalloc.get_traced_memory()[1] / 2**20, 1)
+            _active -= 1
+            if _active == 0 and _started_tracing:
+                tracemalloc.stop()
+                _started_tracing = False
+        return self
+
+    def observe(self, inputs: list = (), output=None):
+        """
+        Counts the rows and bytes of the stage: rows in from its first frame input, bytes in
+        from all of them, rows and bytes out from its result.
+        """
+        frames = [value for value in inputs if isinstance(value, pd.DataFrame)]
+        if frames:
+            self.rows_in = len(frames[0])
+            self.bytes_in = sum(frame_bytes(frame) for frame in frames)
+        self.rows_out = row_count(output)
+        if isinstance(output, pd.DataFrame):
+            self.bytes_out = frame_bytes(output)
+
+    def log_msg(self, status: str, error: Exception = None) -> dict:
+        log_msg = {
+            "step": self.step,
+            "component": self.component,
+            "status": status,
+            "table_name": self.table_name,
+            "etl_date": datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        }
+        if error is not None:
+            log_msg["error_msg"] = str(error)
+        log_msg.update({col: getattr(self, col) for col in ETL_METRIC_COLUMNS if getattr(self, col) is not None})
+        return log_msg
+
+@contextmanager
+def track_stage(step: str, component: str, table_name: str = None):
+    """
+    Measures the block and logs an etl_log event with its metrics, status success or failed:
+
+        with track_stage("warehouse", "transform", "car_sales") as stage:
+            tf_df = transform_car_sales(df, ...)
+            stage.observe([df], tf_df)
+    """
+    stage = StageMetrics(step, component, table_name).start()
+    try:
+        yield stage
+    except Exception as e:
+        etl_log(stage.stop().log_msg("failed", e))
+        raise
+    etl_log(stage.stop().log_msg("success"))
+
+def read_stage_metrics(since: str = None, step: str = None, component: str = None) -> pd.DataFrame:
+    """
+    etl_log events that carry metrics, oldest first, optionally since a date and for one step/component.
+    """
+    import sqlalchemy
+
+    # Make sure events queued earlier in this run are visible to the query
+    flush_etl_log()
+
+    conditions = ["wall_seconds IS NOT NULL"]
+    params = {}
+    for column, value in (("etl_date", since), ("step", step), ("component", component)):
+        if value is not None:
+            conditions.append(f"{column} >= :{column}" if column == "etl_date" else f"{column} = :{column}")
+            params[column] = value
+
+    query = sqlalchemy.text(f"""
+        SELECT step, component, status, table_name, etl_date, {", ".join(ETL_METRIC_COLUMNS)}
+        FROM etl_log
+        WHERE {" AND ".join(conditions)}
+        ORDER BY etl_date
+    """)
+    df = pd.read_sql(sql=query, con=get_db_connection('log'), params=params)
+    df["etl_date"] = pd.to_datetime(df["etl_date"])
+    return df
+
+def slowest_stages(limit: int = 10, since: str = None) -> pd.DataFrame:
+    """
+    The limit stages with the longest mean wall-clock over their successful runs, with their
+    95th percentile, CPU time, rows out and memory peak.
+    """
+    df = read_stage_metrics(since)
+    df = df[df["status"] == "success"]
+    report = df.groupby(["step", "component"]).agg(
+        runs=("wall_seconds", "size"),
+        mean_seconds=("wall_seconds", "mean"),
+        p95_seconds=("wall_seconds", lambda seconds: seconds.quantile(0.95)),
+        max_seconds=("wall_seconds", "max"),
+        mean_cpu_seconds=("cpu_seconds", "mean"),
+        mean_rows_out=("rows_out", "mean"),
+        max_peak_rss_mb=("peak_rss_mb", "max"),
+    )
+    return report.sort_values("mean_seconds", ascending=False).head(limit).reset_index()
+
+def throughput_trend(step: str = None, component: str = None, freq: str = "D", since: str = None) -> pd.DataFrame:
+    """
+    Rows per second of every stage over time, per period of freq (a pandas period alias, 'D' for
+    days, 'W' for weeks) or per run with freq=None. Rows are the rows in, or the rows out for a
+    stage without a frame input (an extract).
+    """
+    df = read_stage_metrics(since, step, component)
+    df = df[df["status"] == "success"]
+    df = df.assign(rows=df["rows_in"].fillna(df["rows_out"]))
+    if freq is None:
+        trend = df[["step", "component", "etl_date", "rows", "wall_seconds", "peak_rss_mb"]].reset_index(drop=True)
+        trend["rows_per_second"] = trend["rows"] / trend["wall_seconds"]
+        return trend
+    df["period"] = df["etl_date"].dt.to_period(freq).dt.start_time
+
+    trend = df.groupby(["step", "component", "period"]).agg(
+        runs=("wall_seconds", "size"),
+        rows=("rows", "sum"),
+        seconds=("wall_seconds", "sum"),
+        mean_seconds=("wall_seconds", "mean"),
+        max_peak_rss_mb=("peak_rss_mb", "max"),
+    )
+    trend["rows_per_second"] = trend["rows"] / trend["seconds"]
+    return trend.reset_index()
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Stage performance reports from the etl_log metrics")
+    subparsers = parser.add_subparsers(dest="report", required=True)
+    slowest = subparsers.add_parser("slowest", help="stages with the longest mean wall-clock")
+    slowest.add_argument("--limit", type=int, default=10)
+    slowest.add_argument("--since", help="only runs on or after this date")
+    trend = subparsers.add_parser("trend", help="rows per second of every stage over time")
+    trend.add_argument("--step")
+    trend.add_argument("--component")
+    trend.add_argument("--freq", default="D", help="pandas period alias (D, W, M), or 'run' for one row per run")
+    trend.add_argument("--since", help="only runs on or after this date")
+    args = parser.parse_args(argv)
+    load_env()
+
+    if args.report == "slowest":
+        report = slowest_stages(limit=args.limit, since=args.since)
+    else:
+        report = throughput_trend(step=args.step, component=args.component,
+                                  freq=None if args.freq == "run" else args.freq, since=args.since)
+    with pd.option_context("display.width", 200, "display.max_columns", None):
+        print(report.to_string(index=False))
+
+if __name__ == "__main__":
+    main()
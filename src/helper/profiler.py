@@ -0,0 +1,155 @@
+import html
+import os
+import sys
+import threading
+import zlib
+from collections import Counter
+
+def profile_dir():
+    """
+    Directory of the profiling mode (PIPELINE_PROFILE_DIR, set by `pipeline.py --profile`), None when it is off.
+    """
+    return os.getenv('PIPELINE_PROFILE_DIR') or None
+
+class StackSampler:
+    """
+    Sampling profiler of one thread: a background thread records the call stack of the profiled
+    thread every interval seconds (PIPELINE_PROFILE_INTERVAL in milliseconds, default 5) and counts
+    identical stacks. The profiled code runs unmodified, the cost is one stack walk per sample.
+
+    Stacks start below the frame that called start(), under a root frame named root, so the
+    thread pool machinery above it stays out of the profile. Work handed to other threads or
+    processes isn't sampled.
+    """
+    def __init__(self, root: str, interval: float = None):
+        self.root = root
+        self.interval = interval if interval is not None else float(os.getenv('PIPELINE_PROFILE_INTERVAL', 5)) / 1000
+        self.samples = Counter()
+        self._labels = {}
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self) -> "StackSampler":
+        self._thread_id = threading.get_ident()
+        # The caller of start() and the frames above it, cut from every sample
+        self._base_depth = 0
+        frame = sys._getframe(1)
+        while frame is not None:
+            self._base_depth += 1
+            frame = frame.f_back
+        self._thread = threading.Thread(target=self._run, name=f"profiler-{self.root}", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self) -> "StackSampler":
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+        return self
+
+    def _label(self, code) -> str:
+        label = self._labels.get(code)
+        if label is None:
+            # function (package/module.py:line), without the separators of the collapsed format
+            filename = os.path.join(*os.path.normpath(code.co_filename).split(os.sep)[-2:])
+            label = f"{code.co_name} ({filename}:{code.co_firstlineno})".replace(";", ":")
+            self._labels[code] = label
+        return label
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self._thread_id)
+            stack = []
+            while frame is not None:
+                stack.append(frame.f_code)
+                frame = frame.f_back
+            # Outermost first, from the first call below the caller of start()
+            stack = stack[::-1][self._base_depth:]
+            # A sample taken while stop() runs shows the profiler, not the profiled code
+            if stack and not self._stop.is_set():
+                self.samples[(self.root,) + tuple(self._label(code) for code in stack)] += 1
+
+def collapsed_stacks(samples: Counter) -> str:
+    """
+    Samples in the collapsed (folded) stack format of flamegraph.pl / speedscope: one
+    `root;caller;...;function count` line per distinct stack.
+    """
+    return "".join(f"{';'.join(stack)} {count}\n" for stack, count in sorted(samples.items()))
+
+def hot_functions(samples: Counter, top: int = 25) -> str:
+    """
+    The top functions by self samples (the function itself was running) with their total samples
+    (it was on the stack), as a text table.
+    """
+    total = sum(samples.values())
+    self_counts = Counter()
+    total_counts = Counter()
+    for stack, count in samples.items():
+        self_counts[stack[-1]] += count
+        for label in set(stack):
+            total_counts[label] += count
+
+    lines = [f"{total} samples", f"{'self %':>7} {'self':>7} {'total %':>8} {'total':>7}  function"]
+    for label, count in self_counts.most_common(top):
+        lines.append(f"{100 * count / total:>6.1f}% {count:>7} {100 * total_counts[label] / total:>7.1f}% "
+                     f"{total_counts[label]:>7}  {label}")
+    return "\n".join(lines) + "\n"
+
+def flame_graph(samples: Counter, title: str, width: int = 1200, row_height: int = 16) -> str:
+    """
+    Flame graph of the samples as a standalone SVG: one box per function on a stack, as wide as
+    the samples it was on the stack for, callers below their callees. Hover a box for its figures.
+    """
+    # Merge the stacks into a tree: node = [count, children]
+    tree = [0, {}]
+    for stack, count in samples.items():
+        node = tree
+        node[0] += count
+        for label in stack:
+            node = node[1].setdefault(label, [0, {}])
+            node[0] += count
+
+    total = max(tree[0], 1)
+    boxes = []
+
+    def place(children: dict, x: float, depth: int):
+        for label, (count, grandchildren) in sorted(children.items()):
+            boxes.append((label, count, x, depth))
+            place(grandchildren, x, depth + 1)
+            x += count * width / total
+
+    place(tree[1], 0.0, 0)
+    depth = max((box[3] for box in boxes), default=0) + 1
+    height = (depth + 2) * row_height
+
+    parts = [f'<svg xmlns="http://www.w3.org/2000/svg" width="{width}" height="{height}" font-family="monospace" font-size="11">',
+             f'<text x="4" y="{row_height - 4}">{html.escape(title)} ({tree[0]} samples)</text>']
+    for label, count, x, level in boxes:
+        box_width = count * width / total
+        if box_width < 0.5:
+            continue
+        y = height - (level + 1) * row_height
+        # Warm colours, stable per function
+        hue = zlib.crc32(label.encode()) % 60
+        text = html.escape(label[:int(box_width / 7)]) if box_width > 21 else ""
+        parts.append(f'<g><title>{html.escape(label)}: {count} samples ({100 * count / total:.1f}%)</title>'
+                     f'<rect x="{x:.1f}" y="{y}" width="{box_width:.1f}" height="{row_height - 1}" fill="hsl({hue},85%,60%)"/>'
+                     f'<text x="{x + 2:.1f}" y="{y + row_height - 4}">{text}</text></g>')
+    parts.append("</svg>")
+    return "\n".join(parts) + "\n"
+
+def write_profile(sampler: StackSampler, directory: str, name: str, top: int = None) -> str:
+    """
+    Writes name.folded (collapsed stacks), name.svg (flame graph) and name.top.txt (hot functions,
+    PIPELINE_PROFILE_TOP rows, default 25) in directory, returns the path prefix.
+    """
+    top = top or int(os.getenv('PIPELINE_PROFILE_TOP', 25))
+    os.makedirs(directory, exist_ok=True)
+    prefix = os.path.join(directory, name)
+    with open(f"{prefix}.folded", "w") as f:
+        f.write(collapsed_stacks(sampler.samples))
+    with open(f"{prefix}.svg", "w") as f:
+        f.write(flame_graph(sampler.samples, title=name))
+    with open(f"{prefix}.top.txt", "w") as f:
+        f.write(hot_functions(sampler.samples, top) if sampler.samples else "0 samples\n")
+    return prefix
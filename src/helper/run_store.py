@@ -0,0 +1,163 @@
+import hashlib
+import json
+import logging
+import os
+import pickle
+import re
+import threading
+import time
+import pandas as pd
+
+def current_run():
+    """
+    RunStore of the checkpointed run (PIPELINE_RUN_ID, set by `pipeline.py --run-id/--resume`), None when off.
+    """
+    run_id = os.getenv('PIPELINE_RUN_ID')
+    return RunStore(run_id) if run_id else None
+
+def file_hash(path: str) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+class RunStore:
+    """
+    Intermediate results of one pipeline run, kept so a failed run can be resumed.
+
+    Every task result is saved under <PIPELINE_RUN_DIR>/<run_id>/<step>/ (default runs/): frames as
+    zstd-compressed Parquet, anything else pickled. manifest.json records the run arguments, every
+    attempt, and per task its status, file, rows and sha256. An artifact is valid while its file
+    matches the recorded hash. A store that can't be written never fails the pipeline, the task
+    is just run again on resume.
+    """
+    def __init__(self, run_id: str, root: str = None):
+        if not re.fullmatch(r"[A-Za-z0-9][A-Za-z0-9._-]*", run_id):
+            raise ValueError(f"Invalid run ID {run_id!r}: letters, digits, '.', '_' and '-', starting with a letter or digit")
+        self.run_id = run_id
+        self.run_dir = os.path.join(root or os.getenv('PIPELINE_RUN_DIR', 'runs'), run_id)
+        self.manifest_path = os.path.join(self.run_dir, "manifest.json")
+        self._lock = threading.Lock()
+
+    def exists(self) -> bool:
+        return os.path.exists(self.manifest_path)
+
+    def read_manifest(self) -> dict:
+        """
+        Returns the manifest of the run, an empty one before the first task.
+        """
+        try:
+            with open(self.manifest_path) as f:
+                return json.load(f)
+        except (FileNotFoundError, ValueError):
+            return {"run_id": self.run_id, "args": {}, "attempts": [], "tasks": {}}
+
+    def _write_manifest(self, manifest: dict):
+        # Write to a temporary file first, readers never see half a manifest
+        os.makedirs(self.run_dir, exist_ok=True)
+        with open(f"{self.manifest_path}.tmp", "w") as f:
+            json.dump(manifest, f, indent=4, default=str)
+        os.replace(f"{self.manifest_path}.tmp", self.manifest_path)
+
+    def _update(self, change):
+        with self._lock:
+            manifest = self.read_manifest()
+            change(manifest)
+            self._write_manifest(manifest)
+
+    def start(self, args: dict = None):
+        """
+        Records a new attempt of the run; args (stages, options) are kept from the first attempt.
+        """
+        def change(manifest):
+            manifest["args"] = manifest.get("args") or args or {}
+            manifest["attempts"].append({"started_at": time.strftime("%Y-%m-%d %H:%M:%S"), "status": "running"})
+        self._update(change)
+
+    def finish(self, status: str):
+        def change(manifest):
+            if manifest["attempts"]:
+                manifest["attempts"][-1].update(status=status, finished_at=time.strftime("%Y-%m-%d %H:%M:%S"))
+        self._update(change)
+
+    def is_valid(self, step: str, name: str) -> bool:
+        """
+        True when the task succeeded in an earlier attempt and its artifact is unchanged.
+        A None result is never valid: it is how a swallowed failure looks, and the tasks that return
+        None legitimately (nothing new to transform or load) are cheap to run again.
+        """
+        entry = self.read_manifest()["tasks"].get(f"{step}/{name}")
+        if entry is None or entry["status"] != "success" or entry["format"] == "none":
+            return False
+        path = os.path.join(self.run_dir, entry["path"])
+        return os.path.exists(path) and file_hash(path) == entry["sha256"]
+
+    def load(self, step: str, name: str):
+        """
+        Returns the saved result of a task (check is_valid first).
+        """
+        entry = self.read_manifest()["tasks"][f"{step}/{name}"]
+        path = os.path.join(self.run_dir, entry["path"])
+        if entry["format"] == "parquet":
+            return pd.read_parquet(path)
+        with open(path, "rb") as f:
+            return pickle.load(f)
+
+    def save(self, step: str, name: str, value):
+        """
+        Saves the result of a successful task and records it in the manifest.
+        """
+        entry = {"status": "success", "saved_at": time.strftime("%Y-%m-%d %H:%M:%S")}
+        try:
+            os.makedirs(os.path.join(self.run_dir, step), exist_ok=True)
+            if value is None:
+                entry["format"] = "none"
+            else:
+                entry.update(self._write_value(step, name, value))
+                entry["sha256"] = file_hash(os.path.join(self.run_dir, entry["path"]))
+        except Exception as e:
+            logging.error(f"Can't save the result of {step}/{name} in run {self.run_id}. Cause: {str(e)}")
+            entry = {"status": "unsaved", "error_msg": str(e)}
+        self._update(lambda manifest: manifest["tasks"].__setitem__(f"{step}/{name}", entry))
+
+    def _write_value(self, step: str, name: str, value) -> dict:
+        base = os.path.join(step, name)
+        if isinstance(value, pd.DataFrame):
+            try:
+                path = f"{base}.parquet"
+                value.to_parquet(os.path.join(self.run_dir, f"{path}.tmp"), compression="zstd")
+                os.replace(os.path.join(self.run_dir, f"{path}.tmp"), os.path.join(self.run_dir, path))
+                return {"format": "parquet", "path": path, "rows": len(value)}
+            except Exception as e:
+                # Columns Parquet can't hold (mixed Python objects) are pickled instead
+                logging.info(f"Pickling the result of {step}/{name}, not writable as Parquet. Cause: {str(e)}")
+
+        path = f"{base}.pkl"
+        with open(os.path.join(self.run_dir, f"{path}.tmp"), "wb") as f:
+            pickle.dump(value, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(os.path.join(self.run_dir, f"{path}.tmp"), os.path.join(self.run_dir, path))
+        entry = {"format": "pickle", "path": path}
+        if isinstance(value, pd.DataFrame):
+            entry["rows"] = len(value)
+        return entry
+
+    def mark(self, step: str, name: str, status: str, error: Exception = None):
+        """
+        Records a task that didn't succeed (failed, timeout, skipped); its earlier artifact is dropped.
+        """
+        entry = {"status": status, "saved_at": time.strftime("%Y-%m-%d %H:%M:%S")}
+        if error is not None:
+            entry["error_msg"] = str(error)
+        self._update(lambda manifest: manifest["tasks"].__setitem__(f"{step}/{name}", entry))
+
+    def summary(self) -> str:
+        """
+        Status of every task of the run, for the resume command.
+        """
+        manifest = self.read_manifest()
+        lines = [f"run {self.run_id} ({self.run_dir}), {len(manifest['attempts'])} attempt(s)"]
+        for key, entry in manifest["tasks"].items():
+            detail = f"{entry.get('rows')} rows" if entry.get("rows") is not None else entry.get("error_msg", "")
+            lines.append(f"{key:<40} {entry['status']:<10} {detail}")
+        return "\n".join(lines)
@@ -0,0 +1,58 @@
+import queue
+import threading
+
+# Marks the end of the chunk stream in the queue
+_END = object()
+
+def _put(chunk_queue: queue.Queue, item, stop: threading.Event) -> bool:
+    # Block until there is room in the queue, unless the consumer gave up
+    while not stop.is_set():
+        try:
+            chunk_queue.put(item, timeout=0.1)
+            return True
+        except queue.Full:
+            continue
+    return False
+
+def run_streaming(chunks, process, max_queue: int = 2) -> list:
+    """
+    Calls process(chunk) for every chunk of the chunks iterator and returns the results.
+
+    The iterator is consumed by a background thread into a bounded queue, so chunk N+1 is
+    extracted while chunk N is processed. At most max_queue chunks wait in the queue, which
+    keeps peak memory proportional to the chunk size rather than the table size.
+    """
+    chunk_queue = queue.Queue(maxsize=max_queue)
+    stop = threading.Event()
+    errors = []
+
+    def produce():
+        try:
+            for chunk in chunks:
+                if not _put(chunk_queue, chunk, stop):
+                    break
+        except Exception as e:
+            errors.append(e)
+        finally:
+            # Release the server-side cursor from the thread that opened it
+            if hasattr(chunks, "close"):
+                chunks.close()
+            _put(chunk_queue, _END, stop)
+
+    producer = threading.Thread(target=produce, name="chunk-producer", daemon=True)
+    producer.start()
+
+    results = []
+    try:
+        while True:
+            chunk = chunk_queue.get()
+            if chunk is _END:
+                break
+            results.append(process(chunk))
+    finally:
+        stop.set()
+        producer.join()
+
+    if errors:
+        raise errors[0]
+    return results
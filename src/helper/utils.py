@@ -1,72 +1,355 @@
 import os
-from dotenv import load_dotenv
-from sqlalchemy import create_engine
-import sqlalchemy
-from minio import Minio
+import atexit
+import threading
+import time
+from collections import deque
 from io import BytesIO
 import pandas as pd
 from datetime import datetime
 import logging
 
-# Load environment variables
-load_dotenv()
+# Heavy clients (sqlalchemy, minio, dotenv) are imported on first use, importing this module has no side effects
 
 # Setup Logging Configuration
 
 LOG_DIR = "log"
 LOG_FILE = os.path.join(LOG_DIR, "info_process.log")
 
-# Ensure log directory exists
-if not os.path.exists(LOG_DIR):
-    os.makedirs(LOG_DIR)
+_logging_configured = False
+_env_loaded = False
 
-# Configure logging only once
-logging.basicConfig(
-    filename=LOG_FILE,
-    level=logging.INFO,
-    format="%(asctime)s - %(levelname)s - %(message)s"
-)
+def load_env():
+    """
+    Loads the .env file into the environment (variables already set are kept), once per process.
+    Called by the entry points and before the first database connection, never at import.
+    """
+    global _env_loaded
+    if not _env_loaded:
+        from dotenv import load_dotenv
+        load_dotenv()
+        _env_loaded = True
+
+def setup_logging():
+    """
+    Creates the log directory and configures the file log, once, when the first event is written.
+    """
+    global _logging_configured
+    if not _logging_configured:
+        os.makedirs(LOG_DIR, exist_ok=True)
+        logging.basicConfig(
+            filename=LOG_FILE,
+            level=logging.INFO,
+            format="%(asctime)s - %(levelname)s - %(message)s"
+        )
+        _logging_configured = True
 
 
 # Database Connections
+
+# Environment variable prefix for each database the pipeline talks to
+DB_ENV_PREFIX = {
+    'source': 'SRC',
+    'staging': 'STG',
+    'warehouse': 'WH',
+    'log': 'LOG',
+}
+
+_timed_queue_pool = None
+
+def timed_queue_pool():
+    """
+    QueuePool that also records how long each checkout waited for a connection.
+    The class is built on first use, so that importing this module doesn't import sqlalchemy.
+    """
+    global _timed_queue_pool
+    if _timed_queue_pool is None:
+        from sqlalchemy.pool import QueuePool
+
+        class TimedQueuePool(QueuePool):
+            def __init__(self, *args, **kwargs):
+                super().__init__(*args, **kwargs)
+                self._stats_lock = threading.Lock()
+                self.checkouts = 0
+                self.total_wait = 0.0
+                self.max_wait = 0.0
+
+            def _do_get(self):
+                start = time.perf_counter()
+                try:
+                    return super()._do_get()
+                finally:
+                    wait = time.perf_counter() - start
+                    with self._stats_lock:
+                        self.checkouts += 1
+                        self.total_wait += wait
+                        self.max_wait = max(self.max_wait, wait)
+
+        _timed_queue_pool = TimedQueuePool
+    return _timed_queue_pool
+
+# One engine (and so one connection pool) per db_type for the whole process
+_engines = {}
+_engines_lock = threading.Lock()
+
+def _pool_settings() -> dict:
+    """
+    Reads the pool settings from the environment, falling back to defaults.
+    """
+    return {
+        "pool_size": int(os.getenv('DB_POOL_SIZE', 5)),
+        "max_overflow": int(os.getenv('DB_MAX_OVERFLOW', 10)),
+        "pool_timeout": float(os.getenv('DB_POOL_TIMEOUT', 30)),
+        "pool_recycle": int(os.getenv('DB_POOL_RECYCLE', 1800)),
+        "pool_pre_ping": os.getenv('DB_POOL_PRE_PING', 'true').lower() in ('1', 'true', 'yes'),
+    }
+
+def _create_db_engine(db_type):
+    from sqlalchemy import create_engine
+
+    load_env()
+    prefix = DB_ENV_PREFIX[db_type]
+    url = f"postgresql://{os.getenv(f'{prefix}_POSTGRES_USER')}:{os.getenv(f'{prefix}_POSTGRES_PASSWORD')}@{os.getenv(f'{prefix}_POSTGRES_HOST')}:{os.getenv(f'{prefix}_POSTGRES_PORT')}/{os.getenv(f'{prefix}_POSTGRES_DB')}"
+    return create_engine(url, poolclass=timed_queue_pool(), **_pool_settings())
+
 def get_db_connection(db_type):
-    if db_type == 'source':
-        return create_engine(f"postgresql://{os.getenv('SRC_POSTGRES_USER')}:{os.getenv('SRC_POSTGRES_PASSWORD')}@{os.getenv('SRC_POSTGRES_HOST')}:{os.getenv('SRC_POSTGRES_PORT')}/{os.getenv('SRC_POSTGRES_DB')}")
-    elif db_type == 'staging':
-        return create_engine(f"postgresql://{os.getenv('STG_POSTGRES_USER')}:{os.getenv('STG_POSTGRES_PASSWORD')}@{os.getenv('STG_POSTGRES_HOST')}:{os.getenv('STG_POSTGRES_PORT')}/{os.getenv('STG_POSTGRES_DB')}")
-    elif db_type == 'warehouse':
-        return create_engine(f"postgresql://{os.getenv('WH_POSTGRES_USER')}:{os.getenv('WH_POSTGRES_PASSWORD')}@{os.getenv('WH_POSTGRES_HOST')}:{os.getenv('WH_POSTGRES_PORT')}/{os.getenv('WH_POSTGRES_DB')}")
-    elif db_type == 'log':
-        return create_engine(f"postgresql://{os.getenv('LOG_POSTGRES_USER')}:{os.getenv('LOG_POSTGRES_PASSWORD')}@{os.getenv('LOG_POSTGRES_HOST')}:{os.getenv('LOG_POSTGRES_PORT')}/{os.getenv('LOG_POSTGRES_DB')}")
+    """
+    Returns the pooled engine for db_type, creating it on first use.
+    Every caller in the process shares the same engine, so connections are reused between steps.
+    """
+    if db_type not in DB_ENV_PREFIX:
+        raise ValueError(f"Unknown db_type: {db_type}")
+
+    engine = _engines.get(db_type)
+    if engine is None:
+        with _engines_lock:
+            engine = _engines.get(db_type)
+            if engine is None:
+                engine = _create_db_engine(db_type)
+                _engines[db_type] = engine
+    return engine
+
+def set_db_connection(db_type, engine):
+    """
+    Makes engine the shared engine of db_type instead of the one built from the environment
+    (e.g. an embedded database standing in for Postgres in the benchmarks).
+    """
+    if db_type not in DB_ENV_PREFIX:
+        raise ValueError(f"Unknown db_type: {db_type}")
+    with _engines_lock:
+        _engines[db_type] = engine
+
+def dispose_db_connections():
+    """
+    Closes every pooled connection and empties the registry.
+    """
+    with _engines_lock:
+        for engine in _engines.values():
+            engine.dispose()
+        _engines.clear()
+
+def get_pool_stats() -> dict:
+    """
+    Returns connection pool statistics for every engine created so far.
+    """
+    stats = {}
+    for db_type, engine in list(_engines.items()):
+        pool = engine.pool
+        checkouts = getattr(pool, "checkouts", 0)
+        total_wait = getattr(pool, "total_wait", 0.0)
+        stats[db_type] = {
+            "pool_size": pool.size(),
+            "checked_in": pool.checkedin(),
+            "checked_out": pool.checkedout(),
+            "overflow": pool.overflow(),
+            "checkouts": checkouts,
+            "avg_wait_ms": round(total_wait / checkouts * 1000, 3) if checkouts else 0.0,
+            "max_wait_ms": round(getattr(pool, "max_wait", 0.0) * 1000, 3),
+        }
+    return stats
+
+def _forget_engines_after_fork():
+    # A forked child must not reuse the parent's sockets, it opens its own pool on first use
+    _engines.clear()
+
+atexit.register(dispose_db_connections)
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_forget_engines_after_fork)
 
 # Logging
-def etl_log(log_msg: dict):
-    # Write log to database
-    try:
-        conn = get_db_connection('log')
-        df_log = pd.DataFrame([log_msg])
-        df_log.to_sql(name="etl_log", con=conn, if_exists="append", index=False)
-    except Exception as e:
-        logging.error(f"Can't save log to DB. Cause: {str(e)}")
 
-    # Write log to file
-    try:
-        log_line = ""
+# Columns of the etl_log table, keys outside this list are only written to the file log
+ETL_LOG_COLUMNS = ["step", "component", "status", "table_name", "etl_date", "error_msg"]
 
-        for key, value in log_msg.items():
-            log_line += f"{key}={value} | "
+# Performance metrics of a tracked stage (see helper.metrics), only present on the events it logs
+ETL_METRIC_COLUMNS = ["wall_seconds", "cpu_seconds", "rows_in", "rows_out", "bytes_in", "bytes_out",
+                      "peak_rss_mb", "peak_traced_mb"]
 
-        log_line = log_line.rstrip(" | ")
+def format_log_line(log_msg: dict) -> str:
+    log_line = ""
 
-        logging.info(log_line)
-    except Exception as e:
-        print(f"Can't save log to file. Cause: {str(e)}")
+    for key, value in log_msg.items():
+        log_line += f"{key}={value} | "
+
+    return log_line.rstrip(" | ")
+
+class EtlLogSink:
+    """
+    Buffers etl_log events in memory and writes them in batches from a background thread.
+    A batch is flushed once batch_size events are queued, every flush_interval seconds and at interpreter exit.
+    If the log database is unreachable the events still reach the file log. An event emitted after
+    close() (during interpreter exit) is written right away, on the caller's thread.
+    """
+    def __init__(self, batch_size: int = None, flush_interval: float = None):
+        self._batch_size = batch_size
+        self._flush_interval = flush_interval
+        self._buffer = deque()
+        self._wakeup = threading.Event()
+        self._flush_lock = threading.Lock()
+        self._start_lock = threading.Lock()
+        self._thread = None
+        self._pid = None
+        self._closed = False
+
+    # Settings default to the environment, read on first use (after the entry point loaded .env)
+    @property
+    def batch_size(self) -> int:
+        if self._batch_size is None:
+            self._batch_size = int(os.getenv('ETL_LOG_BATCH_SIZE', 100))
+        return self._batch_size
+
+    @property
+    def flush_interval(self) -> float:
+        if self._flush_interval is None:
+            self._flush_interval = float(os.getenv('ETL_LOG_FLUSH_INTERVAL', 2.0))
+        return self._flush_interval
+
+    def emit(self, log_msg: dict):
+        # After close (interpreter exit) no flusher runs anymore: write the event now
+        if self._closed:
+            self._write([dict(log_msg)])
+            return
+
+        # Only a copy and an append happen on the caller's thread
+        self._buffer.append(dict(log_msg))
+        self._ensure_started()
+        if len(self._buffer) >= self.batch_size:
+            self._wakeup.set()
+
+    def flush(self):
+        """
+        Writes every queued event now, on the calling thread.
+        """
+        with self._flush_lock:
+            while self._buffer:
+                batch = []
+                while self._buffer and len(batch) < self.batch_size:
+                    batch.append(self._buffer.popleft())
+                self._write(batch)
+
+    def close(self):
+        self._closed = True
+        self._wakeup.set()
+        if self._thread is not None and self._pid == os.getpid():
+            self._thread.join(timeout=self.flush_interval + 5)
+        self.flush()
+
+    def _reset_after_fork(self):
+        # The parent's queued events are the parent's to write, and its flusher thread and any lock it
+        # held don't exist in the child: start empty, with fresh locks, the child starts its own flusher
+        self._buffer = deque()
+        self._wakeup = threading.Event()
+        self._flush_lock = threading.Lock()
+        self._start_lock = threading.Lock()
+        self._thread = None
+        self._pid = None
+
+    def _ensure_started(self):
+        # Threads do not survive a fork, so a child process starts its own flusher
+        if self._closed or (self._thread is not None and self._pid == os.getpid()):
+            return
+        with self._start_lock:
+            if self._thread is None or self._pid != os.getpid():
+                self._pid = os.getpid()
+                self._thread = threading.Thread(target=self._run, name="etl-log-sink", daemon=True)
+                self._thread.start()
+
+    def _run(self):
+        while not self._closed:
+            self._wakeup.wait(self.flush_interval)
+            self._wakeup.clear()
+            try:
+                self.flush()
+            except Exception as e:
+                print(f"Can't flush etl log. Cause: {str(e)}")
+
+    def _write(self, batch: list):
+        import sqlalchemy
+
+        # Write log to file
+        setup_logging()
+        try:
+            for log_msg in batch:
+                logging.info(format_log_line(log_msg))
+        except Exception as e:
+            print(f"Can't save log to file. Cause: {str(e)}")
+
+        # Write log to database in one round trip
+        try:
+            conn = get_db_connection('log')
+            has_metrics = any(col in log_msg for log_msg in batch for col in ETL_METRIC_COLUMNS)
+            try:
+                self._insert(conn, batch, ETL_LOG_COLUMNS + (ETL_METRIC_COLUMNS if has_metrics else []))
+            except sqlalchemy.exc.DBAPIError as e:
+                if not has_metrics:
+                    raise
+                # A log database without migration 001 has no metric columns: keep the events, drop the metrics
+                logging.error(f"Can't save the metrics of {len(batch)} log(s) to DB, saving them without. Cause: {str(e)}")
+                self._insert(conn, batch, ETL_LOG_COLUMNS)
+        except Exception as e:
+            logging.error(f"Can't save {len(batch)} log(s) to DB. Cause: {str(e)}")
+
+    @staticmethod
+    def _insert(conn, batch: list, columns: list):
+        import sqlalchemy
+
+        rows = [{col: log_msg.get(col) for col in columns} for log_msg in batch]
+        query = sqlalchemy.text(f"""
+            INSERT INTO etl_log ({", ".join(columns)})
+            VALUES ({", ".join(f":{col}" for col in columns)})
+        """)
+        with conn.begin() as connection:
+            connection.execute(query, rows)
+
+# Batch size and flush interval from ETL_LOG_BATCH_SIZE (default 100) and ETL_LOG_FLUSH_INTERVAL (default 2s)
+_log_sink = EtlLogSink()
+
+# Registered after dispose_db_connections, so it runs first at exit while the pool is still open
+atexit.register(_log_sink.close)
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_log_sink._reset_after_fork)
+
+def etl_log(log_msg: dict):
+    """
+    Queues a log event, it is written to the log database and the file log by the background sink.
+    """
+    _log_sink.emit(log_msg)
+
+def flush_etl_log():
+    """
+    Writes every queued log event before returning.
+    """
+    _log_sink.flush()
 
 def read_etl_log(filter_params: dict) -> pd.DataFrame:
     """
     Reads the latest etl_date from the log table for incremental extraction.
     """
+    import sqlalchemy
+
     try:
+        # Make sure events queued earlier in this run are visible to the query
+        flush_etl_log()
+
         # create connection to database        
         conn = get_db_connection('log')
 
@@ -90,6 +373,26 @@ def read_etl_log(filter_params: dict) -> pd.DataFrame:
         print(f"Can't execute your query. Cause: {str(e)}")
         return pd.DataFrame()
 
+def get_etl_date(filter_params: dict):
+    """
+    Returns the latest successful etl_date matching filter_params, or '1111-01-01' when
+    nothing has been recorded yet (initial load).
+    """
+    etl_date = read_etl_log(filter_params)
+    if etl_date.empty or etl_date['latest_etl_date'][0] is None:
+        return '1111-01-01'
+    return etl_date['latest_etl_date'][0]
+
+def read_sql_chunks(db_type: str, query, params: dict = None, chunksize: int = 50000):
+    """
+    Yields the result of query as DataFrames of at most chunksize rows.
+    Rows are fetched through a server-side cursor, so only one chunk is held in memory.
+    """
+    conn = get_db_connection(db_type)
+    with conn.connect().execution_options(stream_results=True, max_row_buffer=chunksize) as connection:
+        for chunk in pd.read_sql(sql=query, con=connection, params=params or {}, chunksize=chunksize):
+            yield chunk
+
 # Read SQL Query from Table
 def read_sql(table_name: str) -> str:
     """
@@ -107,8 +410,65 @@ def read_sql_inc(table_name: str) -> str:
     query = f"SELECT * FROM {table_name} WHERE created_at > :etl_date"
     return query
 
+def read_sql_keyset(table_name: str, key_columns: list, has_cursor: bool, columns: list = None) -> str:
+    """
+    Generates a keyset-paginated SQL query over the composite key key_columns.
+    Rows strictly after the cursor (:last_<column> parameters) come back in key order, at most :page_size at a time.
+    Comparing the whole tuple means rows sharing a created_at are neither skipped nor read twice.
+    With columns, only those columns (and the key) are selected.
+    """
+    key_list = ", ".join(key_columns)
+    select_list = ", ".join(key_columns + [col for col in columns if col not in key_columns]) if columns else "*"
+    where = ""
+    if has_cursor:
+        where = f"WHERE ({key_list}) > ({', '.join(f':last_{col}' for col in key_columns)})"
+    query = f"SELECT {select_list} FROM {table_name} {where} ORDER BY {key_list} LIMIT :page_size"
+    return query
+
+def keyset_cursor(df: pd.DataFrame, key_columns: list) -> dict:
+    """
+    Returns the cursor (key values of the last row) of a frame extracted in key order.
+    """
+    cursor = {}
+    for col in key_columns:
+        value = df[col].iloc[-1]
+        # Keep the cursor JSON friendly: timestamps as ISO strings, numpy scalars as Python values
+        if isinstance(value, (pd.Timestamp, datetime)):
+            value = value.isoformat()
+        elif hasattr(value, "item"):
+            value = value.item()
+        cursor[col] = value
+    return cursor
+
+def read_keyset_pages(db_type: str, table_name: str, key_columns: list, cursor: dict = None, page_size: int = 50000,
+                      columns: list = None):
+    """
+    Yields table_name page by page in key_columns order, starting after cursor (from the beginning when None).
+    Each page is a separate short query, so no cursor stays open on the server between pages.
+    """
+    import sqlalchemy
+
+    conn = get_db_connection(db_type)
+    while True:
+        params = {"page_size": page_size}
+        if cursor is not None:
+            params.update({f"last_{col}": cursor[col] for col in key_columns})
+        query = sqlalchemy.text(read_sql_keyset(table_name, key_columns, has_cursor=cursor is not None, columns=columns))
+
+        page = pd.read_sql(sql=query, con=conn, params=params)
+        if page.empty:
+            break
+
+        yield page
+
+        if len(page) < page_size:
+            break
+        cursor = keyset_cursor(page, key_columns)
+
 # Create Function handle_error to dump failure data to MiniO
 def handle_error(data, bucket_name: str, table_name: str, step: str, component: str):
+    from minio import Minio
+
     current_date = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
 
     # Initialize MinIO client
@@ -1,42 +1,27 @@
 import pandas as pd
-from sqlalchemy import text 
-import sqlalchemy
-from helper.utils import get_db_connection, etl_log, read_etl_log, read_sql
+from helper.utils import get_db_connection, etl_log, read_sql, read_sql_chunks, read_keyset_pages
 from datetime import datetime
 
+# Composite keyset used for incremental extraction, per warehouse table
+KEYSET_COLUMNS = {
+    "car_sales": ["created_at", "id_sales_nk"],
+}
+
 def extract_warehouse(table_name: str) -> pd.DataFrame:
     """
     Extracts all data from the warehouse database.
     """
+    import sqlalchemy
+
     try:
         conn = get_db_connection('warehouse')
-        
-        # Get the latest etl_date from the log table
-        filter_log = {
-            "step": "modelling",
-            "component": "load",
-            "status": "success",
-            "table_name": table_name
-        }
-        etl_date = read_etl_log(filter_log)
-
-        # If no previous extraction has been recorded (etl_date is empty), set etl_date to '1111-01-01' indicating the initial load.
-        # Otherwise, retrieve data added since the last successful extraction (etl_date).
-        # Set etl_date for incremental extraction
-        if etl_date.empty or etl_date['latest_etl_date'][0] is None:
-            etl_date = '1111-01-01'
-        else:
-            etl_date = etl_date['latest_etl_date'][0]
 
         # Constructs a SQL query to select all columns from the specified table_name
-        #  where created_at is greater than etl_date.
         """
         SELECT * 
         FROM car_sales 
         """
-        # WHERE created_at > :etl_date
         query = sqlalchemy.text(read_sql(table_name))
-        # df = pd.read_sql(sql=query, con=conn, params={"etl_date": etl_date})
         df = pd.read_sql(sql=query, con=conn, params={})
 
         # Log success
@@ -62,4 +47,70 @@ def extract_warehouse(table_name: str) -> pd.DataFrame:
         }
         print(e)
     finally:
-        etl_log(log_msg)
\ No newline at end of file
+        etl_log(log_msg)
+
+def extract_warehouse_chunks(table_name: str, chunksize: int = 50000):
+    """
+    Extracts all data from the warehouse database as a stream of DataFrames of at most chunksize rows.
+    """
+    import sqlalchemy
+
+    log_msg = {
+        "step": "modelling",
+        "component": "extract_warehouse",
+        "table_name": table_name,
+    }
+    try:
+        query = sqlalchemy.text(read_sql(table_name))
+        yield from read_sql_chunks('warehouse', query, params={}, chunksize=chunksize)
+
+        # Log success once the whole table has been streamed
+        log_msg["status"] = "success"
+    except Exception as e:
+        # Log failure
+        log_msg["status"] = "failed"
+        log_msg["error_msg"] = str(e)
+        raise
+    finally:
+        # A consumer that stops early closes the generator, nothing was extracted in full
+        log_msg.setdefault("status", "failed")
+        log_msg["etl_date"] = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        etl_log(log_msg)
+
+def warehouse_row_count(table_name: str) -> int:
+    """
+    Number of rows of a warehouse table, a single aggregate query.
+    """
+    import sqlalchemy
+
+    query = sqlalchemy.text(f"SELECT COUNT(*) AS row_count FROM {table_name}")
+    with get_db_connection('warehouse').connect() as connection:
+        return int(connection.execute(query).scalar())
+
+def extract_warehouse_incremental(table_name: str, cursor: dict = None, chunksize: int = 50000, columns: list = None):
+    """
+    Extracts the warehouse rows after cursor (everything when None) in keyset order,
+    as a stream of pages of at most chunksize rows. With columns, only those columns
+    (and the keyset columns) are read.
+    """
+    log_msg = {
+        "step": "modelling",
+        "component": "extract_warehouse",
+        "table_name": table_name,
+    }
+    try:
+        yield from read_keyset_pages('warehouse', table_name, KEYSET_COLUMNS[table_name], cursor=cursor, page_size=chunksize,
+                                     columns=columns)
+
+        # Log success once the whole table has been streamed
+        log_msg["status"] = "success"
+    except Exception as e:
+        # Log failure
+        log_msg["status"] = "failed"
+        log_msg["error_msg"] = str(e)
+        raise
+    finally:
+        # A consumer that stops early closes the generator, nothing was extracted in full
+        log_msg.setdefault("status", "failed")
+        log_msg["etl_date"] = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        etl_log(log_msg)
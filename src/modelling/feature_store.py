@@ -0,0 +1,158 @@
+import hashlib
+import json
+import os
+import shutil
+import numpy as np
+import pandas as pd
+from helper.utils import keyset_cursor
+from modelling.extract.extract_warehouse import extract_warehouse_incremental, warehouse_row_count, KEYSET_COLUMNS
+from modelling.preprocessing.preprocessor import CarPricePreprocessor
+
+# Version of the file layout, part of the config hash so a layout change never reads old files
+LAYOUT_VERSION = 1
+
+class FeatureStore:
+    """
+    Local cache of the encoded feature matrix and target of a warehouse table, kept as raw
+    float64/int64 files that are memory-mapped on read, plus a meta JSON holding the row count,
+    the keyset cursor (high-water mark) of the last row cached and the CarPricePreprocessor.
+
+    The cache lives in a directory named after the hash of its config (table, features, target, file
+    layout and the preprocessor's config and version), so a different feature set or preprocessing
+    never reads it. refresh() reads only the warehouse rows after the cursor
+    and appends them: the vocabularies are append-only, so the codes of cached rows never change.
+    The matrix is stored encoded but unscaled, since the scaler statistics move as rows arrive, and
+    scaled on read in one vectorized pass.
+    """
+    def __init__(self, table_name: str, features: list, target: str, id_column: str = 'id_sales_nk', store_dir: str = None):
+        self.table_name = table_name
+        self.features = list(features)
+        self.target = target
+        self.id_column = id_column
+        self.key_columns = KEYSET_COLUMNS[table_name]
+        self.config = {"table_name": table_name, "features": self.features, "target": target,
+                       "id_column": id_column, "layout": LAYOUT_VERSION,
+                       "preprocessing": CarPricePreprocessor(self.features).config()}
+        self.config_hash = hashlib.sha256(json.dumps(self.config, sort_keys=True).encode()).hexdigest()[:16]
+        self.path = os.path.join(store_dir or os.getenv('FEATURE_STORE_DIR', os.path.join('cache', 'features')),
+                                 table_name, self.config_hash)
+
+    def _file(self, name: str) -> str:
+        return os.path.join(self.path, name)
+
+    def read_meta(self):
+        """
+        Returns the meta of the cached matrix, or None when nothing is cached.
+        """
+        try:
+            with open(self._file("meta.json")) as f:
+                return json.load(f)
+        except (FileNotFoundError, ValueError):
+            return None
+
+    def _write_meta(self, meta: dict):
+        # Written after the rows it counts, an interrupted append is cut off on the next refresh
+        with open(self._file("meta.json.tmp"), "w") as f:
+            json.dump(meta, f, indent=4, default=str)
+        os.replace(self._file("meta.json.tmp"), self._file("meta.json"))
+
+    def _files(self) -> dict:
+        # name: (dtype, values per row)
+        return {"X.f64": (np.float64, len(self.features)), "y.f64": (np.float64, 1), "ids.i64": (np.int64, 1)}
+
+    def _reset(self) -> dict:
+        shutil.rmtree(self.path, ignore_errors=True)
+        os.makedirs(self.path, exist_ok=True)
+        for name in self._files():
+            open(self._file(name), "wb").close()
+        return {"config": self.config, "rows": 0, "cursor": None, "preprocessor": None}
+
+    def _truncate(self, rows: int):
+        # Drop whatever an interrupted append wrote past the rows the meta counts
+        for name, (dtype, width) in self._files().items():
+            with open(self._file(name), "r+b") as f:
+                f.truncate(rows * width * np.dtype(dtype).itemsize)
+
+    def append(self, df: pd.DataFrame, meta: dict, preprocessor: CarPricePreprocessor) -> int:
+        """
+        Encodes a chunk of warehouse rows and appends it to the files, updates meta (not written).
+        """
+        preprocessor.partial_fit(df)
+        arrays = {"X.f64": preprocessor.encode(df),
+                  "y.f64": df[self.target].to_numpy(dtype=np.float64),
+                  "ids.i64": df[self.id_column].to_numpy(dtype=np.int64)}
+        for name, values in arrays.items():
+            with open(self._file(name), "ab") as f:
+                np.ascontiguousarray(values).tofile(f)
+
+        meta["rows"] += len(df)
+        meta["cursor"] = keyset_cursor(df, self.key_columns)
+        meta["preprocessor"] = preprocessor.to_dict()
+        return len(df)
+
+    def refresh(self, chunksize: int = 50000, full_refresh: bool = False) -> dict:
+        """
+        Brings the cache up to date with the warehouse and returns its meta. Only the rows after the
+        cached cursor are read, and only the feature, target and key columns. The cache is rebuilt
+        when the warehouse holds fewer rows than it (rows were deleted). Rows updated in place
+        after they were cached are not seen, use full_refresh to rebuild.
+        """
+        meta = None if full_refresh else self.read_meta()
+        if meta is None:
+            meta = self._reset()
+        else:
+            self._truncate(meta["rows"])
+
+        preprocessor = (CarPricePreprocessor.from_dict(meta["preprocessor"]) if meta["preprocessor"]
+                        else CarPricePreprocessor(self.features))
+        columns = self.features + [self.target, self.id_column]
+        new_rows = 0
+        for chunk in extract_warehouse_incremental(self.table_name, cursor=meta["cursor"], chunksize=chunksize, columns=columns):
+            new_rows += self.append(chunk, meta, preprocessor)
+            self._write_meta(meta)
+        meta["new_rows"] = new_rows
+
+        if warehouse_row_count(self.table_name) < meta["rows"]:
+            if full_refresh:
+                raise RuntimeError(f"{self.table_name} changed while it was being cached")
+            return self.refresh(chunksize=chunksize, full_refresh=True)
+        self._write_meta(meta)
+        return meta
+
+    def arrays(self, meta: dict = None):
+        """
+        (X, y, ids) of the cached rows as read-only memory maps, X encoded and unscaled.
+        """
+        meta = meta or self.read_meta()
+        rows = meta["rows"] if meta else 0
+        arrays = []
+        for name, (dtype, width) in self._files().items():
+            shape = (rows, width) if name == "X.f64" else (rows,)
+            arrays.append(np.memmap(self._file(name), dtype=dtype, mode="r", shape=shape) if rows
+                          else np.empty(shape, dtype=dtype))
+        return tuple(arrays)
+
+    def preprocessor(self, meta: dict = None) -> CarPricePreprocessor:
+        meta = meta or self.read_meta()
+        return CarPricePreprocessor.from_dict(meta["preprocessor"])
+
+    def load(self, chunksize: int = 50000, full_refresh: bool = False):
+        """
+        Refreshes the cache and returns (df, preprocessor, meta): df holds the preprocessed features
+        (scaled from the memory-mapped matrix in one pass), the target and the id, in keyset order.
+        Rows with a missing feature or target can't enter a fit and are left out of df, for every
+        training mode alike (they stay cached, meta counts them).
+        """
+        meta = self.refresh(chunksize=chunksize, full_refresh=full_refresh)
+        X, y, ids = self.arrays(meta)
+        preprocessor = self.preprocessor(meta) if meta["rows"] else CarPricePreprocessor(self.features)
+        X_scaled = preprocessor.scale_matrix(X) if meta["rows"] else np.empty((0, len(self.features)))
+
+        complete = ~np.isnan(X_scaled).any(axis=1) & ~np.isnan(y)
+        if not complete.all():
+            X_scaled, y, ids = X_scaled[complete], y[complete], ids[complete]
+
+        df = pd.DataFrame(X_scaled, columns=self.features, copy=False)
+        df[self.target] = y
+        df[self.id_column] = ids
+        return df, preprocessor, meta
@@ -0,0 +1,210 @@
+import json
+import os
+import numpy as np
+import pandas as pd
+from sklearn.linear_model import LinearRegression
+from modelling.preprocessing.preprocessor import CarPricePreprocessor
+from modelling.preprocessing.splitting_data import holdout_mask
+
+class OlsStatistics:
+    """
+    Sufficient statistics of an ordinary least squares fit: row count, means of the features and the
+    target, and the centered co-moments (X - mean)ᵀ(X - mean), (X - mean)ᵀ(y - mean), Σ(y - mean)².
+    Chunks are folded in one at a time and two statistics merge exactly (Chan et al. pairwise update),
+    so the fit over everything seen so far never needs the rows again. Centered moments keep the
+    solve well conditioned, unlike raw XᵀX on features such as odometer.
+    """
+    def __init__(self, n_features: int):
+        self.n = 0
+        self.mean_x = np.zeros(n_features)
+        self.mean_y = 0.0
+        self.cxx = np.zeros((n_features, n_features))
+        self.cxy = np.zeros(n_features)
+        self.cyy = 0.0
+
+    @classmethod
+    def from_arrays(cls, X: np.ndarray, y: np.ndarray) -> "OlsStatistics":
+        X = np.asarray(X, dtype=np.float64)
+        y = np.asarray(y, dtype=np.float64)
+        stats = cls(X.shape[1])
+        if len(y) == 0:
+            return stats
+        stats.n = len(y)
+        stats.mean_x = X.mean(axis=0)
+        stats.mean_y = float(y.mean())
+        dx = X - stats.mean_x
+        dy = y - stats.mean_y
+        stats.cxx = dx.T @ dx
+        stats.cxy = dx.T @ dy
+        stats.cyy = float(dy @ dy)
+        return stats
+
+    def update(self, X: np.ndarray, y: np.ndarray):
+        return self.merge(OlsStatistics.from_arrays(X, y))
+
+    def merge(self, other: "OlsStatistics"):
+        if other.n == 0:
+            return self
+        if self.n == 0:
+            self.n, self.mean_x, self.mean_y = other.n, other.mean_x.copy(), other.mean_y
+            self.cxx, self.cxy, self.cyy = other.cxx.copy(), other.cxy.copy(), other.cyy
+            return self
+
+        n = self.n + other.n
+        delta_x = other.mean_x - self.mean_x
+        delta_y = other.mean_y - self.mean_y
+        weight = self.n * other.n / n
+
+        self.cxx = self.cxx + other.cxx + weight * np.outer(delta_x, delta_x)
+        self.cxy = self.cxy + other.cxy + weight * delta_x * delta_y
+        self.cyy = self.cyy + other.cyy + weight * delta_y * delta_y
+        self.mean_x = self.mean_x + delta_x * other.n / n
+        self.mean_y = self.mean_y + delta_y * other.n / n
+        self.n = n
+        return self
+
+    def copy(self) -> "OlsStatistics":
+        return OlsStatistics(len(self.mean_x)).merge(self)
+
+    def solve(self):
+        """
+        Returns (coef, intercept) of the least squares fit on the raw features.
+        """
+        if self.n == 0:
+            raise ValueError("No rows to fit")
+        # lstsq gives the minimum norm solution when a feature is constant or collinear, like LinearRegression
+        coef = np.linalg.lstsq(self.cxx, self.cxy, rcond=None)[0]
+        intercept = self.mean_y - self.mean_x @ coef
+        return coef, float(intercept)
+
+    def scale(self) -> np.ndarray:
+        # Population standard deviation, 1 for a constant feature (like StandardScaler)
+        std = np.sqrt(np.diag(self.cxx) / self.n) if self.n else np.ones(len(self.mean_x))
+        return np.where(std == 0, 1.0, std)
+
+    def sse(self, coef: np.ndarray, intercept: float) -> float:
+        """
+        Sum of squared errors of (coef, intercept) over the rows of these statistics, without the rows.
+        """
+        bias = self.mean_y - intercept - self.mean_x @ coef
+        return float(self.cyy - 2 * coef @ self.cxy + coef @ self.cxx @ coef + self.n * bias * bias)
+
+    def to_dict(self) -> dict:
+        return {"n": self.n, "mean_x": self.mean_x.tolist(), "mean_y": self.mean_y,
+                "cxx": self.cxx.tolist(), "cxy": self.cxy.tolist(), "cyy": self.cyy}
+
+    @classmethod
+    def from_dict(cls, state: dict) -> "OlsStatistics":
+        stats = cls(len(state["mean_x"]))
+        stats.n, stats.mean_y, stats.cyy = state["n"], state["mean_y"], state["cyy"]
+        stats.mean_x = np.asarray(state["mean_x"], dtype=np.float64)
+        stats.cxx = np.asarray(state["cxx"], dtype=np.float64)
+        stats.cxy = np.asarray(state["cxy"], dtype=np.float64)
+        return stats
+
+def scaled_model(train: OlsStatistics, everything: OlsStatistics, features: list) -> LinearRegression:
+    """
+    The LinearRegression a full refit gives on StandardScaler-ed features (scaler fitted on every row,
+    model on the train rows), built from the statistics alone.
+    """
+    coef, intercept = train.solve()
+    mean, scale = everything.mean_x, everything.scale()
+
+    # y = b + c·x = (b + c·mean) + (c * scale)·((x - mean) / scale)
+    model = LinearRegression()
+    model.coef_ = coef * scale
+    model.intercept_ = intercept + coef @ mean
+    model.n_features_in_ = len(features)
+    model.feature_names_in_ = np.asarray(features, dtype=object)
+    return model
+
+class TrainingState:
+    """
+    What an incremental training run resumes from: the statistics of the train and test rows, the
+    preprocessing of the model (updated with partial_fit on the same rows) and the keyset cursor of
+    the last warehouse row folded in.
+    """
+    def __init__(self, features: list, target: str, test_size: float = 0.2):
+        self.features = features
+        self.target = target
+        self.test_size = test_size
+        self.train = OlsStatistics(len(features))
+        self.test = OlsStatistics(len(features))
+        self.preprocessor = CarPricePreprocessor(features)
+        self.cursor = None
+
+    def update(self, df: pd.DataFrame) -> int:
+        """
+        Folds a chunk of warehouse rows in, returns the number of rows used.
+        Rows with a missing feature or target can't enter the fit and are skipped.
+        """
+        df = df[self.features + [self.target, 'id_sales_nk']].dropna()
+        is_test = holdout_mask(df['id_sales_nk'], self.test_size)
+        X = df[self.features].to_numpy(dtype=np.float64)
+        y = df[self.target].to_numpy(dtype=np.float64)
+        self.train.update(X[~is_test], y[~is_test])
+        self.test.update(X[is_test], y[is_test])
+        if len(df):
+            self.preprocessor.partial_fit(df[self.features].astype(np.float64))
+        return len(df)
+
+    def everything(self) -> OlsStatistics:
+        return self.train.copy().merge(self.test)
+
+    def model(self) -> LinearRegression:
+        return scaled_model(self.train, self.everything(), self.features)
+
+    def metrics(self) -> dict:
+        """
+        MSE and R² of the model over the whole test set, from the test statistics.
+        """
+        coef, intercept = self.train.solve()
+        sse = self.test.sse(coef, intercept)
+        return {
+            "test_rows": self.test.n,
+            "mse": sse / self.test.n if self.test.n else None,
+            "r2": 1 - sse / self.test.cyy if self.test.cyy else None,
+        }
+
+    def to_dict(self) -> dict:
+        return {
+            "features": self.features,
+            "target": self.target,
+            "test_size": self.test_size,
+            "cursor": self.cursor,
+            "train": self.train.to_dict(),
+            "test": self.test.to_dict(),
+            "preprocessor": self.preprocessor.to_dict(),
+        }
+
+    @classmethod
+    def from_dict(cls, state: dict) -> "TrainingState":
+        if not state.get("preprocessor"):
+            raise ValueError("Training state without a preprocessor")
+        training = cls(state["features"], state["target"], state["test_size"])
+        training.cursor = state["cursor"]
+        training.train = OlsStatistics.from_dict(state["train"])
+        training.test = OlsStatistics.from_dict(state["test"])
+        training.preprocessor = CarPricePreprocessor.from_dict(state["preprocessor"])
+        return training
+
+def save_state(state: TrainingState, path: str):
+    # Write to a temporary file first, an interrupted save never leaves a truncated state
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    with open(f"{path}.tmp", "w") as f:
+        json.dump(state.to_dict(), f, indent=4, default=str)
+    os.replace(f"{path}.tmp", path)
+
+def load_state(path: str):
+    """
+    Returns the TrainingState saved at path, None when there is none or it is invalid (training
+    then starts over from the first warehouse row).
+    """
+    if not os.path.exists(path):
+        return None
+    try:
+        with open(path) as f:
+            return TrainingState.from_dict(json.load(f))
+    except (KeyError, ValueError) as e:
+        print(f"Ignoring invalid training state {path}, rebuilding it. Cause: {str(e)}")
+        return None
@@ -1,28 +1,61 @@
 import pandas as pd
-import joblib
 from sklearn.linear_model import LinearRegression
 from sklearn.metrics import mean_squared_error, mean_absolute_error, r2_score
 from datetime import datetime
-from helper.utils import etl_log
-from modelling.extract.extract_warehouse import extract_warehouse
-from modelling.preprocessing.preprocessing_data import process_preprocessing
+from helper.utils import etl_log, keyset_cursor, load_env
+from modelling.extract.extract_warehouse import extract_warehouse_incremental, KEYSET_COLUMNS
+from modelling.feature_store import FeatureStore
+from modelling.incremental_ols import TrainingState, load_state, save_state
+from modelling.preprocessing.preprocessing_data import PREPROCESSING_FILENAME
 from modelling.preprocessing.splitting_data import split_data
+from modelling.registry.model_registry import get_model_registry
 import os
+import tempfile
 
-def linear_regression():
-    # Load environment variables
-    load_dotenv()
+# Define features and target
+FEATURES = ['year', 'condition', 'odometer', 'mmr']
+TARGET = 'selling_price'
+
+# Name of the model in the model registry
+MODEL_NAME = "car_price_model"
+
+def save_model(model, metadata: dict, artifacts: dict = None):
+    """
+    Registers the model in the model registry, with metadata and artifacts ({filename: writer(path)},
+    each writer saving one file registered next to the model). Returns its ModelHandle.
+    """
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        extra_files = []
+        for filename, write in (artifacts or {}).items():
+            path = os.path.join(tmp_dir, filename)
+            write(path)
+            extra_files.append(path)
 
-    # Extract data from warehouse database
-    df = extract_warehouse(table_name="car_sales")
+        handle = get_model_registry().register(MODEL_NAME, model, metadata=metadata, extra_files=extra_files)
 
-    # Define features and target
-    features = ['year', 'condition', 'odometer', 'mmr']
-    target = 'selling_price'
+    # Log success message after saving model
+    log_msg = {
+        "step": "modelling",
+        "component": "save_model",
+        "status": "success",
+        "table_name": "car_sales",
+        "etl_date": datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+    }
+    etl_log(log_msg)
+    return handle
 
+def training_state_path() -> str:
+    return os.getenv('TRAINING_STATE_PATH', os.path.join('cache', 'training', 'car_price_model_stats.json'))
+
+def load_features(chunksize: int = None, full_refresh: bool = False) -> dict:
+    """
+    First step of the full and select modes: the preprocessed features from the feature store, which
+    reads only the warehouse rows added since the last run (a rerun on an unchanged warehouse
+    memory-maps the cached matrix). Returns the frame, its preprocessor and the feature store meta.
+    """
     try:
-        # Step 1: Preprocess
-        df_processed = process_preprocessing(df, features, target)
+        feature_store = FeatureStore("car_sales", FEATURES, TARGET)
+        df_processed, preprocessor, feature_meta = feature_store.load(chunksize=chunksize or 50000, full_refresh=full_refresh)
 
         # Log success message after preprocessing
         log_msg = {
@@ -33,21 +66,33 @@ def linear_regression():
             "etl_date": datetime.now().strftime("%Y-%m-%d %H:%M:%S")
         }
         etl_log(log_msg)
+        return {"data": df_processed, "preprocessor": preprocessor, "meta": feature_meta,
+                "feature_store": feature_store.config_hash}
 
-        # Step 2: Split data
-        X_train, X_test, y_train, y_test = split_data(df_processed, features, target)
-
-        # Log success message after splitting data
+    except Exception as e:
         log_msg = {
             "step": "modelling",
-            "component": "split_data",
-            "status": "success",
+            "component": "preprocess_data",
+            "status": "failed",
             "table_name": "car_sales",
-            "etl_date": datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+            "etl_date": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+            "error_msg": str(e)
         }
         etl_log(log_msg)
+        raise
+
+def fit_model(features: dict) -> dict:
+    """
+    Full mode: splits the features of load_features, fits a LinearRegression on the train rows and
+    evaluates it on the test rows. Returns what register_trained saves.
+    """
+    df_processed = features["data"]
+
+    try:
+        # Step 1: Split data on the id hash, the test set of incremental training
+        X_train, X_test, y_train, y_test = split_data(df_processed, FEATURES, TARGET, id_column='id_sales_nk')
 
-        # Step 3: Train model
+        # Step 2: Train model
         model = LinearRegression()
         model.fit(X_train, y_train)
 
@@ -61,11 +106,17 @@ def linear_regression():
         }
         etl_log(log_msg)
 
-        # Step 4: Evaluate
+        # Step 3: Evaluate
         y_pred = model.predict(X_test)
-        print("MAE:", mean_absolute_error(y_test, y_pred))
-        print("MSE:", mean_squared_error(y_test, y_pred))
-        print("R²:", r2_score(y_test, y_pred))
+        metrics = {
+            "test_rows": len(y_test),
+            "mae": float(mean_absolute_error(y_test, y_pred)),
+            "mse": float(mean_squared_error(y_test, y_pred)),
+            "r2": float(r2_score(y_test, y_pred)),
+        }
+        print("MAE:", metrics["mae"])
+        print("MSE:", metrics["mse"])
+        print("R²:", metrics["r2"])
 
         # Log success message after evaluation
         log_msg = {
@@ -77,38 +128,150 @@ def linear_regression():
         }
         etl_log(log_msg)
 
-        # Step 5: Save model and dump to minIo
-        model_filename = "car_price_model.pkl"
-        joblib.dump(model, model_filename)
-
-        # Upload the model to MinIO
-        client = Minio('localhost:9000',
-                    access_key=os.getenv('MINIO_ACCESS_KEY'),
-                    secret_key=os.getenv('MINIO_SECRET_KEY'),
-                    secure=False)
-        
-        # Make a bucket if it doesn't exist
-        bucket_name = "car_sales_modelling"
-        if not client.bucket_exists(bucket_name):
-            client.make_bucket(bucket_name)
-
-        # Save the model to the MinIO bucket 'models'
-        client.fput_object(bucket_name, model_filename, model_filename)
-
-        # Log success message after saving model
+        # The model, its preprocessing and the last warehouse row it was trained on
+        metadata = {
+            "mode": "full",
+            "features": FEATURES,
+            "target": TARGET,
+            "rows": len(df_processed),
+            "watermark": features["meta"]["cursor"],
+            "feature_store": features["feature_store"],
+            "metrics": metrics,
+        }
+        return {"model": model, "preprocessor": features["preprocessor"], "metadata": metadata}
+
+    except Exception as e:
         log_msg = {
             "step": "modelling",
-            "component": "save_model",
+            "component": "train_model",
+            "status": "failed",
+            "table_name": "car_sales",
+            "etl_date": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+            "error_msg": str(e)
+        }
+        etl_log(log_msg)
+        raise
+
+def accumulate_statistics(chunksize: int = None, full_refresh: bool = False) -> dict:
+    """
+    First step of the incremental mode: folds the warehouse rows after the saved keyset cursor into the
+    saved statistics (see modelling.incremental_ols), chunk by chunk, so a run costs the new rows and
+    memory doesn't depend on the table size. Rows updated in place in the warehouse after they were
+    folded in are not refolded, use full_refresh to rebuild the statistics.
+    """
+    try:
+        state = None if full_refresh else load_state(training_state_path())
+        state = state or TrainingState(FEATURES, TARGET)
+
+        new_rows = 0
+        columns = FEATURES + [TARGET, 'id_sales_nk']
+        for chunk in extract_warehouse_incremental("car_sales", cursor=state.cursor, chunksize=chunksize or 50000, columns=columns):
+            new_rows += state.update(chunk)
+            state.cursor = keyset_cursor(chunk, KEYSET_COLUMNS["car_sales"])
+
+        # Log success message after accumulating statistics
+        log_msg = {
+            "step": "modelling",
+            "component": "accumulate_statistics",
+            "status": "success",
+            "table_name": "car_sales",
+            "etl_date": datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        }
+        etl_log(log_msg)
+        return {"state": state, "new_rows": new_rows, "full_refresh": full_refresh}
+
+    except Exception as e:
+        log_msg = {
+            "step": "modelling",
+            "component": "accumulate_statistics",
+            "status": "failed",
+            "table_name": "car_sales",
+            "etl_date": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+            "error_msg": str(e)
+        }
+        etl_log(log_msg)
+        raise
+
+def solve_statistics(statistics: dict):
+    """
+    Incremental mode: solves the accumulated statistics for the model and evaluates it on the whole test
+    set. The coefficients equal a full refit on StandardScaler-ed features with the same hash-based
+    train/test split. Returns what register_trained saves, None when no row was added since the last
+    registered model.
+    """
+    state = statistics["state"]
+
+    try:
+        if statistics["new_rows"] == 0 and not statistics["full_refresh"] and get_model_registry().resolve(MODEL_NAME) is not None:
+            print("No new rows in the warehouse since the last training")
+            return None
+
+        # Step 1: Solve for the coefficients
+        model = state.model()
+
+        # Step 2: Evaluate on the whole test set, from its statistics
+        metrics = state.metrics()
+        print("MSE:", metrics["mse"])
+        print("R²:", metrics["r2"])
+
+        # Log success message after evaluation
+        log_msg = {
+            "step": "modelling",
+            "component": "evaluate_model",
             "status": "success",
             "table_name": "car_sales",
             "etl_date": datetime.now().strftime("%Y-%m-%d %H:%M:%S")
         }
         etl_log(log_msg)
 
+        metadata = {
+            "mode": "incremental",
+            "features": FEATURES,
+            "target": TARGET,
+            "rows": state.train.n + state.test.n,
+            "watermark": state.cursor,
+            "metrics": metrics,
+        }
+        return {"model": model, "preprocessor": state.preprocessor, "state": state, "metadata": metadata}
+
+    except Exception as e:
+        log_msg = {
+            "step": "modelling",
+            "component": "solve_statistics",
+            "status": "failed",
+            "table_name": "car_sales",
+            "etl_date": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+            "error_msg": str(e)
+        }
+        etl_log(log_msg)
+        raise
+
+def register_trained(trained: dict):
+    """
+    Last step of every mode: registers the trained model with its preprocessing and returns its
+    ModelHandle. An incremental model also gets the statistics it was solved from, saved locally once
+    registered (never ahead of the registered model). With trained None (nothing new to train on),
+    returns the latest registered model.
+    """
+    if trained is None:
+        return get_model_registry().resolve(MODEL_NAME)
+
+    try:
+        artifacts = {PREPROCESSING_FILENAME: trained["preprocessor"].save}
+        state = trained.get("state")
+        if state is not None:
+            state_path = training_state_path()
+            artifacts[os.path.basename(state_path)] = lambda path: save_state(state, path)
+
+        handle = save_model(trained["model"], trained["metadata"], artifacts=artifacts)
+        if state is not None:
+            save_state(state, state_path)
+        return handle
+
     except Exception as e:
         log_msg = {
             "step": "modelling",
-            "component": "linear_regression",
+            "component": "save_model",
             "status": "failed",
             "table_name": "car_sales",
             "etl_date": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
@@ -116,3 +279,27 @@ def linear_regression():
         }
         etl_log(log_msg)
         raise
+
+def linear_regression(mode: str = None, chunksize: int = None, full_refresh: bool = False):
+    """
+    Trains the car price model in one call, running the steps of the modelling graph in order. mode is
+    'full' (default, or TRAINING_MODE): refit on the whole warehouse table, whose preprocessed feature
+    matrix is kept up to date by the feature store, or 'incremental': fold only the rows added since
+    the last run into the saved statistics.
+    """
+    mode = mode or os.getenv('TRAINING_MODE', 'full')
+    if mode == 'incremental':
+        return train_incremental(chunksize=chunksize, full_refresh=full_refresh)
+
+    # Load environment variables
+    load_env()
+    return register_trained(fit_model(load_features(chunksize=chunksize, full_refresh=full_refresh)))
+
+def train_incremental(chunksize: int = None, full_refresh: bool = False):
+    """
+    Trains the model from accumulated sufficient statistics (accumulate_statistics, solve_statistics,
+    register_trained) and returns its ModelHandle.
+    """
+    # Load environment variables
+    load_env()
+    return register_trained(solve_statistics(accumulate_statistics(chunksize=chunksize, full_refresh=full_refresh)))
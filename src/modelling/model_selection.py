@@ -0,0 +1,238 @@
+import importlib
+import json
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+from multiprocessing import shared_memory
+import numpy as np
+import pandas as pd
+from sklearn.metrics import mean_squared_error, mean_absolute_error, r2_score
+from sklearn.model_selection import ParameterGrid
+from helper.utils import etl_log
+from modelling.linear_regression import FEATURES, TARGET, load_features, register_trained
+
+# Candidates are declared in this file unless MODEL_CANDIDATES_PATH points to another one
+DEFAULT_CANDIDATES_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "model_candidates.json")
+
+# Metrics of a fold, and whether a higher value is better
+METRICS = {"mse": False, "mae": False, "r2": True}
+
+def load_candidates(path: str = None) -> dict:
+    """
+    Returns the model selection config declared in path (MODEL_CANDIDATES_PATH or model_candidates.json),
+    with every candidate expanded into one entry per combination of its hyperparameters.
+    """
+    with open(path or os.getenv('MODEL_CANDIDATES_PATH', DEFAULT_CANDIDATES_PATH)) as f:
+        config = json.load(f)
+
+    candidates = []
+    for candidate in config["candidates"]:
+        if not candidate["estimator"].startswith("sklearn."):
+            raise ValueError(f"Only scikit-learn estimators can be candidates, got {candidate['estimator']}")
+        for params in ParameterGrid(candidate.get("params", {})):
+            candidates.append({"name": candidate["name"], "estimator": candidate["estimator"], "params": params})
+    if config.get("metric", "mse") not in METRICS:
+        raise ValueError(f"Unknown model selection metric {config['metric']}")
+    return dict(config, candidates=candidates)
+
+def make_estimator(estimator: str, params: dict):
+    module_name, class_name = estimator.rsplit(".", 1)
+    return getattr(importlib.import_module(module_name), class_name)(**params)
+
+def fold_ids(ids, n_folds: int) -> np.ndarray:
+    """
+    Fold of every row, from a hash of its id: a row stays in the same fold across runs, however many
+    rows were added since (like splitting_data.holdout_mask).
+    """
+    hashes = pd.util.hash_array(np.asarray(ids, dtype=np.int64))
+    return (hashes % np.uint64(n_folds)).astype(np.int8)
+
+class SharedArrays:
+    """
+    Arrays copied once into named shared memory blocks. Worker processes attach to the blocks by name
+    and read the arrays in place, instead of receiving a pickled copy with every task.
+    """
+    def __init__(self, arrays: dict):
+        self.blocks = {}
+        self.specs = {}
+        for name, array in arrays.items():
+            array = np.ascontiguousarray(array)
+            block = shared_memory.SharedMemory(create=True, size=max(array.nbytes, 1))
+            np.ndarray(array.shape, dtype=array.dtype, buffer=block.buf)[...] = array
+            self.blocks[name] = block
+            self.specs[name] = (block.name, array.shape, array.dtype.str)
+
+    def close(self):
+        for block in self.blocks.values():
+            block.close()
+            block.unlink()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+# Arrays of a worker process, attached once by _attach_worker
+_worker_arrays = {}
+_worker_blocks = []
+
+def _attach_worker(specs: dict):
+    # One process per core: the native thread pools (BLAS, OpenMP) of a worker get a single thread
+    from threadpoolctl import threadpool_limits
+    threadpool_limits(1)
+
+    for name, (block_name, shape, dtype) in specs.items():
+        block = shared_memory.SharedMemory(name=block_name)
+        _worker_blocks.append(block)
+        _worker_arrays[name] = np.ndarray(shape, dtype=dtype, buffer=block.buf)
+
+def evaluate_fold(task: tuple, arrays: dict = None) -> dict:
+    """
+    Fits candidate on every fold but fold and scores it on fold.
+    """
+    candidate_id, candidate, fold = task
+    arrays = arrays or _worker_arrays
+    X, y = arrays["X"], arrays["y"]
+    test = arrays["folds"] == fold
+
+    started = time.perf_counter()
+    model = make_estimator(candidate["estimator"], candidate["params"]).fit(X[~test], y[~test])
+    y_pred = model.predict(X[test])
+    return {
+        "candidate_id": candidate_id,
+        "fold": int(fold),
+        "mse": float(mean_squared_error(y[test], y_pred)),
+        "mae": float(mean_absolute_error(y[test], y_pred)),
+        "r2": float(r2_score(y[test], y_pred)),
+        "seconds": time.perf_counter() - started,
+    }
+
+def cross_validate(X: np.ndarray, y: np.ndarray, folds: np.ndarray, candidates: list, max_workers: int = None) -> list:
+    """
+    Scores every candidate on every fold and returns the results per candidate (fold metrics, their
+    mean and standard deviation). The (candidate, fold) fits run in a process pool, one per core by
+    default (MODEL_SELECTION_WORKERS), over the matrix shared through shared memory.
+    """
+    max_workers = max_workers or int(os.getenv('MODEL_SELECTION_WORKERS', os.cpu_count() or 1))
+    n_folds = int(folds.max()) + 1 if len(folds) else 0
+    # Costliest candidates first, so a slow fit doesn't start last and hold up the whole run
+    tasks = [(candidate_id, candidate, fold) for candidate_id, candidate in enumerate(candidates) for fold in range(n_folds)]
+    tasks.sort(key=lambda task: not task[1]["estimator"].startswith("sklearn.ensemble"))
+
+    if max_workers == 1:
+        fold_results = [evaluate_fold(task, arrays={"X": X, "y": y, "folds": folds}) for task in tasks]
+    else:
+        with SharedArrays({"X": X, "y": y, "folds": folds}) as shared:
+            with ProcessPoolExecutor(max_workers=max_workers, initializer=_attach_worker, initargs=(shared.specs,)) as executor:
+                fold_results = list(executor.map(evaluate_fold, tasks))
+
+    results = []
+    for candidate_id, candidate in enumerate(candidates):
+        folds_of = sorted((r for r in fold_results if r["candidate_id"] == candidate_id), key=lambda r: r["fold"])
+        result = dict(candidate, folds=folds_of)
+        for metric in METRICS:
+            values = np.asarray([r[metric] for r in folds_of])
+            result[metric] = float(values.mean())
+            result[f"{metric}_std"] = float(values.std())
+        result["seconds"] = float(sum(r["seconds"] for r in folds_of))
+        results.append(result)
+    return results
+
+def best_candidate(results: list, metric: str = "mse") -> dict:
+    key = (lambda result: -result[metric]) if METRICS[metric] else (lambda result: result[metric])
+    return min(results, key=key)
+
+def cross_validate_candidates(features: dict, candidates_path: str = None, max_workers: int = None) -> dict:
+    """
+    Select mode: scores the candidates of the model selection config with k-fold cross validation on
+    the features of load_features. Returns the config, the results per candidate and the seconds taken.
+    """
+    try:
+        # Rows with a missing feature or target are already left out by the feature store
+        df = features["data"]
+        X = df[FEATURES].to_numpy(dtype=np.float64)
+        y = df[TARGET].to_numpy(dtype=np.float64)
+        ids = df['id_sales_nk'].to_numpy()
+
+        config = load_candidates(candidates_path)
+        started = time.perf_counter()
+        results = cross_validate(X, y, fold_ids(ids, config["n_folds"]), config["candidates"], max_workers=max_workers)
+        for result in results:
+            print(f"{result['name']} {result['params']}: MSE {result['mse']:.1f} (±{result['mse_std']:.1f}), R² {result['r2']:.4f}")
+
+        # Log success message after cross validation
+        log_msg = {
+            "step": "modelling",
+            "component": "cross_validate",
+            "status": "success",
+            "table_name": "car_sales",
+            "etl_date": datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        }
+        etl_log(log_msg)
+        return {"config": config, "results": results, "seconds": time.perf_counter() - started}
+
+    except Exception as e:
+        log_msg = {
+            "step": "modelling",
+            "component": "cross_validate",
+            "status": "failed",
+            "table_name": "car_sales",
+            "etl_date": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+            "error_msg": str(e)
+        }
+        etl_log(log_msg)
+        raise
+
+def refit_best(features: dict, cv: dict) -> dict:
+    """
+    Select mode: refits the best candidate of cross_validate_candidates on every row. Returns what
+    register_trained saves, with the cross validation results of every candidate.
+    """
+    try:
+        df = features["data"]
+        X = df[FEATURES].to_numpy(dtype=np.float64)
+        y = df[TARGET].to_numpy(dtype=np.float64)
+        config, results = cv["config"], cv["results"]
+
+        best = best_candidate(results, config["metric"])
+        model = make_estimator(best["estimator"], best["params"]).fit(pd.DataFrame(X, columns=FEATURES, copy=False), y)
+        print(f"Best: {best['name']} {best['params']}")
+
+        metadata = {
+            "mode": "select",
+            "estimator": best["estimator"],
+            "params": best["params"],
+            "features": FEATURES,
+            "target": TARGET,
+            "rows": len(y),
+            "watermark": features["meta"]["cursor"],
+            "metrics": {"cv_folds": config["n_folds"], "mse": best["mse"], "mae": best["mae"], "r2": best["r2"]},
+            "cv_seconds": cv["seconds"],
+            "candidates": [{key: result[key] for key in ("name", "params", "mse", "mse_std", "mae", "r2", "seconds")}
+                           for result in results],
+        }
+        return {"model": model, "preprocessor": features["preprocessor"], "metadata": metadata}
+
+    except Exception as e:
+        log_msg = {
+            "step": "modelling",
+            "component": "refit_best",
+            "status": "failed",
+            "table_name": "car_sales",
+            "etl_date": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+            "error_msg": str(e)
+        }
+        etl_log(log_msg)
+        raise
+
+def select_model(chunksize: int = None, full_refresh: bool = False, candidates_path: str = None, max_workers: int = None):
+    """
+    Model selection in one call, running the steps of the select mode graph in order: load the
+    features, cross validate the candidates, refit the best one on every row and register it with
+    the cross validation results. Returns its ModelHandle.
+    """
+    features = load_features(chunksize=chunksize, full_refresh=full_refresh)
+    cv = cross_validate_candidates(features, candidates_path=candidates_path, max_workers=max_workers)
+    return register_trained(refit_best(features, cv))
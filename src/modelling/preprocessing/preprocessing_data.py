@@ -1,63 +1,46 @@
 import pandas as pd
-from sklearn.preprocessing import StandardScaler, LabelEncoder
 from datetime import datetime
 from helper.utils import etl_log  # Make sure this utility function is available
+from modelling.preprocessing.preprocessor import CarPricePreprocessor
 
-def process_preprocessing(df: pd.DataFrame, features: list, target: str) -> pd.DataFrame:
+# File name of the fitted preprocessing, registered next to the model and applied again at prediction time
+PREPROCESSING_FILENAME = "car_price_preprocessing.json"
+
+def process_preprocessing(df: pd.DataFrame, features: list, target: str, fitted: dict = None,
+                          preprocessor: CarPricePreprocessor = None) -> pd.DataFrame:
     """
-    Perform preprocessing: handle nulls, encoding, and scaling.
+    Perform preprocessing: encoding and scaling, with a CarPricePreprocessor.
 
     Steps:
-    1. Drop rows with '' or 'unknown' in features or target
-    2. Encode categorical columns
-    3. Scale numerical columns
+    1. Fit the preprocessor (or update it with partial_fit when one is given)
+    2. Encode categorical columns and scale numerical columns
+
+    Returns a new frame, df is left untouched. When fitted is given, the preprocessor is stored
+    in it (fitted["preprocessor"]), so it can be saved with the model and applied at prediction time.
     """
+    fitted = fitted if fitted is not None else {}
 
     try:
-        # Step 1: Drop rows containing '' or 'unknown'
-        # df = df[~df[features + [target]].isin(['', 'unknown']).any(axis=1)]
-        
-        # Log success message after cleaning missing data
-        # log_msg = {
-        #     "step": "modelling",
-        #     "component": "preprocessing_drop_rows",
-        #     "status": "success",
-        #     "table_name": "car_sales",
-        #     "etl_date": datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-        # }
-        # etl_log(log_msg)
+        # Step 1: Fit the preprocessing
+        if preprocessor is None:
+            preprocessor = CarPricePreprocessor(features).fit(df)
+        else:
+            preprocessor.partial_fit(df)
+        fitted["preprocessor"] = preprocessor
 
-        # Step 1: Encode categorical columns
-        categorical_cols = df[features].select_dtypes(include='object').columns.tolist()
-        for col in categorical_cols:
-            le = LabelEncoder()
-            df[col] = le.fit_transform(df[col])
-        
-        # Log success message after encoding categorical features
-        log_msg = {
-            "step": "modelling",
-            "component": "preprocessing_encode_categorical",
-            "status": "success",
-            "table_name": "car_sales",
-            "etl_date": datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-        }
-        etl_log(log_msg)
+        # Step 2: Encode categorical columns and scale numerical columns
+        df = preprocessor.transform_frame(df)
 
-        # Step 2: Scale numerical columns
-        numerical_cols = df[features].select_dtypes(include=['int64', 'float64']).columns.tolist()
-        scaler = StandardScaler()
-        df[numerical_cols] = scaler.fit_transform(df[numerical_cols])
-
-        # Log success message after scaling numerical features
+        # Log success message after encoding categorical features and scaling numerical features
         log_msg = {
             "step": "modelling",
-            "component": "preprocessing_scale_numerical",
+            "component": "preprocessing_transform",
             "status": "success",
             "table_name": "car_sales",
             "etl_date": datetime.now().strftime("%Y-%m-%d %H:%M:%S")
         }
         etl_log(log_msg)
-        
+
     except Exception as e:
         log_msg = {
             "step": "modelling",
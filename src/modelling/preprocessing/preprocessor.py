@@ -0,0 +1,210 @@
+import json
+import os
+import numpy as np
+import pandas as pd
+
+# Version of the preprocessing logic and of its saved format, bump it when either changes
+PREPROCESSOR_VERSION = 1
+
+class CarPricePreprocessor:
+    """
+    Fitted preprocessing of the car price model: label encoding of the categorical features and
+    standard scaling of the numerical ones, kept as one object that is saved next to the model and
+    applied again at prediction time.
+
+    Column roles are decided once, from the dtypes of the first frame fitted (object is categorical,
+    int64/float64 numerical, anything else passes through). Categorical columns are label encoded
+    and then scaled like the numerical ones, as process_preprocessing always did. partial_fit()
+    appends unseen categories to the vocabularies, so codes already given never change, and folds
+    the chunk into the scaler statistics (count, mean and sum of squared deviations per column,
+    merged exactly). fit() starts over with sorted vocabularies, like LabelEncoder.
+    """
+    def __init__(self, features: list):
+        self.features = list(features)
+        self._reset()
+
+    def _reset(self):
+        self.categorical = None
+        self.numerical = None
+        self.count = {}
+        self.mean = {}
+        self.m2 = {}
+        self.vocabulary = {}
+        self._codes = {}
+
+    def _resolve_columns(self, df: pd.DataFrame):
+        if self.categorical is None:
+            self.categorical = [col for col in self.features if df[col].dtype == object]
+            self.numerical = [col for col in self.features if df[col].dtype in (np.int64, np.float64)]
+            for col in self.categorical:
+                self.vocabulary[col] = []
+            for col in self.scaled:
+                self.count[col], self.mean[col], self.m2[col] = 0, 0.0, 0.0
+
+    def config(self) -> dict:
+        """
+        What the preprocessed values depend on besides the data, for the keys of caches holding them.
+        """
+        return {"class": type(self).__name__, "version": PREPROCESSOR_VERSION, "features": self.features,
+                "encoding": "label", "scaling": "standard"}
+
+    @property
+    def scaled(self) -> list:
+        return [col for col in self.features if col in self.numerical or col in self.categorical]
+
+    def fit(self, df: pd.DataFrame) -> "CarPricePreprocessor":
+        self._reset()
+        return self.partial_fit(df)
+
+    def partial_fit(self, df: pd.DataFrame) -> "CarPricePreprocessor":
+        """
+        Updates the statistics and vocabularies with a chunk of rows. Missing values are ignored.
+        """
+        self._resolve_columns(df)
+
+        for col in self.scaled:
+            if col in self.vocabulary:
+                values = self._encode(col, np.asarray(df[col]), extend=True)
+            else:
+                values = df[col].to_numpy(dtype=np.float64)
+            self._update_moments(col, values)
+        return self
+
+    def _update_moments(self, col: str, values: np.ndarray):
+        # Moments of the chunk, then the Chan et al. pairwise update of count, mean and sum of squared deviations
+        present = ~np.isnan(values)
+        if not present.all():
+            values = values[present]
+        n_b = len(values)
+        if n_b == 0:
+            return
+        mean_b = values.mean()
+        deviations = values - mean_b
+        m2_b = float(deviations @ deviations)
+
+        n_a = self.count[col]
+        n = n_a + n_b
+        delta = mean_b - self.mean[col]
+        self.m2[col] += m2_b + delta * delta * n_a * n_b / n
+        self.mean[col] += delta * n_b / n
+        self.count[col] = n
+
+    def _code_map(self, col: str) -> dict:
+        if col not in self._codes:
+            self._codes[col] = {value: code for code, value in enumerate(self.vocabulary[col])}
+        return self._codes[col]
+
+    def _encode(self, col: str, values: np.ndarray, out: np.ndarray = None, extend: bool = False) -> np.ndarray:
+        """
+        Codes of values in the vocabulary of col as float64 (NaN for a missing value). The values are
+        hashed once (factorize) and only their distinct values are looked up in the vocabulary.
+        With extend, unseen values are appended to it (sorted), otherwise they raise ValueError.
+        """
+        local_codes, uniques = pd.factorize(values)
+        codes = self._code_map(col)
+        unseen = [value for value in uniques if value not in codes]
+        if unseen and not extend:
+            raise ValueError(f"Unseen {col} values: {unseen[:5]}")
+        for value in sorted(unseen):
+            codes[value] = len(self.vocabulary[col])
+            self.vocabulary[col].append(value)
+
+        # -1 (missing) takes the NaN appended at the end of the lookup
+        lookup = np.append(np.fromiter((codes[value] for value in uniques), dtype=np.float64, count=len(uniques)), np.nan)
+        out = np.empty(len(local_codes), dtype=np.float64) if out is None else out
+        return np.take(lookup, local_codes, out=out)
+
+    def scale(self, col: str) -> float:
+        # Population standard deviation, 1 for a constant or unseen column (like StandardScaler)
+        std = np.sqrt(self.m2[col] / self.count[col]) if self.count.get(col) else 0.0
+        return float(std) if std > 0 else 1.0
+
+    def encode(self, df: pd.DataFrame) -> np.ndarray:
+        """
+        Feature matrix (rows x features, float64) before scaling: categories as their codes, other
+        columns as they are. df (a frame, a chunk or a dict of column arrays) is left untouched and
+        the only allocation is the output. An unseen category raises ValueError, a missing value is NaN.
+        """
+        if self.categorical is None:
+            raise ValueError("CarPricePreprocessor is not fitted")
+        n_rows = len(df) if isinstance(df, pd.DataFrame) else len(next(iter(df.values()), []))
+        X = np.empty((n_rows, len(self.features)), dtype=np.float64)
+        for j, col in enumerate(self.features):
+            values = np.asarray(df[col])
+            if col in self.vocabulary:
+                self._encode(col, values, out=X[:, j])
+            else:
+                np.copyto(X[:, j], values, casting="unsafe")
+        return X
+
+    def scale_matrix(self, X: np.ndarray, out: np.ndarray = None) -> np.ndarray:
+        """
+        Scales an encoded matrix, in one vectorized pass (in place with out=X).
+        """
+        mean = np.asarray([self.mean.get(col, 0.0) for col in self.features])
+        scale = np.asarray([self.scale(col) if col in self.mean else 1.0 for col in self.features])
+        out = np.subtract(X, mean, out=out)
+        out /= scale
+        return out
+
+    def transform(self, df: pd.DataFrame) -> np.ndarray:
+        """
+        Preprocessed feature matrix of a frame or chunk: encode() then scale_matrix() in place.
+        """
+        X = self.encode(df)
+        return self.scale_matrix(X, out=X)
+
+    def transform_frame(self, df: pd.DataFrame) -> pd.DataFrame:
+        """
+        df with its feature columns replaced by their preprocessed values, as a new frame.
+        """
+        X = self.transform(df)
+        return df.assign(**{col: X[:, j] for j, col in enumerate(self.features)})
+
+    def transform_records(self, records: list) -> np.ndarray:
+        """
+        Feature matrix of a list of records (dicts), for scoring requests without building a DataFrame.
+        """
+        columns = {col: np.asarray([record[col] for record in records],
+                                   dtype=object if col in self.vocabulary else np.float64)
+                   for col in self.features}
+        return self.transform(columns)
+
+    def to_dict(self) -> dict:
+        return {
+            "features": self.features,
+            "categorical": self.categorical,
+            "numerical": self.numerical,
+            # Scaling per feature (0 and 1 when the feature isn't scaled) and codes per categorical feature
+            "mean": [self.mean.get(col, 0.0) for col in self.features],
+            "scale": [self.scale(col) if col in self.mean else 1.0 for col in self.features],
+            "categories": self.vocabulary,
+            # Statistics partial_fit continues from
+            "count": [self.count.get(col, 0) for col in self.features],
+            "m2": [self.m2.get(col, 0.0) for col in self.features],
+        }
+
+    @classmethod
+    def from_dict(cls, state: dict) -> "CarPricePreprocessor":
+        preprocessor = cls(state["features"])
+        categories = state.get("categories", {})
+        preprocessor.categorical = state.get("categorical", list(categories))
+        preprocessor.numerical = state.get("numerical", [col for col in preprocessor.features if col not in categories])
+        preprocessor.vocabulary = {col: list(categories.get(col, [])) for col in preprocessor.categorical}
+        for j, col in enumerate(preprocessor.features):
+            if col in preprocessor.scaled:
+                preprocessor.mean[col] = float(state["mean"][j])
+                preprocessor.count[col] = int(state["count"][j])
+                preprocessor.m2[col] = float(state["m2"][j])
+        return preprocessor
+
+    def save(self, path: str):
+        # Write to a temporary file first, an interrupted save never leaves a truncated file
+        with open(f"{path}.tmp", "w") as f:
+            json.dump(self.to_dict(), f, indent=4, default=str)
+        os.replace(f"{path}.tmp", path)
+
+    @classmethod
+    def load(cls, path: str) -> "CarPricePreprocessor":
+        with open(path) as f:
+            return cls.from_dict(json.load(f))
@@ -1,11 +1,22 @@
 from sklearn.model_selection import train_test_split
+import numpy as np
 import pandas as pd
 from datetime import datetime
 from helper.utils import etl_log  # Make sure this utility function is available
 
-def split_data(df: pd.DataFrame, features: list, target: str, test_size=0.2, random_state=42):
+def holdout_mask(ids, test_size: float = 0.2) -> np.ndarray:
     """
-    Split dataset into train and test sets
+    True for the rows of the test set. Decided by a hash of the row id, so a row stays on the same
+    side across runs and an incremental fit sees the same split as a full one.
+    """
+    hashes = pd.util.hash_array(np.asarray(ids, dtype=np.int64))
+    return (hashes % np.uint64(10000)) < np.uint64(round(test_size * 10000))
+
+def split_data(df: pd.DataFrame, features: list, target: str, test_size=0.2, random_state=42, id_column: str = None):
+    """
+    Split dataset into train and test sets. With id_column, rows are split by holdout_mask on their
+    id (random_state is unused), the split incremental training uses, so both modes report metrics
+    on the same test set.
     """
     try:
         X = df[features]
@@ -21,6 +32,9 @@ def split_data(df: pd.DataFrame, features: list, target: str, test_size=0.2, ran
         }
         etl_log(log_msg)
         
+        if id_column:
+            is_test = holdout_mask(df[id_column], test_size)
+            return X[~is_test], X[is_test], y[~is_test], y[is_test]
         return train_test_split(X, y, test_size=test_size, random_state=random_state)
 
     except Exception as e:
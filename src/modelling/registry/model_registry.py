@@ -0,0 +1,267 @@
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+import threading
+from datetime import datetime
+import joblib
+
+# Models deserialized in this process, by content hash: a model is loaded once however often it's resolved
+_loaded = {}
+_loaded_lock = threading.Lock()
+
+def file_hash(path: str) -> str:
+    """
+    sha256 of the content of a file, read in blocks.
+    """
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+def object_key(content_hash: str) -> str:
+    return f"objects/{content_hash[:2]}/{content_hash}"
+
+def manifest_key(name: str, version: str) -> str:
+    return f"manifests/{name}/{version}.json"
+
+def ref_key(name: str, ref: str) -> str:
+    return f"refs/{name}/{ref}"
+
+class LocalBackend:
+    """
+    Registry storage in a local directory. Keys are relative paths, writes are atomic.
+    """
+    def __init__(self, root: str):
+        self.root = root
+
+    def path(self, key: str) -> str:
+        return os.path.join(self.root, *key.split("/"))
+
+    def exists(self, key: str) -> bool:
+        return os.path.exists(self.path(key))
+
+    def put_file(self, key: str, source: str):
+        target = self.path(key)
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+        shutil.copyfile(source, f"{target}.tmp")
+        os.replace(f"{target}.tmp", target)
+
+    def get_file(self, key: str, target: str):
+        shutil.copyfile(self.path(key), target)
+
+    def read_text(self, key: str):
+        try:
+            with open(self.path(key)) as f:
+                return f.read()
+        except FileNotFoundError:
+            return None
+
+    def write_text(self, key: str, text: str):
+        target = self.path(key)
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+        with open(f"{target}.tmp", "w") as f:
+            f.write(text)
+        os.replace(f"{target}.tmp", target)
+
+class MinioBackend:
+    """
+    Registry storage in a MinIO (S3) bucket, same keys as LocalBackend.
+    """
+    def __init__(self, bucket_name: str = None, client=None, prefix: str = "model_registry"):
+        from minio import Minio
+
+        self.bucket_name = bucket_name or os.getenv('MODEL_REGISTRY_BUCKET', 'car-sales-modelling')
+        self.prefix = prefix
+        self.client = client or Minio(os.getenv('MINIO_ENDPOINT', 'localhost:9000'),
+                                      access_key=os.getenv('MINIO_ACCESS_KEY'),
+                                      secret_key=os.getenv('MINIO_SECRET_KEY'),
+                                      secure=False)
+        self._bucket_checked = False
+
+    def _name(self, key: str) -> str:
+        return f"{self.prefix}/{key}"
+
+    def _ensure_bucket(self):
+        # Checked once per backend instead of before every upload
+        if not self._bucket_checked:
+            if not self.client.bucket_exists(self.bucket_name):
+                self.client.make_bucket(self.bucket_name)
+            self._bucket_checked = True
+
+    def exists(self, key: str) -> bool:
+        from minio.error import S3Error
+
+        try:
+            self.client.stat_object(self.bucket_name, self._name(key))
+            return True
+        except S3Error as e:
+            if e.code in ("NoSuchKey", "NoSuchBucket", "NoSuchObject"):
+                return False
+            raise
+
+    def put_file(self, key: str, source: str):
+        self._ensure_bucket()
+        self.client.fput_object(self.bucket_name, self._name(key), source)
+
+    def get_file(self, key: str, target: str):
+        self.client.fget_object(self.bucket_name, self._name(key), target)
+
+    def read_text(self, key: str):
+        from minio.error import S3Error
+
+        try:
+            response = self.client.get_object(self.bucket_name, self._name(key))
+        except S3Error as e:
+            if e.code in ("NoSuchKey", "NoSuchBucket", "NoSuchObject"):
+                return None
+            raise
+        try:
+            return response.read().decode()
+        finally:
+            response.close()
+            response.release_conn()
+
+    def write_text(self, key: str, text: str):
+        from io import BytesIO
+
+        self._ensure_bucket()
+        data = text.encode()
+        self.client.put_object(self.bucket_name, self._name(key), BytesIO(data), length=len(data),
+                               content_type="application/json")
+
+class ModelHandle:
+    """
+    A registered model version. The manifest is read on resolve, the artifacts are fetched and the
+    model deserialized only when first used.
+    """
+    def __init__(self, registry: "ModelRegistry", manifest: dict):
+        self.registry = registry
+        self.manifest = manifest
+
+    @property
+    def version(self) -> str:
+        return self.manifest["version"]
+
+    @property
+    def metadata(self) -> dict:
+        return self.manifest["metadata"]
+
+    @property
+    def model_path(self) -> str:
+        return self.registry.object_path(self.manifest["model"])
+
+    def artifact_path(self, filename: str) -> str:
+        """
+        Local path of an artifact registered with the model (e.g. its preprocessing).
+        """
+        return self.registry.object_path(self.manifest["artifacts"][filename])
+
+    @property
+    def model(self):
+        content_hash = self.manifest["model"]
+        with _loaded_lock:
+            if content_hash not in _loaded:
+                # Arrays are memory-mapped from the object file: loading doesn't copy them, and
+                # the workers of a prediction service share one page cache copy
+                _loaded[content_hash] = joblib.load(self.model_path, mmap_mode=self.registry.mmap_mode)
+            return _loaded[content_hash]
+
+class ModelRegistry:
+    """
+    Content-addressed model registry. The model (joblib, uncompressed so it can be memory-mapped) and
+    its artifacts are stored under the sha256 of their content, next to a manifest holding their hashes
+    and the metadata of the training (watermark, metrics, features). refs/<name>/latest points to the
+    last registered version.
+
+    Everything is kept in the local directory. With a remote backend (MinIO), objects missing from it
+    are uploaded and resolve() follows the remote ref, downloading only the objects not held locally.
+    """
+    def __init__(self, root: str = None, remote=None, mmap_mode: str = "r"):
+        self.local = LocalBackend(root or os.getenv('MODEL_REGISTRY_DIR', 'model_registry'))
+        self.remote = remote
+        self.mmap_mode = mmap_mode
+
+    def object_path(self, content_hash: str) -> str:
+        key = object_key(content_hash)
+        if not self.local.exists(key):
+            if self.remote is None:
+                raise FileNotFoundError(f"Object {content_hash} is not in the model registry")
+            os.makedirs(os.path.dirname(self.local.path(key)), exist_ok=True)
+            self.remote.get_file(key, f"{self.local.path(key)}.tmp")
+            os.replace(f"{self.local.path(key)}.tmp", self.local.path(key))
+        return self.local.path(key)
+
+    def _store(self, path: str) -> str:
+        # Content addressed: an object already stored (locally or remotely) is never written again
+        content_hash = file_hash(path)
+        key = object_key(content_hash)
+        if not self.local.exists(key):
+            self.local.put_file(key, path)
+        if self.remote is not None and not self.remote.exists(key):
+            self.remote.put_file(key, path)
+        return content_hash
+
+    def register(self, name: str, model, metadata: dict = None, extra_files: list = None) -> ModelHandle:
+        """
+        Stores model and extra_files, writes the manifest and moves the latest ref to it.
+        """
+        os.makedirs(self.local.root, exist_ok=True)
+        with tempfile.TemporaryDirectory(dir=self.local.root) as tmp_dir:
+            model_file = os.path.join(tmp_dir, f"{name}.joblib")
+            joblib.dump(model, model_file)
+            model_hash = self._store(model_file)
+        artifacts = {os.path.basename(path): self._store(path) for path in extra_files or []}
+
+        content = {"name": name, "model": model_hash, "artifacts": artifacts, "metadata": metadata or {}}
+        version = hashlib.sha256(json.dumps(content, sort_keys=True, default=str).encode()).hexdigest()[:16]
+        manifest = dict(content, version=version, created_at=datetime.now().strftime("%Y-%m-%d %H:%M:%S"))
+        manifest_text = json.dumps(manifest, indent=4, default=str)
+
+        # Manifest before ref, a reader never follows a ref to a missing manifest
+        for backend in [self.local] + ([self.remote] if self.remote is not None else []):
+            backend.write_text(manifest_key(name, version), manifest_text)
+            backend.write_text(ref_key(name, "latest"), version)
+        return ModelHandle(self, manifest)
+
+    def resolve(self, name: str, ref: str = "latest"):
+        """
+        Returns the ModelHandle of a version (or ref) of name, None when nothing is registered.
+        """
+        version = ref
+        if ref == "latest":
+            version = self.remote.read_text(ref_key(name, ref)) if self.remote is not None else None
+            version = (version or self.local.read_text(ref_key(name, ref)) or "").strip()
+            if not version:
+                return None
+
+        manifest_text = self.local.read_text(manifest_key(name, version))
+        if manifest_text is None and self.remote is not None:
+            manifest_text = self.remote.read_text(manifest_key(name, version))
+            if manifest_text is not None:
+                self.local.write_text(manifest_key(name, version), manifest_text)
+        return ModelHandle(self, json.loads(manifest_text)) if manifest_text is not None else None
+
+    def load(self, name: str, ref: str = "latest"):
+        handle = self.resolve(name, ref)
+        if handle is None:
+            raise FileNotFoundError(f"No model {name} ({ref}) in the model registry")
+        return handle.model
+
+_registry = None
+
+def get_model_registry() -> ModelRegistry:
+    """
+    The registry of this process, in MODEL_REGISTRY_DIR, mirrored to MinIO when MODEL_REGISTRY_BACKEND=minio.
+    """
+    global _registry
+    if _registry is None:
+        backend = os.getenv('MODEL_REGISTRY_BACKEND', 'local')
+        _registry = ModelRegistry(remote=MinioBackend() if backend == 'minio' else None)
+    return _registry
+
+def set_model_registry(registry: ModelRegistry):
+    global _registry
+    _registry = registry
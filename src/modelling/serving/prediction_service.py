@@ -0,0 +1,327 @@
+import argparse
+import json
+import os
+import signal
+import sys
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+import joblib
+import numpy as np
+import pandas as pd
+from helper.utils import load_env
+from modelling.preprocessing.preprocessing_data import PREPROCESSING_FILENAME
+from modelling.preprocessing.preprocessor import CarPricePreprocessor
+from modelling.registry.model_registry import get_model_registry
+
+class Predictor:
+    """
+    The model and its fitted preprocessing, loaded once. predict() takes a batch of car records
+    (dicts holding the model features) and scores them in one vectorized call.
+    """
+    def __init__(self, model, preprocessor: CarPricePreprocessor):
+        self.model = model
+        # Registry version of the model, None when loaded from a file
+        self.version = None
+        self.preprocessor = preprocessor
+        self.features = preprocessor.features
+
+        # A linear model is scored as one matrix product, without the per-call overhead of predict()
+        self.linear = hasattr(model, "coef_") and hasattr(model, "intercept_")
+
+    @classmethod
+    def load(cls, model_path: str, preprocessing_path: str) -> "Predictor":
+        return cls(joblib.load(model_path, mmap_mode="r"), CarPricePreprocessor.load(preprocessing_path))
+
+    @classmethod
+    def from_registry(cls, name: str, ref: str = "latest") -> "Predictor":
+        """
+        Loads a registered model (by default the latest) with the preprocessing registered with it.
+        """
+        handle = get_model_registry().resolve(name, ref)
+        if handle is None:
+            raise FileNotFoundError(f"No model {name} ({ref}) in the model registry")
+        predictor = cls(handle.model, CarPricePreprocessor.load(handle.artifact_path(PREPROCESSING_FILENAME)))
+        predictor.version = handle.version
+        return predictor
+
+    def features_matrix(self, records: list) -> np.ndarray:
+        # Encoding with the training vocabularies, an unseen category is an error (400)
+        return self.preprocessor.transform_records(records)
+
+    def predict(self, records: list) -> np.ndarray:
+        X = self.features_matrix(records)
+        if self.linear:
+            return X @ np.asarray(self.model.coef_, dtype=np.float64) + float(self.model.intercept_)
+        return self.model.predict(pd.DataFrame(X, columns=self.features))
+
+class LatencyStats:
+    """
+    Latency percentiles over the last window requests and throughput since start.
+    """
+    def __init__(self, window: int = 10000):
+        self.latencies = deque(maxlen=window)
+        self.requests = 0
+        self.records = 0
+        self.batches = 0
+        self.batched_records = 0
+        self.started = time.time()
+        self._lock = threading.Lock()
+
+    def record_request(self, seconds: float, n_records: int):
+        with self._lock:
+            self.latencies.append(seconds)
+            self.requests += 1
+            self.records += n_records
+
+    def record_batch(self, n_records: int):
+        with self._lock:
+            self.batches += 1
+            self.batched_records += n_records
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            latencies = np.asarray(self.latencies) * 1000
+            elapsed = time.time() - self.started
+            return {
+                "pid": os.getpid(),
+                "requests": self.requests,
+                "records": self.records,
+                "batches": self.batches,
+                "mean_batch_size": round(self.batched_records / self.batches, 2) if self.batches else 0,
+                "p50_ms": round(float(np.percentile(latencies, 50)), 3) if len(latencies) else None,
+                "p99_ms": round(float(np.percentile(latencies, 99)), 3) if len(latencies) else None,
+                "requests_per_sec": round(self.requests / elapsed, 1) if elapsed else 0,
+                "records_per_sec": round(self.records / elapsed, 1) if elapsed else 0,
+            }
+
+class MicroBatcher:
+    """
+    Groups the records of concurrent requests into one predict call. A batch is closed when it holds
+    max_batch records or when its first request has waited max_wait seconds (the latency budget).
+    """
+    def __init__(self, predictor: Predictor, max_batch: int = 256, max_wait: float = 0.001, stats: LatencyStats = None):
+        self.predictor = predictor
+        self.max_batch = max_batch
+        self.max_wait = max_wait
+        self.stats = stats or LatencyStats()
+        self._pending = deque()
+        self._cond = threading.Condition()
+        self._closed = False
+        self._worker = threading.Thread(target=self._run, name="micro-batcher", daemon=True)
+        self._worker.start()
+
+    def submit(self, records: list) -> Future:
+        if not isinstance(records, list):
+            raise ValueError(f"records must be a list, got {type(records).__name__}")
+        future = Future()
+        with self._cond:
+            self._pending.append((records, future))
+            self._cond.notify()
+        return future
+
+    def predict(self, records: list) -> list:
+        return self.submit(records).result()
+
+    def close(self):
+        with self._cond:
+            self._closed = True
+            self._cond.notify()
+        self._worker.join()
+
+    def _next_batch(self) -> list:
+        with self._cond:
+            while not self._pending and not self._closed:
+                self._cond.wait()
+            if not self._pending:
+                return []
+
+            # Wait for more requests until the batch is full or the oldest one used up its budget
+            deadline = time.monotonic() + self.max_wait
+            while sum(len(records) for records, _ in self._pending) < self.max_batch and not self._closed:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                self._cond.wait(remaining)
+
+            batch, size = [], 0
+            while self._pending and (not batch or size + len(self._pending[0][0]) <= self.max_batch):
+                records, future = self._pending.popleft()
+                batch.append((records, future))
+                size += len(records)
+            return batch
+
+    def _run(self):
+        while True:
+            batch = self._next_batch()
+            if not batch:
+                return
+            try:
+                self._predict_batch(batch)
+            except Exception as e:
+                # The worker must never die, whatever went wrong fails the requests of this batch only
+                for _, future in batch:
+                    if not future.done():
+                        future.set_exception(e)
+
+    def _predict_batch(self, batch: list):
+        records = [record for request_records, _ in batch for record in request_records]
+        try:
+            predictions = self.predictor.predict(records).tolist()
+        except Exception as e:
+            # One bad record fails its batch, score the requests one by one to isolate it
+            if len(batch) > 1:
+                for request_records, future in batch:
+                    try:
+                        future.set_result(self.predictor.predict(request_records).tolist())
+                    except Exception as request_error:
+                        future.set_exception(request_error)
+            else:
+                batch[0][1].set_exception(e)
+            return
+        self.stats.record_batch(len(records))
+        start = 0
+        for request_records, future in batch:
+            future.set_result(predictions[start:start + len(request_records)])
+            start += len(request_records)
+
+def parse_records(body: bytes) -> list:
+    """
+    Records of a request body: a single record, a list of records or {"records": [...]}.
+    Raises ValueError for anything else (a number, null, a list holding something other than objects).
+    """
+    payload = json.loads(body)
+    if isinstance(payload, dict):
+        payload = payload["records"] if "records" in payload else [payload]
+    if not isinstance(payload, list) or not all(isinstance(record, dict) for record in payload):
+        raise ValueError("expected a record, a list of records or {\"records\": [...]}")
+    return payload
+
+class PredictionHandler(BaseHTTPRequestHandler):
+    # Keep-alive connections, a client doesn't pay a TCP handshake per request
+    protocol_version = "HTTP/1.1"
+    # Headers and body are separate writes, Nagle + delayed ACK would add ~40 ms to every response
+    disable_nagle_algorithm = True
+
+    def _send_json(self, status: int, payload):
+        body = json.dumps(payload).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        if self.path == "/stats":
+            self._send_json(200, self.server.stats.snapshot())
+        elif self.path == "/health":
+            self._send_json(200, {"status": "ok", "model_version": self.server.predictor.version})
+        else:
+            self._send_json(404, {"error": "not found"})
+
+    def do_POST(self):
+        if self.path != "/predict":
+            self._send_json(404, {"error": "not found"})
+            return
+        started = time.perf_counter()
+        try:
+            records = parse_records(self.rfile.read(int(self.headers.get("Content-Length", 0))))
+            predictions = self.server.batcher.predict(records)
+        except (ValueError, KeyError, TypeError) as e:
+            self._send_json(400, {"error": f"{type(e).__name__}: {e}"})
+            return
+        except Exception as e:
+            self._send_json(500, {"error": f"{type(e).__name__}: {e}"})
+            return
+        self.server.stats.record_request(time.perf_counter() - started, len(records))
+        self._send_json(200, {"predictions": predictions})
+
+    def log_message(self, format, *args):
+        # One line per request would cost more than the prediction itself
+        pass
+
+class PredictionServer(ThreadingHTTPServer):
+    daemon_threads = True
+    # Several worker processes can bind the same port, the kernel spreads the connections
+    allow_reuse_port = True
+    # Room for many clients connecting at once, the socketserver default of 5 resets them
+    request_queue_size = 128
+
+    def __init__(self, address, predictor: Predictor, max_batch: int = 256, max_wait: float = 0.001):
+        super().__init__(address, PredictionHandler)
+        self.predictor = predictor
+        self.stats = LatencyStats()
+        self.batcher = MicroBatcher(predictor, max_batch=max_batch, max_wait=max_wait, stats=self.stats)
+
+    def handle_error(self, request, client_address):
+        # A client closing its keep-alive connection is not an error
+        if isinstance(sys.exc_info()[1], (ConnectionResetError, BrokenPipeError)):
+            return
+        super().handle_error(request, client_address)
+
+    def server_close(self):
+        super().server_close()
+        self.batcher.close()
+
+def run_server(host: str, port: int, model_path: str, preprocessing_path: str, max_batch: int, max_wait: float,
+               model_name: str = "car_price_model", ref: str = "latest"):
+    if model_path:
+        predictor = Predictor.load(model_path, preprocessing_path)
+    else:
+        predictor = Predictor.from_registry(model_name, ref)
+    server = PredictionServer((host, port), predictor, max_batch=max_batch, max_wait=max_wait)
+    try:
+        server.serve_forever()
+    finally:
+        server.server_close()
+
+def serve(host: str = "127.0.0.1", port: int = 8000, model_path: str = None, preprocessing_path: str = None,
+          workers: int = 1, max_batch: int = None, max_wait_ms: float = None,
+          model_name: str = "car_price_model", ref: str = "latest"):
+    """
+    Serves POST /predict, GET /stats and GET /health. The model is model_name at ref in the model
+    registry, unless model_path (and its preprocessing_path) is given. With workers > 1, that many
+    processes share the port (SO_REUSEPORT), each with its own batcher and /stats, and the
+    memory-mapped model arrays are shared through the page cache.
+    """
+    max_batch = max_batch or int(os.getenv('SERVE_MAX_BATCH', 256))
+    max_wait = (max_wait_ms if max_wait_ms is not None else float(os.getenv('SERVE_MAX_WAIT_MS', 1))) / 1000
+    args = (host, port, model_path, preprocessing_path, max_batch, max_wait, model_name, ref)
+    if workers <= 1:
+        run_server(*args)
+        return
+
+    import multiprocessing
+    processes = [multiprocessing.Process(target=run_server, args=args, daemon=True) for _ in range(workers)]
+    for process in processes:
+        process.start()
+
+    # Stop the workers too when this process is terminated
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+    try:
+        for process in processes:
+            process.join()
+    finally:
+        for process in processes:
+            process.terminate()
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Car price prediction service")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--name", default="car_price_model", help="model name in the model registry")
+    parser.add_argument("--ref", default="latest", help="registered version to serve")
+    parser.add_argument("--model", help="serve this model file instead of a registered model")
+    parser.add_argument("--preprocessing", help="preprocessing file of --model")
+    parser.add_argument("--workers", type=int, default=1)
+    parser.add_argument("--max-batch", type=int, help="records per predict call (SERVE_MAX_BATCH, default 256)")
+    parser.add_argument("--max-wait-ms", type=float, help="latency budget of a batch (SERVE_MAX_WAIT_MS, default 1)")
+    args = parser.parse_args(argv)
+    load_env()
+    serve(args.host, args.port, args.model, args.preprocessing, args.workers, args.max_batch, args.max_wait_ms,
+          args.name, args.ref)
+
+if __name__ == "__main__":
+    main()
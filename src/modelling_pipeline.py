@@ -1,19 +1,60 @@
+from modelling.linear_regression import load_features, fit_model, accumulate_statistics, solve_statistics, register_trained
+from modelling.model_selection import cross_validate_candidates, refit_best
+from helper.dag import Task, run_dag
+from helper.utils import load_env
+import os
 
-from modelling.extract.extract_warehouse import extract_warehouse
-from modelling.preprocessing.preprocessing_data import process_preprocessing
-from modelling.preprocessing.splitting_data import split_data
+def modelling_tasks(mode: str = None, chunksize: int = None, full_refresh: bool = False) -> list:
+    """
+    Declares the modelling pipeline as a graph for mode (TRAINING_MODE, default 'full'):
+    full:        load_features -> fit_model -> save_model
+    select:      load_features -> cross_validate -> refit_best -> save_model
+    incremental: accumulate_statistics -> solve_model -> save_model
+    The data and training tasks, the long ones, time out after TRAINING_TIMEOUT seconds (default one
+    hour), save_model after the run default. A resumed run whose registration failed only registers again.
+    """
+    mode = mode or os.getenv('TRAINING_MODE', 'full')
+    timeout = float(os.getenv('TRAINING_TIMEOUT', 3600))
+    kwargs = {"chunksize": chunksize, "full_refresh": full_refresh}
 
-TARGET_COL = selling_price
-TEST_SIZE = 0.2
+    if mode == 'incremental':
+        return [
+            # Fold the new warehouse rows into the saved statistics
+            Task("accumulate_statistics", accumulate_statistics, kwargs=kwargs, timeout=timeout),
 
+            # Solve and evaluate the model from the statistics
+            Task("solve_model", solve_statistics, inputs={"statistics": "accumulate_statistics"}, timeout=timeout),
 
-df_wh = extract_warehouse(table_name = WH_TABLE_NAME)
+            # Register the model with its preprocessing and statistics
+            Task("save_model", register_trained, inputs={"trained": "solve_model"}),
+        ]
 
+    # Preprocessed features from the feature store
+    tasks = [Task("load_features", load_features, kwargs=kwargs, timeout=timeout)]
+    if mode == 'select':
+        tasks += [
+            # Cross validate the candidate models, across a process pool of its own
+            Task("cross_validate", cross_validate_candidates, inputs={"features": "load_features"}, timeout=timeout),
 
-# preprocessing data
-df_wh = process_preprocessing(data = df_wh)
+            # Refit the best candidate on every row
+            Task("refit_best", refit_best, inputs={"features": "load_features", "cv": "cross_validate"}, timeout=timeout),
+        ]
+        trained = "refit_best"
+    else:
+        # Split, fit and evaluate
+        tasks.append(Task("fit_model", fit_model, inputs={"features": "load_features"}, timeout=timeout))
+        trained = "fit_model"
 
-# splitting data
-X_train, X_test, y_train, y_test = split_data(data = df_wh,
-                                                        target_col = TARGET_COL,
-                                                        test_size = TEST_SIZE)
\ No newline at end of file
+    # Register the model with its preprocessing
+    tasks.append(Task("save_model", register_trained, inputs={"trained": trained}))
+    return tasks
+
+def modelling_pipeline(mode: str = None, chunksize: int = None, full_refresh: bool = False, default_timeout: float = None):
+    """
+    Runs the modelling pipeline and returns the DagResult (timings and critical path).
+    The steps form a chain, so they run one at a time on a thread: the results passed between them
+    (the feature frame, the training statistics) are never copied to another process.
+    """
+    load_env()
+    return run_dag(modelling_tasks(mode, chunksize, full_refresh), max_workers=1, executor="thread",
+                   default_timeout=default_timeout, step="modelling")
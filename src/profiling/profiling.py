@@ -1,97 +1,276 @@
 import pandas as pd
+import numpy as np
 import json
 import os
 from datetime import datetime
-from dotenv import load_dotenv
-from sqlalchemy import create_engine
-from helper.utils import etl_log
+from helper.utils import etl_log, load_env, keyset_cursor, read_keyset_pages
+from helper.dag import Task, run_dag
+from helper.streaming import run_streaming
 from staging.extract.extract_api import extract_api
 from staging.extract.extract_spreadsheet import extract_sheet
-from staging.extract.extract_db import extract_database
-
-def extract_all_sources():
-    """Extract data from all sources and return combined dictionary."""
-    combined_data = {}
-
-    # Extract from database
-    df_car_sales = extract_database(table_name="car_sales")
-    combined_data["db_car_sales"] = df_car_sales
-
-    # Extract from API
-    df_api = extract_api(
-        link_api="https://raw.githubusercontent.com/Kurikulum-Sekolah-Pacmann/us_states_data/refs/heads/main/us_states.json",
-        list_parameter={},
-        data_name="regions"
-    )
-    combined_data["api_us_state"] = df_api
-
-    # Extract from Spreadsheet
-    spreadsheet_key = os.getenv("KEY_SPREADSHEET")
-    worksheet_name = "brand_car"
-    df_sheet = extract_sheet(spreadsheet_key, worksheet_name)
-    combined_data["sheet_brand_car"] = df_sheet
-
-    return combined_data
-
-def table_shapes(data):
-    return {table: df.shape for table, df in data.items()}
-
-def column_types(data):
-    return {table: {col: str(df[col].dtype) for col in df.columns} for table, df in data.items()}
-
-def unique_values(data):
-    target_columns = ['state', 'body', 'color', 'interior']
-    result = {}
-
-    # Only check unique values for the database data (db_car_sales)
-    if "db_car_sales" in data:
-        df = data["db_car_sales"]
-        result["db_car_sales"] = {}
-        for col in target_columns:
-            result["db_car_sales"][col] = df[col].unique().tolist() if col in df.columns else []
-    return result
-
-def missing_value_percent(data):
-    result = {}
-    for table, df in data.items():
-        result[table] = {}
+from staging.extract.extract_db import extract_database_chunks, KEYSET_COLUMNS
+from profiling.sketches import HyperLogLog, SpaceSaving, QuantileSketch
+
+US_STATE_API = "https://raw.githubusercontent.com/Kurikulum-Sekolah-Pacmann/us_states_data/refs/heads/main/us_states.json"
+
+# Values counted as missing next to NULL
+MISSING_VALUES = ['', '—']
+
+# Columns whose distinct values are listed in the report, per source
+UNIQUE_VALUE_COLUMNS = {"db_car_sales": ['state', 'body', 'color', 'interior']}
+
+QUANTILE_PROBS = [0.0, 0.01, 0.25, 0.5, 0.75, 0.99, 1.0]
+
+OUTPUT_DIR = os.path.join("profiling", "output_profiling")
+
+class ColumnProfile:
+    """
+    Mergeable profile of one column: missing counts, distinct count (HyperLogLog), most frequent values
+    (Space-Saving) and, for numeric columns, a quantile sketch. Its size doesn't depend on the row count.
+    """
+    def __init__(self, dtype: str = None, top_k: int = None):
+        self.dtype = dtype
+        self.count = 0
+        self.nulls = 0
+        self.missing = dict.fromkeys(MISSING_VALUES, 0)
+        self.distinct = HyperLogLog()
+        self.top = SpaceSaving(top_k or int(os.getenv('PROFILE_TOP_K', 256)))
+        self.quantiles = None
+
+    def update(self, values: pd.Series):
+        dtype = str(values.dtype)
+        self.dtype = dtype if self.dtype is None else _merge_dtypes(self.dtype, dtype)
+
+        # One hash pass per chunk: every other statistic comes from the value counts
+        value_counts = values.value_counts(dropna=True)
+        if pd.api.types.is_datetime64_any_dtype(values):
+            value_counts.index = value_counts.index.astype(str)
+
+        self.count += len(values)
+        self.nulls += len(values) - int(value_counts.sum())
+        for marker in MISSING_VALUES:
+            self.missing[marker] += int(value_counts.get(marker, 0)) if value_counts.index.dtype == object else 0
+
+        self.distinct.add(value_counts.index.to_numpy())
+        self.top.update(value_counts)
+
+        if pd.api.types.is_numeric_dtype(values) and not pd.api.types.is_bool_dtype(values):
+            if self.quantiles is None:
+                self.quantiles = QuantileSketch()
+            self.quantiles.add(values.to_numpy(dtype=np.float64, na_value=np.nan))
+
+    def merge(self, other: "ColumnProfile"):
+        self.dtype = other.dtype if self.dtype is None else _merge_dtypes(self.dtype, other.dtype)
+        self.count += other.count
+        self.nulls += other.nulls
+        for marker in MISSING_VALUES:
+            self.missing[marker] += other.missing[marker]
+        self.distinct.merge(other.distinct)
+        self.top.merge(other.top)
+        if other.quantiles is not None:
+            self.quantiles = other.quantiles if self.quantiles is None else self.quantiles.merge(other.quantiles)
+        return self
+
+    def distinct_count(self) -> int:
+        # Exact while the top-k summary holds every value
+        if self.top.floor == 0 and len(self.top.counts) < self.top.k:
+            return len(self.top.counts)
+        return self.distinct.count()
+
+    def missing_percent(self) -> float:
+        if self.count == 0:
+            return 0.0
+        return round(float((self.nulls + sum(self.missing.values())) / self.count * 100), 2)
+
+    def to_dict(self) -> dict:
+        return {
+            "dtype": self.dtype,
+            "count": self.count,
+            "nulls": self.nulls,
+            "missing": self.missing,
+            "distinct": self.distinct.to_dict(),
+            "top": self.top.to_dict(),
+            "quantiles": self.quantiles.to_dict() if self.quantiles is not None else None,
+        }
+
+    @classmethod
+    def from_dict(cls, state: dict) -> "ColumnProfile":
+        profile = cls(state["dtype"])
+        profile.count, profile.nulls, profile.missing = state["count"], state["nulls"], state["missing"]
+        profile.distinct = HyperLogLog.from_dict(state["distinct"])
+        profile.top = SpaceSaving.from_dict(state["top"])
+        if state["quantiles"] is not None:
+            profile.quantiles = QuantileSketch.from_dict(state["quantiles"])
+        return profile
+
+def _merge_dtypes(left: str, right: str) -> str:
+    # A column that is numeric in every chunk stays numeric (int64 + float64 -> float64), anything else is object
+    if left == right:
+        return left
+    left_dtype, right_dtype = pd.api.types.pandas_dtype(left), pd.api.types.pandas_dtype(right)
+    if all(pd.api.types.is_numeric_dtype(dtype) and not pd.api.types.is_bool_dtype(dtype) for dtype in (left_dtype, right_dtype)):
+        try:
+            return str(np.result_type(left_dtype, right_dtype))
+        except TypeError:
+            return "float64"
+    return "object"
+
+class TableProfile:
+    """
+    Mergeable profile of one table, built one chunk at a time. Profiles of different chunks of the
+    same table (parallel workers, earlier runs) merge into the profile of all of them.
+    """
+    def __init__(self):
+        self.rows = 0
+        self.columns = {}
+        # Keyset cursor of the last profiled row, for tables profiled incrementally
+        self.cursor = None
+
+    def update(self, df: pd.DataFrame):
+        self.rows += len(df)
         for col in df.columns:
-            # Include '' and '—' as missing value
-            missing_mask = df[col].isnull() | (df[col] == '') | (df[col] == '—')
-            missing_percentage = round(float(missing_mask.mean() * 100), 2)
-            result[table][col] = missing_percentage
-    return result
+            self.columns.setdefault(col, ColumnProfile()).update(df[col])
+        return self
+
+    def merge(self, other: "TableProfile"):
+        self.rows += other.rows
+        for col, profile in other.columns.items():
+            if col in self.columns:
+                self.columns[col].merge(profile)
+            else:
+                self.columns[col] = profile
+        return self
+
+    def report(self, unique_columns: list = None) -> dict:
+        """
+        Report of the table in the profiling report format, plus the sketch results.
+        """
+        return {
+            "shape": (self.rows, len(self.columns)),
+            "data_types": {col: profile.dtype for col, profile in self.columns.items()},
+            # Complete while a column has fewer distinct values than PROFILE_TOP_K, most frequent first
+            "unique_values": {col: [value for value, _ in self.columns[col].top.top()] if col in self.columns else []
+                              for col in unique_columns or []},
+            "missing_percentage": {col: profile.missing_percent() for col, profile in self.columns.items()},
+            "distinct_count": {col: profile.distinct_count() for col, profile in self.columns.items()},
+            "top_values": {col: profile.top.top(10) for col, profile in self.columns.items()},
+            "quantiles": {col: dict(zip([str(prob) for prob in QUANTILE_PROBS], profile.quantiles.quantiles(QUANTILE_PROBS)))
+                          for col, profile in self.columns.items() if profile.quantiles is not None},
+        }
+
+    def to_dict(self) -> dict:
+        return {"rows": self.rows, "cursor": self.cursor,
+                "columns": {col: profile.to_dict() for col, profile in self.columns.items()}}
+
+    @classmethod
+    def from_dict(cls, state: dict) -> "TableProfile":
+        profile = cls()
+        profile.rows = state["rows"]
+        profile.cursor = state.get("cursor")
+        profile.columns = {col: ColumnProfile.from_dict(column) for col, column in state["columns"].items()}
+        return profile
+
+def source_chunks(source: str, chunksize: int, cursor: dict = None):
+    """
+    Chunks of one source. car_sales is read from the source database in keyset pages, the full history
+    or only the rows after cursor. The small API and spreadsheet sources come whole, as a single chunk.
+    """
+    if source == "db_car_sales":
+        if cursor is not None:
+            return read_keyset_pages('source', "car_sales", KEYSET_COLUMNS["car_sales"], cursor=cursor, page_size=chunksize)
+        return extract_database_chunks(table_name="car_sales", chunksize=chunksize, full_refresh=True)
+    if source == "api_us_state":
+        return iter([extract_api(link_api=US_STATE_API, list_parameter={}, data_name="regions")])
+    if source == "sheet_brand_car":
+        return iter([extract_sheet(os.getenv("KEY_SPREADSHEET"), "brand_car")])
+    raise ValueError(f"Unknown profiling source {source}")
+
+def profile_chunks(chunks, key_columns: list = None) -> TableProfile:
+    """
+    Profiles a stream of chunks in a single pass, the next chunk is extracted while one is profiled.
+    With key_columns (chunks in keyset order), the profile keeps the cursor of the last row.
+    """
+    profile = TableProfile()
+
+    def update(chunk: pd.DataFrame):
+        profile.update(chunk)
+        if key_columns and not chunk.empty:
+            profile.cursor = keyset_cursor(chunk, key_columns)
 
+    run_streaming((chunk for chunk in chunks if chunk is not None), update)
+    return profile
 
-def profile_report():
-    data = extract_all_sources()
+def profile_source(source: str, chunksize: int, cursor: dict = None) -> TableProfile:
+    key_columns = KEYSET_COLUMNS["car_sales"] if source == "db_car_sales" else None
+    return profile_chunks(source_chunks(source, chunksize, cursor), key_columns)
 
+def merge_profiles(profiles: list) -> TableProfile:
+    """
+    Combines partial profiles of the same table into one.
+    """
+    merged = TableProfile()
+    for profile in profiles:
+        merged.merge(profile)
+    return merged
+
+def save_profiles(profiles: dict, path: str):
+    """
+    Saves the mergeable state of profiles (source -> TableProfile) as JSON.
+    """
+    with open(path, "w") as f:
+        json.dump({source: profile.to_dict() for source, profile in profiles.items()}, f, default=str)
+
+def load_profiles(path: str) -> dict:
+    with open(path) as f:
+        return {source: TableProfile.from_dict(state) for source, state in json.load(f).items()}
+
+def build_report(profiles: dict) -> dict:
     report = {
         "person_in_charge": "Reza",
         "date_profiling": str(datetime.now()),
         "result": {}
     }
+    for table, profile in profiles.items():
+        report["result"][table] = profile.report(UNIQUE_VALUE_COLUMNS.get(table))
+    return report
 
-    shape_result = table_shapes(data)
-    type_result = column_types(data)
-    unique_result = unique_values(data)
-    missing_result = missing_value_percent(data)
-
-    for table in data.keys():
-        report["result"][table] = {
-            "shape": shape_result[table],
-            "data_types": type_result[table],
-            "unique_values": unique_result.get(table, {}),
-            "missing_percentage": missing_result[table]
-        }
+def profile_report(chunksize: int = None, previous: str = None):
+    """
+    Profiles every source in bounded memory, the sources concurrently. With previous (a state file
+    saved by an earlier run), car_sales is profiled incrementally: only the rows after the cursor of
+    the previous profile are read, and their profile is merged into it. Rows updated in place since
+    are not profiled again. The API and spreadsheet sources are small snapshots, profiled whole.
+    """
+    chunksize = chunksize or int(os.getenv('PROFILE_CHUNKSIZE', 50000))
+    sources = ["db_car_sales", "api_us_state", "sheet_brand_car"]
+
+    # Only a previous car_sales profile that knows where it stopped can be extended without counting rows twice
+    previous_car_sales = load_profiles(previous).get("db_car_sales") if previous else None
+    if previous_car_sales is not None and previous_car_sales.cursor is None:
+        print(f"{previous} has no car_sales cursor, profiling the full history instead")
+        previous_car_sales = None
+    cursors = {"db_car_sales": previous_car_sales.cursor if previous_car_sales else None}
+
+    result = run_dag([Task(source, profile_source, kwargs={"source": source, "chunksize": chunksize, "cursor": cursors.get(source)})
+                      for source in sources])
+    profiles = {source: result.results[source] for source in sources}
+
+    if previous_car_sales is not None:
+        increment = profiles["db_car_sales"]
+        profiles["db_car_sales"] = merge_profiles([previous_car_sales, increment])
+        profiles["db_car_sales"].cursor = increment.cursor or previous_car_sales.cursor
+
+    report = build_report(profiles)
 
-    # Save JSON
-    os.makedirs("profiling/output_profiling", exist_ok=True)
-    output_path = os.path.join("profiling/output_profiling", "car_sales_profiling_report.json")
+    # Save JSON, and the mergeable state next to it
+    os.makedirs(OUTPUT_DIR, exist_ok=True)
+    output_path = os.path.join(OUTPUT_DIR, "car_sales_profiling_report.json")
     with open(output_path, "w") as f:
-        json.dump(report, f, indent=4)
+        json.dump(report, f, indent=4, default=str)
+    save_profiles(profiles, os.path.join(OUTPUT_DIR, "car_sales_profiling_state.json"))
 
     return report
 
-# Run it
-profile_report()
+if __name__ == "__main__":
+    load_env()
+    profile_report()
@@ -1,10 +1,37 @@
 import pandas as pd
-from dotenv import load_dotenv
-import requests
 from datetime import datetime
 from helper.utils import etl_log
+from helper.dim_cache import dimension_cache
+from helper.http_client import conditional_get, request_key, response_validator, json_records_frame
+
+def download_api(link_api: str, list_parameter: dict, data_name: str) -> pd.DataFrame:
+    """
+    Downloads the records under data_name, revalidating the cached copy with a conditional GET.
+    A 304 (resource unchanged) skips both the download and the JSON parsing.
+    """
+    # One cached copy per request, a new URL or new parameters never revalidate the old copy
+    cache_name = f"api.{data_name}.{request_key(link_api, list_parameter)}"
+    meta = dimension_cache.read_meta(cache_name)
+
+    # Send the ETag / Last-Modified the cached copy was downloaded with
+    resp = conditional_get(link_api, params=list_parameter, validator=meta["validator"] if meta else None)
+    if resp.status_code == 304:
+        df_cached = dimension_cache.load(cache_name)
+        if df_cached is not None:
+            return df_cached
+
+        # Cached copy lost or corrupted, download it again
+        resp = conditional_get(link_api, params=list_parameter)
+
+    # Parse the response JSON into a DataFrame of the records under data_name
+    df_api = json_records_frame(resp.json(), data_name)
+    if df_api.empty:
+        return df_api
+    return dimension_cache.store(cache_name, df_api, response_validator(resp))
 
 def extract_api(link_api:str, list_parameter:dict, data_name:str) -> pd.DataFrame:
+    from requests.exceptions import RequestException
+
     log_msg = {
         "step": "staging",
         "component": "extract_api",
@@ -13,36 +40,26 @@ def extract_api(link_api:str, list_parameter:dict, data_name:str) -> pd.DataFram
     }
 
     try:
-        # Establish connection to API        
-        resp = requests.get(link_api, params=list_parameter)
-        resp.raise_for_status()  # Raises error if status is not 200
-
-        # Parse the response JSON
-        raw_response = resp.json()
-
-        # Convert the JSON data to a pandas DataFrame        
-        df_api = pd.DataFrame(raw_response)
-
-        # Convert the key into a list and return it as a DataFrame
-        df_result = pd.DataFrame(df_api[data_name].tolist())
+        # Download and parse only when the resource changed since the cached copy
+        df_result = download_api(link_api, list_parameter, data_name)
 
         # create success log message
         log_msg["status"] = "success"
         return df_result
 
-    except requests.exceptions.RequestException as e:
+    except RequestException as e:
         # create fail log message        
         print(f"API request error: {e}")
         log_msg["status"] = "failed"
         log_msg["error_msg"] = str(e)
-        return pd.DataFrame()
+        raise
 
     except ValueError as e:
         # create fail log message        
         print(f"JSON parsing error: {e}")
         log_msg["status"] = "failed"
         log_msg["error_msg"] = str(e)
-        return pd.DataFrame()
+        raise
 
     finally:
         etl_log(log_msg)
\ No newline at end of file
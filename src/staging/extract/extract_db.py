@@ -1,43 +1,46 @@
 import pandas as pd
-from sqlalchemy import text 
-import sqlalchemy
-from helper.utils import get_db_connection, etl_log, read_etl_log, read_sql
+from helper.utils import etl_log, read_keyset_pages
+from helper.checkpoint import read_checkpoint, checkpoint_cursor
 from datetime import datetime
+import os
 
-def extract_database(table_name: str) -> pd.DataFrame:
+# Composite keyset used for incremental extraction, per source table
+KEYSET_COLUMNS = {
+    "car_sales": ["created_at", "id_sales"],
+}
+
+def extract_cursor(table_name: str, full_refresh: bool = False):
     """
-    Extracts all data from the source database.
+    Returns the keyset cursor to resume table_name from, or None for a full extraction.
     """
-    try:
-        conn = get_db_connection('source')
-        
-        # Get the latest etl_date from the log table
-        filter_log = {
-            "step": "staging",
-            "component": "load",
-            "status": "success",
-            "table_name": table_name
-        }
-        etl_date = read_etl_log(filter_log)
+    # FULL_REFRESH=true forces a full reload without touching the code
+    if full_refresh or os.getenv('FULL_REFRESH', 'false').lower() in ('1', 'true', 'yes'):
+        return None
+    # Checkpoint committed by the last successful staging load of table_name
+    checkpoint = read_checkpoint('staging', "staging", "load", table_name)
+    return checkpoint_cursor(checkpoint, KEYSET_COLUMNS[table_name])
 
-        # If no previous extraction has been recorded (etl_date is empty), set etl_date to '1111-01-01' indicating the initial load.
-        # Otherwise, retrieve data added since the last successful extraction (etl_date).
-        # Set etl_date for incremental extraction
-        if etl_date.empty or etl_date['latest_etl_date'][0] is None:
-            etl_date = '1111-01-01'
-        else:
-            etl_date = etl_date['latest_etl_date'][0]
+def extract_database(table_name: str, full_refresh: bool = False, page_size: int = 50000) -> pd.DataFrame:
+    """
+    Extracts the rows added to the source database since the last successful staging load.
+
+    Rows are read with keyset pagination on (created_at, id_sales), starting after the cursor saved by
+    the last load. With full_refresh the whole table is extracted.
+    Rows whose created_at is NULL can't be ordered on the keyset and only come in with a full refresh.
+    """
+    try:
+        cursor = extract_cursor(table_name, full_refresh)
 
-        # Constructs a SQL query to select all columns from the specified table_name
-        #  where created_at is greater than etl_date.
+        # Constructs a SQL query to select the next page of rows after the cursor
         """
         SELECT * 
         FROM car_sales 
+        WHERE (created_at, id_sales) > (:last_created_at, :last_id_sales)
+        ORDER BY created_at, id_sales
+        LIMIT :page_size
         """
-        # WHERE created_at > :etl_date
-        query = sqlalchemy.text(read_sql(table_name))
-        # df = pd.read_sql(sql=query, con=conn, params={"etl_date": etl_date})
-        df = pd.read_sql(sql=query, con=conn, params={})
+        pages = list(read_keyset_pages('source', table_name, KEYSET_COLUMNS[table_name], cursor=cursor, page_size=page_size))
+        df = pd.concat(pages, ignore_index=True) if pages else pd.DataFrame()
 
         # Log success
         log_msg = {
@@ -61,5 +64,34 @@ def extract_database(table_name: str) -> pd.DataFrame:
             "error_msg": str(e)
         }
         print(e)
+        raise
+    finally:
+        etl_log(log_msg)
+
+
+def extract_database_chunks(table_name: str, chunksize: int = 50000, full_refresh: bool = False):
+    """
+    Extracts the rows added to the source database since the last successful staging load,
+    as a stream of keyset pages of at most chunksize rows.
+    """
+    log_msg = {
+        "step": "staging",
+        "component": "extract_database",
+        "table_name": table_name,
+    }
+    try:
+        cursor = extract_cursor(table_name, full_refresh)
+        yield from read_keyset_pages('source', table_name, KEYSET_COLUMNS[table_name], cursor=cursor, page_size=chunksize)
+
+        # Log success once the whole table has been streamed
+        log_msg["status"] = "success"
+    except Exception as e:
+        # Log failure
+        log_msg["status"] = "failed"
+        log_msg["error_msg"] = str(e)
+        raise
     finally:
-        etl_log(log_msg)
\ No newline at end of file
+        # A consumer that stops early closes the generator, nothing was extracted in full
+        log_msg.setdefault("status", "failed")
+        log_msg["etl_date"] = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        etl_log(log_msg)
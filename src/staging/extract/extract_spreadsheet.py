@@ -1,50 +1,134 @@
 import pandas as pd
 from helper.utils import etl_log
+from helper.dim_cache import dimension_cache, content_hash
 from datetime import datetime
-import gspread
-from google.auth.transport.requests import Request
-from google.auth import load_credentials_from_file
 import os
+import threading
+
+# Authorized client shared by every extract of the process
+_client = None
+_client_lock = threading.Lock()
 
 def auth_gspread():
     """
-    Authenticates with Google Sheets API.
+    Authenticates with Google Sheets API. The Google clients are imported here, on first use.
     """
+    import gspread
+    from google.auth import load_credentials_from_file
+
     scope = ['https://spreadsheets.google.com/feeds', 'https://www.googleapis.com/auth/drive']
     
     #Define your credentials
     credentials, project = load_credentials_from_file(os.getenv('CRED_PATH'), scopes=scope)
     return gspread.authorize(credentials)
 
-def init_key_file(key_file:str):
+def get_gspread_client():
+    """
+    Returns the shared authorized client, created on first use. The credentials keep their access
+    token and refresh it only when it expires, so the key file is read and authorized once per process.
+    """
+    global _client
+    if _client is None:
+        with _client_lock:
+            if _client is None:
+                _client = auth_gspread()
+    return _client
+
+def set_gspread_client(client):
+    """
+    Replaces the shared client (e.g. a fake client), None to authorize again on next use.
+    """
+    global _client
+    with _client_lock:
+        _client = client
+
+def init_key_file(key_file:str, client=None):
     #define credentials to open the file
-    gc = auth_gspread()
+    gc = client or get_gspread_client()
     
     #open spreadsheet file by key
     sheet_result = gc.open_by_key(key_file)
     
     return sheet_result
 
-def extract_sheet(key_file: str, worksheet_name: str) -> pd.DataFrame:
+def sheet_revision(client, key_file: str) -> dict:
+    """
+    Revision of the spreadsheet: its last modification time, a single Drive metadata request.
+    """
+    return {"modified_time": client.get_file_drive_metadata(key_file)["modifiedTime"]}
+
+def values_frame(values: list, created_at: str) -> pd.DataFrame:
+    """
+    Builds the DataFrame of worksheet rows, the first row holding the column names.
+    """
+    if not values:
+        return pd.DataFrame()
+
+    # Set first row as columns, the rest are the values (padded like get_all_values)
+    header = values[0]
+    rows = [row + [''] * (len(header) - len(row)) for row in values[1:]]
+    df_result = pd.DataFrame(rows, columns=header)
+
+    # Add the 'created_at' column with the extraction datetime
+    df_result['created_at'] = created_at
+    return df_result
+
+def appended_rows(values: list, df_cached: pd.DataFrame):
+    """
+    Returns the worksheet rows appended after the cached snapshot, or None when the sheet changed
+    in another way (header or any cached row edited, rows deleted). The cached range is compared
+    by content hash, so an edit made together with an append is caught too.
+    """
+    header = list(df_cached.columns[:-1])
+    if not values or list(values[0]) != header or len(values) - 1 < len(df_cached):
+        return None
+
+    # Pad like values_frame, the API leaves out trailing empty cells
+    rows = [row + [''] * (len(header) - len(row)) for row in values[1:]]
+    cached_range = pd.DataFrame(rows[:len(df_cached)], columns=header)
+    if content_hash(cached_range) != content_hash(df_cached.iloc[:, :-1]):
+        return None
+    return rows[len(df_cached):]
+
+def download_sheet(sheet_result, worksheet_name: str, df_cached: pd.DataFrame = None) -> pd.DataFrame:
+    """
+    Downloads the worksheet in one request. When rows were only appended to the cached snapshot,
+    the cached rows keep their created_at and only the new rows get the extraction time.
+    """
+    worksheet_result = sheet_result.worksheet(worksheet_name)
+    created_at = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+    values = worksheet_result.get_all_values()
+
+    if df_cached is not None and not df_cached.empty and df_cached.columns[-1] == 'created_at':
+        rows = appended_rows(values, df_cached)
+        if rows is not None:
+            return pd.concat([df_cached, values_frame([values[0]] + rows, created_at)], ignore_index=True)
+
+    return values_frame(values, created_at)
+
+def extract_sheet(key_file: str, worksheet_name: str, client=None) -> pd.DataFrame:
     """
     Extracts data from a Google Sheet.
+    An unchanged spreadsheet is served from the dimension cache after one metadata request,
+    rows appended since the cached snapshot keep the created_at of the cached rows.
     """
     try:
-        # init sheet
-        sheet_result = init_key_file(key_file)
-        
-        worksheet_result = sheet_result.worksheet(worksheet_name)
-        
-        df_result = pd.DataFrame(worksheet_result.get_all_values())
-        
-        # set first rows as columns
-        df_result.columns = df_result.iloc[0]
-        
-        # get all the rest of the values
-        df_result = df_result[1:].copy()
-
-        # Add the 'created_at' column with the current datetime
-        df_result['created_at'] = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        client = client or get_gspread_client()
+        cache_name = f"sheet.{worksheet_name}"
+
+        # An unchanged revision is served from the dimension cache (created_at included)
+        revision = sheet_revision(client, key_file)
+        df_result = dimension_cache.load(cache_name) if dimension_cache.is_fresh(cache_name, revision) else None
+
+        if df_result is None:
+            # Snapshot to extend with the appended rows, unless it is older than the cache max age
+            df_cached = dimension_cache.load(cache_name) if dimension_cache.age(cache_name) < dimension_cache.max_age else None
+
+            # init sheet
+            sheet_result = init_key_file(key_file, client)
+            df_result = download_sheet(sheet_result, worksheet_name, df_cached)
+            if not df_result.empty:
+                df_result = dimension_cache.store(cache_name, df_result, revision)
 
         # Log success
         log_msg = {
@@ -69,5 +153,6 @@ def extract_sheet(key_file: str, worksheet_name: str) -> pd.DataFrame:
             "error_msg": str(e)
         }
         print(e)
+        raise
     finally:
         etl_log(log_msg)
\ No newline at end of file
@@ -1,9 +1,23 @@
+import os
 import pandas as pd
 
-def transform_datatype_car_sales(df: pd.DataFrame) -> pd.DataFrame:
+# Numeric columns staged as varchar, unless the typed staging mode is on
+NUMERIC_COLUMNS = ["year", "condition", "odometer", "mmr", "sellingprice"]
+
+def staging_typed() -> bool:
+    """
+    Typed staging mode (STAGING_TYPED=true): numeric columns keep their source types.
+    Needs the staging car_sales columns migrated with staging_data/migrations/001_typed_car_sales.sql.
+    """
+    return os.getenv('STAGING_TYPED', 'false').lower() in ('1', 'true', 'yes')
+
+def transform_datatype_car_sales(df: pd.DataFrame, typed: bool = None) -> pd.DataFrame:
     """
     Transforms car_sales data according to the source-to-target mapping.
+    With typed (default: STAGING_TYPED), numeric columns stay numeric instead of being cast to varchar.
     """
+    if typed is None:
+        typed = staging_typed()
 
     # Define the columns to keep
     selected_columns = [
@@ -14,6 +28,11 @@ def transform_datatype_car_sales(df: pd.DataFrame) -> pd.DataFrame:
     # Select only the necessary columns
     df = df[selected_columns].copy()
 
+    if typed:
+        # Keep native types, year as a nullable integer so a missing year doesn't turn the column into floats
+        df["year"] = pd.to_numeric(df["year"]).astype("Int64")
+        return df
+
     # Apply transformations
     df["year"] = df["year"].astype(str)
     df["condition"] = df["condition"].astype(str)
@@ -1,25 +1,91 @@
-from staging.extract.extract_db import extract_database
+from staging.extract.extract_db import extract_database, extract_database_chunks, KEYSET_COLUMNS
 from staging.extract.extract_api import extract_api
 from staging.extract.extract_spreadsheet import extract_sheet
 from staging.load.load_staging import load_staging
-from staging.transform.transform_car_sales import transform_car_sales
+from staging.transform.transform_car_sales import transform_datatype_car_sales
+from helper.streaming import run_streaming
+from helper.dag import Task, run_dag
+from helper.utils import keyset_cursor, load_env
+from helper.checkpoint import make_checkpoint
 from datetime import datetime
 import os
 
-def staging_pipeline():
-    # Extract data from database
-    df_car_sales = extract_database(table_name="car_sales")
+US_STATE_API = "https://raw.githubusercontent.com/Kurikulum-Sekolah-Pacmann/us_states_data/refs/heads/main/us_states.json"
 
-    # Extract data from api
-    df_us_state = extract_api(link_api="https://raw.githubusercontent.com/Kurikulum-Sekolah-Pacmann/us_states_data/refs/heads/main/us_states.json", list_parameter="", data_name="regions")
+def transform_car_sales(df_car_sales):
+    # Nothing new in the source since the last run
+    if df_car_sales is None or df_car_sales.empty:
+        return None
+    return transform_datatype_car_sales(df_car_sales)
 
-    # Extract data from spreadsheet
-    df_car_brand = extract_sheet(key_file=os.getenv('KEY_SPREADSHEET'), worksheet_name="brand_car")
+def load_car_sales(tf_df_car_sales, df_car_sales):
+    if tf_df_car_sales is None:
+        return None
 
-    # Transform car sales data from database
-    tf_df_car_sales = transform_car_sales(df_car_sales)
-    
-    # Load data into staging (except last column, created_at)
-    load_staging(data=tf_df_car_sales, schema='public', table_name='car_sales', idx_name='id_sales')
-    load_staging(data=df_us_state, schema='public', table_name='us_state', idx_name='id_state')
-    load_staging(data=df_car_brand, schema='public', table_name='car_brand', idx_name='brand_car_id')
\ No newline at end of file
+    # Watermark of the extracted rows, committed together with them
+    checkpoint = make_checkpoint("staging", "load", "car_sales",
+                                 cursor=keyset_cursor(df_car_sales, KEYSET_COLUMNS["car_sales"]),
+                                 key_columns=KEYSET_COLUMNS["car_sales"])
+
+    return load_staging(data=tf_df_car_sales, schema='public', table_name='car_sales', idx_name='id_sales', checkpoint=checkpoint)
+
+def load_car_sales_chunk(df_car_sales):
+    # Transform and load one chunk of car sales data
+    return load_car_sales(transform_car_sales(df_car_sales), df_car_sales)
+
+def stream_car_sales(chunksize: int, full_refresh: bool = False):
+    # Extract, transform and load car sales chunk by chunk
+    return run_streaming(extract_database_chunks(table_name="car_sales", chunksize=chunksize, full_refresh=full_refresh), load_car_sales_chunk)
+
+def staging_tasks(chunksize: int = None, full_refresh: bool = False) -> list:
+    """
+    Declares the staging pipeline as a graph: the three sources are extracted independently
+    and each table is loaded as soon as its own data is ready. The car_sales tasks, the long ones,
+    time out after CAR_SALES_TIMEOUT seconds (default one hour), the others after the run default.
+    """
+    timeout = float(os.getenv('CAR_SALES_TIMEOUT', 3600))
+    tasks = [
+        # Extract data from api
+        Task("extract_us_state", extract_api,
+             kwargs={"link_api": US_STATE_API, "list_parameter": "", "data_name": "regions"}),
+
+        # Extract data from spreadsheet
+        Task("extract_car_brand", extract_sheet,
+             kwargs={"key_file": os.getenv('KEY_SPREADSHEET'), "worksheet_name": "brand_car"}),
+
+        # Load data into staging
+        Task("load_us_state", load_staging, inputs={"data": "extract_us_state"},
+             kwargs={"schema": "public", "table_name": "us_state", "idx_name": "id_state"}),
+        Task("load_car_brand", load_staging, inputs={"data": "extract_car_brand"},
+             kwargs={"schema": "public", "table_name": "car_brand", "idx_name": "brand_car_id"}),
+    ]
+
+    if chunksize:
+        # car_sales is streamed, extract/transform/load overlap inside one task
+        tasks.append(Task("stream_car_sales", stream_car_sales,
+                          kwargs={"chunksize": chunksize, "full_refresh": full_refresh}, timeout=timeout))
+    else:
+        tasks += [
+            # Extract data from database
+            Task("extract_car_sales", extract_database,
+                 kwargs={"table_name": "car_sales", "full_refresh": full_refresh}, timeout=timeout),
+
+            # Transform car sales data from database
+            Task("transform_car_sales", transform_car_sales, inputs={"df_car_sales": "extract_car_sales"}, timeout=timeout),
+
+            # Load data into staging
+            Task("load_car_sales", load_car_sales,
+                 inputs={"tf_df_car_sales": "transform_car_sales", "df_car_sales": "extract_car_sales"}, timeout=timeout),
+        ]
+    return tasks
+
+def staging_pipeline(chunksize: int = None, full_refresh: bool = False, max_workers: int = None, executor: str = None, default_timeout: float = None):
+    """
+    Runs the staging pipeline and returns the DagResult (timings and critical path).
+    car_sales is extracted incrementally unless full_refresh is set.
+    With chunksize, car_sales is streamed through transform and load chunk by chunk
+    instead of being held in memory as a whole.
+    """
+    load_env()
+    return run_dag(staging_tasks(chunksize, full_refresh), max_workers=max_workers, executor=executor,
+                   default_timeout=default_timeout, step="staging")
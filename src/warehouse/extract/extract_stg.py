@@ -1,41 +1,41 @@
 import pandas as pd
-from sqlalchemy import text 
-import sqlalchemy
-from helper.utils import get_db_connection, etl_log, read_etl_log, read_sql
+from helper.utils import etl_log, read_keyset_pages, read_sql, get_db_connection
+from helper.dim_cache import dimension_cache
+from helper.checkpoint import read_checkpoint, checkpoint_cursor
 from datetime import datetime
 
-def extract_staging(table_name: str) -> pd.DataFrame:
+# Composite keyset used for incremental extraction, per staging table
+KEYSET_COLUMNS = {
+    "car_sales": ["created_at", "id_sales"],
+    "us_state": ["created_at", "id_state"],
+    "car_brand": ["created_at", "brand_car_id"],
+}
+
+def staging_cursor(table_name: str):
+    """
+    Returns the keyset cursor of the last successful warehouse load of table_name (None before the first one).
+    """
+    checkpoint = read_checkpoint('warehouse', "warehouse", "load", table_name)
+    return checkpoint_cursor(checkpoint, KEYSET_COLUMNS[table_name])
+
+def extract_staging(table_name: str, page_size: int = 50000) -> pd.DataFrame:
     """
     Extracts data from the staging database incrementally.
     """
     try:
-        conn = get_db_connection('staging')
-        
-        # Get the latest etl_date from the log table
-        filter_log = {
-            "step": "warehouse",
-            "table_name": table_name,
-            "status": "success",
-            "component": "load"
-        }
-        etl_date = read_etl_log(filter_log)
-
-        # If no previous extraction has been recorded (etl_date is empty), set etl_date to '1111-01-01' indicating the initial load.
-        # Otherwise, retrieve data added since the last successful extraction (etl_date).
-        # Set etl_date for incremental extraction
-        if etl_date.empty or etl_date['latest_etl_date'][0] is None:
-            etl_date = '1111-01-01'
-        else:
-            etl_date = etl_date['latest_etl_date'][0]
+        # Rows after the checkpoint of the last warehouse load, or everything on the initial load
+        cursor = staging_cursor(table_name)
 
-        # Constructs a SQL query to select all columns from the specified table_name where created_at is greater than etl_date.
+        # Constructs a SQL query to select the next page of rows after the cursor
         """
         SELECT * 
         FROM car_sales 
-        WHERE created_at > :etl_date
+        WHERE (created_at, id_sales) > (:last_created_at, :last_id_sales)
+        ORDER BY created_at, id_sales
+        LIMIT :page_size
         """
-        query = sqlalchemy.text(read_sql_inc(table_name))
-        df = pd.read_sql(sql=query, con=conn, params={"etl_date": etl_date})
+        pages = list(read_keyset_pages('staging', table_name, KEYSET_COLUMNS[table_name], cursor=cursor, page_size=page_size))
+        df = pd.concat(pages, ignore_index=True) if pages else pd.DataFrame()
 
         # Log success
         log_msg = {
@@ -59,5 +59,78 @@ def extract_staging(table_name: str) -> pd.DataFrame:
             "error_msg": str(e)
         }
         print(e)
+        raise
+    finally:
+        etl_log(log_msg)
+
+
+def extract_staging_chunks(table_name: str, chunksize: int = 50000):
+    """
+    Extracts data from the staging database incrementally, as a stream of keyset pages of at most chunksize rows.
+    """
+    log_msg = {
+        "step": "warehouse",
+        "component": "extract",
+        "table_name": table_name,
+    }
+    try:
+        cursor = staging_cursor(table_name)
+        yield from read_keyset_pages('staging', table_name, KEYSET_COLUMNS[table_name], cursor=cursor, page_size=chunksize)
+
+        # Log success once the whole table has been streamed
+        log_msg["status"] = "success"
+    except Exception as e:
+        # Log failure
+        log_msg["status"] = "failed"
+        log_msg["error_msg"] = str(e)
+        raise
+    finally:
+        # A consumer that stops early closes the generator, nothing was extracted in full
+        log_msg.setdefault("status", "failed")
+        log_msg["etl_date"] = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        etl_log(log_msg)
+
+def dimension_validator(table_name: str) -> dict:
+    """
+    Version of a staging dimension table: its row count and max(created_at), a single aggregate query.
+    """
+    import sqlalchemy
+
+    query = sqlalchemy.text(f"SELECT COUNT(*) AS row_count, MAX(created_at) AS max_created_at FROM {table_name}")
+    with get_db_connection('staging').connect() as connection:
+        row = connection.execute(query).mappings().first()
+    return {"row_count": row["row_count"], "max_created_at": str(row["max_created_at"])}
+
+def extract_dimension(table_name: str) -> pd.DataFrame:
+    """
+    Extracts a whole dimension table (us_state, car_brand) from the staging database,
+    served from the local dimension cache while the table is unchanged.
+    """
+    try:
+        df = dimension_cache.get(f"staging.{table_name}",
+                                 validator=dimension_validator(table_name),
+                                 fetch=lambda: pd.read_sql(read_sql(table_name), get_db_connection('staging')))
+
+        # Log success
+        log_msg = {
+            "step": "warehouse",
+            "component": "extract",
+            "status": "success",
+            "table_name": table_name,
+            "etl_date": datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        }
+        return df
+    except Exception as e:
+        # Log failure
+        log_msg = {
+            "step": "warehouse",
+            "component": "extract",
+            "status": "failed",
+            "table_name": table_name,
+            "etl_date": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+            "error_msg": str(e)
+        }
+        print(e)
+        raise
     finally:
-        etl_log(log_msg)
\ No newline at end of file
+        etl_log(log_msg)
@@ -1,20 +1,28 @@
 import pandas as pd
 from helper.utils import get_db_connection, etl_log
 from datetime import datetime
-from pangres import upsert
+from helper.bulk_load import upsert_dataframe
+from helper.checkpoint import remember_checkpoint
 
-def load_warehouse(data, schema: str, table_name: str, idx_name: str):
+def load_warehouse(data, schema: str, table_name: str, idx_name: str, checkpoint: dict = None):
+    """
+    Upserts data into the warehouse table, returns the inserted/updated row counts reported by the loader.
+    A failed load is logged and raised again, so the pipeline graph sees it.
+    The optional checkpoint (see helper.checkpoint) is committed together with the rows.
+    """
     try:
         conn = get_db_connection('warehouse')
         data = data.iloc[:, :-1] #Remove crated_at in the last column        
         data = data.set_index(idx_name)
 
         # Do upsert (Update for existing data and Insert for new data)
-        upsert(con=conn, 
-               df=data, 
-               table_name=table_name, 
-               schema=schema, 
-               if_row_exists="update")
+        counts = upsert_dataframe(con=conn, 
+                                  df=data, 
+                                  table_name=table_name, 
+                                  schema=schema,
+                                  checkpoint=checkpoint)
+        if checkpoint is not None:
+            remember_checkpoint('warehouse', checkpoint)
         
         #create success log message
         log_msg = {
@@ -25,6 +33,9 @@ def load_warehouse(data, schema: str, table_name: str, idx_name: str):
             "table_name": table_name,
             "etl_date": datetime.now().strftime("%Y-%m-%d %H:%M:%S")
         }
+        log_msg.update(counts)
+
+        return counts
     except Exception as e:
         log_msg = {
             "step": "warehouse",
@@ -41,6 +52,7 @@ def load_warehouse(data, schema: str, table_name: str, idx_name: str):
         #     handle_error(data = data, bucket_name='error-paccar', table_name= table_name, step='warehouse', component='load')
         # except Exception as e:
         #     print(e)
+        raise
 
     finally:
         etl_log(log_msg)
\ No newline at end of file
@@ -0,0 +1,158 @@
+import json
+import os
+import threading
+import uuid
+from collections import namedtuple
+from datetime import datetime
+from functools import lru_cache
+import numpy as np
+import pandas as pd
+
+# Rules are declared in this file unless DQ_RULES_PATH points to another one
+DEFAULT_RULES_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "dq_rules.json")
+
+RULE_TYPES = ("not_missing", "not_in")
+
+# A column given as category codes (-1 for NaN) and its distinct values, rules then run once per category
+CategoryColumn = namedtuple("CategoryColumn", ["codes", "categories"])
+
+class Rule:
+    """
+    One data quality rule, a row matching it is rejected.
+    not_missing: the value is NaN/None or one of missing_values, on every column of columns ("*" for all).
+    not_in: the value of column is one of values.
+    """
+    def __init__(self, name: str, type: str, columns=None, column: str = None, values: list = None, missing_values: list = None):
+        if type not in RULE_TYPES:
+            raise ValueError(f"Unknown data quality rule type {type} (rule {name})")
+        self.name = name
+        self.type = type
+        self.columns = columns if columns is not None else [column]
+        self.values = list(values or [])
+        self.missing_values = list(missing_values or [])
+
+    def columns_of(self, df_columns) -> list:
+        return list(df_columns) if self.columns == "*" else [col for col in self.columns if col in df_columns]
+
+    def matches(self, values) -> np.ndarray:
+        """
+        Boolean array, True where values match the rule.
+        """
+        values = pd.Series(values) if not isinstance(values, pd.Series) else values
+        if self.type == "not_in":
+            return values.isin(self.values).to_numpy()
+        missing = values.isna().to_numpy()
+        if values.dtype == object and self.missing_values:
+            missing |= values.isin(self.missing_values).to_numpy()
+        return missing
+
+    def matches_column(self, column) -> np.ndarray:
+        if not isinstance(column, CategoryColumn):
+            return self.matches(column)
+
+        # Evaluate the distinct values once, then broadcast by code (-1 is NaN)
+        per_category = self.matches(pd.Series(column.categories, dtype=object))
+        result = per_category.take(column.codes) if len(per_category) else np.zeros(len(column.codes), dtype=bool)
+        result[column.codes == -1] = self.matches(pd.Series([np.nan], dtype=object))[0]
+        return result
+
+class RuleSet:
+    """
+    Rules of a table, evaluated in a single pass: every rule is computed over the columns once
+    and folded into one array holding, per row, the first rule (in config order) that rejects it.
+    """
+    def __init__(self, rules: list, table_name: str = None):
+        self.rules = rules
+        self.table_name = table_name
+
+    @classmethod
+    def from_config(cls, config: dict) -> "RuleSet":
+        return cls([Rule(**rule) for rule in config["rules"]], config.get("table_name"))
+
+    @property
+    def names(self) -> list:
+        return [rule.name for rule in self.rules]
+
+    def rules_of_type(self, type: str) -> list:
+        return [rule for rule in self.rules if rule.type == type]
+
+    def evaluate(self, df: pd.DataFrame, columns: dict = None):
+        """
+        Returns (rule_ids, hits): the index of the first rule rejecting each row (-1 when the row is
+        kept) and the number of rows matching each rule. columns overrides columns of df, e.g. with
+        a CategoryColumn of cleaned values.
+        """
+        columns = columns or {}
+        rule_ids = np.full(len(df), -1, dtype=np.int16)
+        hits = {}
+
+        # Last rule first, so the first matching rule ends up in rule_ids
+        for rule_id in reversed(range(len(self.rules))):
+            rule = self.rules[rule_id]
+            matched = np.zeros(len(df), dtype=bool)
+            for col in rule.columns_of(df.columns):
+                matched |= rule.matches_column(columns.get(col, df[col]))
+            rule_ids[matched] = rule_id
+            hits[rule.name] = int(matched.sum())
+
+        return rule_ids, {name: hits[name] for name in self.names}
+
+@lru_cache(maxsize=None)
+def _load_rules(path: str) -> RuleSet:
+    with open(path) as f:
+        return RuleSet.from_config(json.load(f))
+
+def load_rules(path: str = None) -> RuleSet:
+    """
+    Returns the rule set declared in path (DQ_RULES_PATH or dq_rules.json), parsed once per process.
+    """
+    return _load_rules(path or os.getenv('DQ_RULES_PATH', DEFAULT_RULES_PATH))
+
+class QuarantineStore:
+    """
+    Keeps the rows rejected by the data quality rules instead of dropping them silently.
+    Every transformed chunk with rejected rows becomes a zstd-compressed Parquet file of the original
+    rows, tagged with the rule that rejected them (dq_rule). A line per chunk with the per-rule hit
+    counts is appended to hits.jsonl, and the totals of the run are kept in hits.
+    """
+    def __init__(self, table_name: str, quarantine_dir: str = None):
+        self.table_name = table_name
+        self.quarantine_dir = os.path.join(quarantine_dir or os.getenv('QUARANTINE_DIR', 'quarantine'), table_name)
+        self.rows_in = 0
+        self.rows_rejected = 0
+        self.hits = {}
+        self._lock = threading.Lock()
+
+    def record(self, df: pd.DataFrame, rule_ids: np.ndarray, rules: RuleSet, hits: dict):
+        rejected = rule_ids >= 0
+        etl_date = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        os.makedirs(self.quarantine_dir, exist_ok=True)
+
+        file_name = None
+        if rejected.any():
+            df_rejected = df[rejected].copy()
+            df_rejected['dq_rule'] = np.asarray(rules.names, dtype=object).take(rule_ids[rejected])
+            df_rejected['quarantined_at'] = etl_date
+            file_name = f"{datetime.now().strftime('%Y%m%d_%H%M%S')}_{uuid.uuid4().hex[:8]}.parquet"
+            df_rejected.to_parquet(os.path.join(self.quarantine_dir, file_name), compression="zstd")
+
+        summary = {"etl_date": etl_date, "rows_in": len(df), "rows_rejected": int(rejected.sum()),
+                   "hits": hits, "file": file_name}
+        with self._lock:
+            self.rows_in += summary["rows_in"]
+            self.rows_rejected += summary["rows_rejected"]
+            for name, count in hits.items():
+                self.hits[name] = self.hits.get(name, 0) + count
+            with open(os.path.join(self.quarantine_dir, "hits.jsonl"), "a") as f:
+                f.write(json.dumps(summary) + "\n")
+        return summary
+
+def read_quarantine(table_name: str, quarantine_dir: str = None) -> pd.DataFrame:
+    """
+    Reads back every quarantined row of table_name.
+    """
+    path = os.path.join(quarantine_dir or os.getenv('QUARANTINE_DIR', 'quarantine'), table_name)
+    files = sorted(name for name in os.listdir(path) if name.endswith(".parquet")) if os.path.isdir(path) else []
+    if not files:
+        return pd.DataFrame()
+    return pd.concat([pd.read_parquet(os.path.join(path, name)) for name in files])
@@ -1,44 +1,61 @@
+import os
 import pandas as pd
 import numpy as np
+from warehouse.transform.data_quality import load_rules, CategoryColumn
+
+# Mapping for merging similar categories in the 'color' column
+COLOR_MAPPING = {
+    '—': '', '': '', '16633': '', '6388': '', 
+    'off-white': 'white', 'white': 'white', 'gray': 'grey'
+}
+
+# Mapping for merging similar categories in the 'interior' column
+INTERIOR_MAPPING = {
+    '—': '', '': '', 'off-white': 'white', 'white': 'white', 
+    'gray': 'grey', 'green': 'green'
+}
+
+# Columns of the warehouse car_sales table, in order
+WAREHOUSE_COLUMNS = [
+    'id_sales_nk',
+    'year',
+    'brand_car_id',
+    'transmission',
+    'id_state',
+    'condition',
+    'odometer',
+    'color',
+    'interior',
+    'mmr',
+    'selling_price',
+    'created_at'
+]
 
 def clean_and_merge_categories(df):
-    # Mapping for merging similar categories in the 'color' column
-    color_mapping = {
-        '—': '', '': '', '16633': '', '6388': '', 
-        'off-white': 'white', 'white': 'white', 'gray': 'grey'
-    }
-
-    # Mapping for merging similar categories in the 'interior' column
-    interior_mapping = {
-        '—': '', '': '', 'off-white': 'white', 'white': 'white', 
-        'gray': 'grey', 'green': 'green'
-    }
-
     # Apply the category merging mappings to the 'color' and 'interior' columns
-    df['color'] = df['color'].astype(str).str.lower().map(color_mapping).fillna(df['color'])
-    df['interior'] = df['interior'].astype(str).str.lower().map(interior_mapping).fillna(df['interior'])
+    df['color'] = df['color'].astype(str).str.lower().map(COLOR_MAPPING).fillna(df['color'])
+    df['interior'] = df['interior'].astype(str).str.lower().map(INTERIOR_MAPPING).fillna(df['interior'])
     
     return df
 
-def drop_invalid_values(df):
-    # Replace '' and '—' to np.nan and drop
-    df = df.replace({'': np.nan, '—': np.nan})
+def drop_invalid_values(df, rules=None):
+    rules = rules or load_rules()
+    for rule in rules.rules_of_type("not_missing"):
+        columns = rule.columns_of(df.columns)
 
-    # Drop all row with NaN
-    df = df.dropna()
+        # Replace the missing values ('' and '—') to np.nan and drop
+        df[columns] = df[columns].replace({value: np.nan for value in rule.missing_values})
 
-    # Drop rows where 'condition' is NaN
-    df = df[df['condition'].notna()]
+        # Drop all row with NaN
+        df = df.dropna(subset=columns)
 
     return df
 
-def drop_sales_by_id(df):
-    # Function to drop rows where 'id_sales' is 8013 or 26976
-    df = df[~df['id_sales'].isin([8013, 26976])]
-
-    # Drop rows with invalid state code
-    invalid_states = ['3vwd17aj5fm219943', '3vwd17aj5fm297123']
-    df = df[~df['state'].isin(invalid_states)]
+def drop_sales_by_id(df, rules=None):
+    # Drop rows with a known invalid value (id_sales 8013 and 26976, VIN-like state codes)
+    rules = rules or load_rules()
+    for rule in rules.rules_of_type("not_in"):
+        df = df[~df[rule.columns[0]].isin(rule.values)]
 
     return df
 
@@ -66,38 +83,146 @@ def mapping_target(df, df_car_brand, df_us_state):
         'sellingprice': 'selling_price'
     })
 
-    # Ensure all required columns are present and ordered correctly
-    warehouse_columns = [
-        'id_sales_nk',
-        'year',
-        'brand_car_id',
-        'transmission',
-        'id_state',
-        'condition',
-        'odometer',
-        'color',
-        'interior',
-        'mmr',
-        'selling_price',
-        'created_at'
-    ]
-
-    # Filter columns to match the warehouse schema
-    df = df[warehouse_columns]
+    # Filter columns to match the warehouse schema, ordered correctly
+    df = df[WAREHOUSE_COLUMNS]
     
     return df
 
-def transform_car_sales(df, df_car_brand, df_us_state):
+def transform_car_sales_reference(df, df_car_brand, df_us_state, rules=None):
     # Step 1: Clean and merge categories
     df = clean_and_merge_categories(df)
     
     # Step 2: Drop rows with invalid values
-    df = drop_invalid_values(df)
+    df = drop_invalid_values(df, rules)
     
     # Step 3: Drop rows with 'id_sales' 8013 and 26976
-    df = drop_sales_by_id(df)
+    df = drop_sales_by_id(df, rules)
 
     # Step 4: Mapping and transformation
     df = mapping_target(df, df_car_brand, df_us_state)
     
     return df
+
+def build_lookup(keys: pd.Series, ids: pd.Series):
+    """
+    Builds a (key index, id array) lookup. Like dict(zip(keys, ids)), the last id wins for a duplicated key.
+    """
+    keep = ~keys.duplicated(keep='last').to_numpy()
+    return pd.Index(keys.to_numpy()[keep]), ids.to_numpy()[keep]
+
+def build_lookups(df_car_brand, df_us_state) -> dict:
+    """
+    Prebuilds the dimension lookups used by the fast engine, so they can be reused across calls and chunks.
+    """
+    return {
+        'brand_car_id': build_lookup(df_car_brand['brand_name'], df_car_brand['brand_car_id']),
+        'id_state': build_lookup(df_us_state['code'], df_us_state['id_state']),
+    }
+
+def _categorize(values: pd.Series):
+    # Category codes per row and the distinct values, so per-value work runs once per category (NaN has code -1)
+    codes, categories = pd.factorize(values, use_na_sentinel=True)
+    return codes, np.asarray(categories, dtype=object)
+
+def _merge_categories(values: pd.Series, codes, categories, mapping: dict):
+    # Same result as values.astype(str).str.lower().map(mapping).fillna(values), computed on the categories
+    lowered = pd.Series(categories, dtype=object).astype(str).str.lower()
+    merged_categories = lowered.map(mapping).to_numpy(dtype=object)
+    unmapped = pd.isna(merged_categories)
+    merged_categories[unmapped] = categories[unmapped]
+
+    merged = merged_categories.take(codes)
+    missing = codes == -1
+    if missing.any():
+        merged[missing] = values.to_numpy(dtype=object)[missing]
+    return merged, merged_categories
+
+def _to_numeric_by_category(values, downcast: str):
+    # pd.to_numeric for low cardinality columns: parse each distinct string once, then downcast the whole column
+    if pd.api.types.is_numeric_dtype(values.dtype):
+        # Typed staging: nothing to parse
+        return pd.to_numeric(pd.Series(values), downcast=downcast).to_numpy()
+    codes, categories = pd.factorize(pd.Series(values), use_na_sentinel=True)
+    parsed = pd.to_numeric(pd.Series(categories, dtype=object), errors='coerce').to_numpy()
+    numbers = parsed.take(codes)
+    if (codes == -1).any():
+        numbers = numbers.astype('float64')
+        numbers[codes == -1] = np.nan
+    return pd.to_numeric(pd.Series(numbers), downcast=downcast).to_numpy()
+
+def _lookup(codes, categories, lookup):
+    # Same result as Series.map(dict): ids keep their dtype unless a key is missing (then float with NaN)
+    index, ids = lookup
+    positions = index.get_indexer(categories).take(codes)
+    positions[codes == -1] = -1
+    if (positions == -1).any():
+        if len(ids) == 0:
+            return np.full(len(codes), np.nan)
+        result = ids.take(positions).astype('float64')
+        result[positions == -1] = np.nan
+        return result
+    return ids.take(positions)
+
+def transform_car_sales_fast(df, df_car_brand=None, df_us_state=None, lookups: dict = None, rules=None, quarantine=None):
+    """
+    Same output as transform_car_sales_reference, computed without intermediate full-size frames:
+    color, interior, state and brand_car are handled as categories, the data quality rules are
+    evaluated in one pass and applied once, and the dimensions are looked up by index position.
+    With a QuarantineStore, the rejected rows are kept there with the rule that rejected them.
+    The input frame is not modified.
+    """
+    if lookups is None:
+        lookups = build_lookups(df_car_brand, df_us_state)
+    rules = rules or load_rules()
+
+    # Category codes for the low cardinality columns
+    color_codes, color_categories = _categorize(df['color'])
+    interior_codes, interior_categories = _categorize(df['interior'])
+    state_codes, state_categories = _categorize(df['state'])
+    brand_codes, brand_categories = _categorize(df['brand_car'])
+
+    # Step 1: Clean and merge categories
+    color, color_merged = _merge_categories(df['color'], color_codes, color_categories, COLOR_MAPPING)
+    interior, interior_merged = _merge_categories(df['interior'], interior_codes, interior_categories, INTERIOR_MAPPING)
+
+    # Steps 2 and 3: every data quality rule in one pass, color and interior checked after merging
+    rule_ids, hits = rules.evaluate(df, columns={
+        'color': CategoryColumn(color_codes, color_merged),
+        'interior': CategoryColumn(interior_codes, interior_merged),
+        'state': CategoryColumn(state_codes, state_categories),
+        'brand_car': CategoryColumn(brand_codes, brand_categories),
+    })
+    keep = rule_ids < 0
+    if quarantine is not None:
+        quarantine.record(df, rule_ids, rules, hits)
+
+    # Step 4: Mapping and transformation, only for the kept rows (.array keeps extension dtypes such as tz-aware timestamps)
+    def kept(col):
+        return df[col].array[keep]
+
+    result = {
+        'id_sales_nk': kept('id_sales'),
+        'year': _to_numeric_by_category(kept('year'), downcast='integer'),
+        'brand_car_id': _lookup(brand_codes[keep], brand_categories, lookups['brand_car_id']),
+        'transmission': kept('transmission'),
+        'id_state': _lookup(state_codes[keep], state_categories, lookups['id_state']),
+        'condition': _to_numeric_by_category(kept('condition'), downcast='float'),
+        'odometer': pd.to_numeric(pd.Series(kept('odometer')), errors='coerce', downcast='float').to_numpy(),
+        'color': color[keep],
+        'interior': interior[keep],
+        'mmr': pd.to_numeric(pd.Series(kept('mmr')), errors='coerce', downcast='float').to_numpy(),
+        'selling_price': pd.to_numeric(pd.Series(kept('sellingprice')), errors='coerce', downcast='float').to_numpy(),
+        'created_at': kept('created_at'),
+    }
+    return pd.DataFrame(result, index=df.index[keep], columns=WAREHOUSE_COLUMNS)
+
+def transform_car_sales(df, df_car_brand, df_us_state, engine: str = None, lookups: dict = None, rules=None, quarantine=None):
+    """
+    Cleans staging car_sales and maps it to the warehouse schema.
+    engine is 'fast' (default, or TRANSFORM_ENGINE) or 'reference' (the step by step pandas version), both give the same output.
+    rules defaults to the rules of dq_rules.json. Only the fast engine writes rejected rows to quarantine.
+    """
+    engine = engine or os.getenv('TRANSFORM_ENGINE', 'fast')
+    if engine == 'reference':
+        return transform_car_sales_reference(df, df_car_brand, df_us_state, rules)
+    return transform_car_sales_fast(df, df_car_brand, df_us_state, lookups=lookups, rules=rules, quarantine=quarantine)
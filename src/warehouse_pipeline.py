@@ -1,15 +1,106 @@
-from warehouse.extract.extract_stg import extract_staging
-from warehouse.transform.transform_car_sales import transform_car_sales
+from warehouse.extract.extract_stg import extract_staging, extract_staging_chunks, extract_dimension, KEYSET_COLUMNS
+from warehouse.transform.transform_car_sales import transform_car_sales, build_lookup, build_lookups
+from warehouse.transform.data_quality import QuarantineStore
+from helper.dim_cache import dimension_cache
 from warehouse.load.load_wh import load_warehouse
+from helper.streaming import run_streaming
+from helper.dag import Task, run_dag
+from helper.utils import keyset_cursor, load_env
+from helper.checkpoint import make_checkpoint
+import os
 
-def warehouse_pipeline():
-    # Extract data from staging
-    stg_car_sales = extract_staging("car_sales")
-    stg_us_state = extract_staging("us_state")
-    stg_car_brand = extract_staging("car_brand")
+def dimension_lookups(stg_car_brand, stg_us_state) -> dict:
+    """
+    Dimension lookups of the transform, reused from the dimension cache while both dimensions are unchanged.
+    """
+    brand_lookup = dimension_cache.derived("staging.car_brand", "brand_lookup",
+                                           lambda df: build_lookup(df['brand_name'], df['brand_car_id']))
+    state_lookup = dimension_cache.derived("staging.us_state", "state_lookup",
+                                           lambda df: build_lookup(df['code'], df['id_state']))
 
-    # Transform car sales data from staging
-    tf_stg_car_sales = transform_car_sales(df=stg_car_sales,df_car_brand=stg_car_brand,df_us_state=stg_us_state)
+    # Not cached (empty dimension, unwritable cache dir): build them from the extracted frames
+    if brand_lookup is None or state_lookup is None:
+        return build_lookups(stg_car_brand, stg_us_state)
+    return {'brand_car_id': brand_lookup, 'id_state': state_lookup}
 
-    # Load data into warehouse
-    load_warehouse(data=tf_stg_car_sales, schema='public', table_name='car_sales', idx_name='id_sales_nk')
\ No newline at end of file
+def transform_stg_car_sales(stg_car_sales, stg_car_brand, stg_us_state, lookups: dict = None, quarantine: QuarantineStore = None):
+    # Nothing new in staging since the last run
+    if stg_car_sales is None or stg_car_sales.empty:
+        return None
+
+    # Rows rejected by the data quality rules are kept in quarantine with the rule that rejected them
+    quarantine = quarantine or QuarantineStore("car_sales")
+    return transform_car_sales(df=stg_car_sales, df_car_brand=stg_car_brand, df_us_state=stg_us_state,
+                               lookups=lookups, quarantine=quarantine)
+
+def load_car_sales(tf_stg_car_sales, stg_car_sales):
+    if tf_stg_car_sales is None:
+        return None
+
+    # Watermark of the extracted rows (taken before the transform drops rows), committed together with them
+    checkpoint = make_checkpoint("warehouse", "load", "car_sales",
+                                 cursor=keyset_cursor(stg_car_sales, KEYSET_COLUMNS["car_sales"]),
+                                 key_columns=KEYSET_COLUMNS["car_sales"])
+
+    return load_warehouse(data=tf_stg_car_sales, schema='public', table_name='car_sales', idx_name='id_sales_nk', checkpoint=checkpoint)
+
+def stream_car_sales(stg_car_brand, stg_us_state, lookups: dict, chunksize: int):
+    # The dimension lookups are built once and shared by every chunk, like the quarantine store
+    quarantine = QuarantineStore("car_sales")
+
+    def load_car_sales_chunk(stg_car_sales):
+        # Transform and load one chunk of car sales data
+        tf_stg_car_sales = transform_stg_car_sales(stg_car_sales, stg_car_brand, stg_us_state, lookups=lookups, quarantine=quarantine)
+        return load_car_sales(tf_stg_car_sales, stg_car_sales)
+
+    # Extract, transform and load car sales chunk by chunk
+    return run_streaming(extract_staging_chunks("car_sales", chunksize=chunksize), load_car_sales_chunk)
+
+def warehouse_tasks(chunksize: int = None) -> list:
+    """
+    Declares the warehouse pipeline as a graph: the three staging tables are extracted concurrently.
+    The car_sales tasks, the long ones, time out after CAR_SALES_TIMEOUT seconds (default one hour),
+    the others after the run default.
+    """
+    timeout = float(os.getenv('CAR_SALES_TIMEOUT', 3600))
+    tasks = [
+        # Extract dimension data from staging (served from the dimension cache while unchanged)
+        Task("extract_us_state", extract_dimension, kwargs={"table_name": "us_state"}),
+        Task("extract_car_brand", extract_dimension, kwargs={"table_name": "car_brand"}),
+
+        # Build the dimension lookups of the transform
+        Task("dimension_lookups", dimension_lookups,
+             inputs={"stg_car_brand": "extract_car_brand", "stg_us_state": "extract_us_state"}),
+    ]
+
+    if chunksize:
+        # car_sales is streamed, extract/transform/load overlap inside one task
+        tasks.append(Task("stream_car_sales", stream_car_sales,
+                          inputs={"stg_car_brand": "extract_car_brand", "stg_us_state": "extract_us_state",
+                                  "lookups": "dimension_lookups"},
+                          kwargs={"chunksize": chunksize}, timeout=timeout))
+    else:
+        tasks += [
+            # Extract data from staging
+            Task("extract_car_sales", extract_staging, kwargs={"table_name": "car_sales"}, timeout=timeout),
+
+            # Transform car sales data from staging
+            Task("transform_car_sales", transform_stg_car_sales,
+                 inputs={"stg_car_sales": "extract_car_sales", "stg_car_brand": "extract_car_brand", "stg_us_state": "extract_us_state",
+                         "lookups": "dimension_lookups"}, timeout=timeout),
+
+            # Load data into warehouse
+            Task("load_car_sales", load_car_sales,
+                 inputs={"tf_stg_car_sales": "transform_car_sales", "stg_car_sales": "extract_car_sales"}, timeout=timeout),
+        ]
+    return tasks
+
+def warehouse_pipeline(chunksize: int = None, max_workers: int = None, executor: str = None, default_timeout: float = None):
+    """
+    Runs the warehouse pipeline and returns the DagResult (timings and critical path).
+    With chunksize, car_sales is streamed through transform and load chunk by chunk
+    instead of being held in memory as a whole.
+    """
+    load_env()
+    return run_dag(warehouse_tasks(chunksize), max_workers=max_workers, executor=executor,
+                   default_timeout=default_timeout, step="warehouse")
@@ -30,3 +30,17 @@ CREATE TABLE public.car_sales (
 	created_at timestamp DEFAULT now() NULL,
 	CONSTRAINT car_sales_pk PRIMARY KEY (id_sales)
 );
+
+-- Keyset pagination of the warehouse extraction reads car_sales in this order
+CREATE INDEX car_sales_created_at_id_idx ON public.car_sales USING btree (created_at, id_sales);
+
+-- High-water mark of each incremental load, written in the same transaction as the load
+CREATE TABLE public.etl_checkpoint (
+	step varchar NOT NULL,
+	component varchar NOT NULL,
+	table_name varchar NOT NULL,
+	max_created_at timestamp NULL,
+	max_id int8 NULL,
+	updated_at timestamp DEFAULT now() NOT NULL,
+	CONSTRAINT etl_checkpoint_pk PRIMARY KEY (step, component, table_name)
+);
@@ -0,0 +1,20 @@
+-- Typed staging mode (STAGING_TYPED=true): store the numeric car_sales columns with their source types.
+-- Values staged as varchar ('2015', '4.5', 'nan', '') are converted in place, anything that is not a number becomes NULL.
+-- Run once against the staging database before the first typed run, e.g.
+--   psql -d staging_car -f staging_data/migrations/001_typed_car_sales.sql
+
+BEGIN;
+
+ALTER TABLE public.car_sales
+	ALTER COLUMN "year" TYPE int4
+		USING CASE WHEN "year" ~ '^\s*-?[0-9]+(\.0*)?\s*$' THEN "year"::numeric::int4 END,
+	ALTER COLUMN "condition" TYPE float4
+		USING CASE WHEN "condition" ~* '^\s*-?[0-9]*\.?[0-9]+(e[-+]?[0-9]+)?\s*$' THEN "condition"::float4 END,
+	ALTER COLUMN odometer TYPE float4
+		USING CASE WHEN odometer ~* '^\s*-?[0-9]*\.?[0-9]+(e[-+]?[0-9]+)?\s*$' THEN odometer::float4 END,
+	ALTER COLUMN mmr TYPE float4
+		USING CASE WHEN mmr ~* '^\s*-?[0-9]*\.?[0-9]+(e[-+]?[0-9]+)?\s*$' THEN mmr::float4 END,
+	ALTER COLUMN sellingprice TYPE float4
+		USING CASE WHEN sellingprice ~* '^\s*-?[0-9]*\.?[0-9]+(e[-+]?[0-9]+)?\s*$' THEN sellingprice::float4 END;
+
+COMMIT;
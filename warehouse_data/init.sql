@@ -16,4 +16,18 @@ CREATE TABLE public.car_sales (
 	created_at timestamp DEFAULT now() NOT NULL,
 	CONSTRAINT car_sales_pk PRIMARY KEY (sales_id),
 	CONSTRAINT car_sales_unique UNIQUE (id_sales_nk)
-);
\ No newline at end of file
+);
+
+-- Keyset pagination of the warehouse car_sales reads (training, profiling) follows this order
+CREATE INDEX car_sales_created_at_id_sales_nk_idx ON public.car_sales USING btree (created_at, id_sales_nk);
+
+-- High-water mark of each incremental load, written in the same transaction as the load
+CREATE TABLE public.etl_checkpoint (
+	step varchar NOT NULL,
+	component varchar NOT NULL,
+	table_name varchar NOT NULL,
+	max_created_at timestamp NULL,
+	max_id int8 NULL,
+	updated_at timestamp DEFAULT now() NOT NULL,
+	CONSTRAINT etl_checkpoint_pk PRIMARY KEY (step, component, table_name)
+);
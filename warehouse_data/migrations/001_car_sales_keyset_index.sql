@@ -0,0 +1,12 @@
+-- Index for the keyset reads of warehouse car_sales, ordered by (created_at, id_sales_nk).
+-- Without it every page is a sort of the whole table. Run once against an existing warehouse database, e.g.
+--   psql -d warhouse_car -f warehouse_data/migrations/001_car_sales_keyset_index.sql
+-- The index is built in a transaction and locks writes to car_sales meanwhile; on a large table outside
+-- a load window, run the statement alone with CREATE INDEX CONCURRENTLY instead.
+
+BEGIN;
+
+CREATE INDEX IF NOT EXISTS car_sales_created_at_id_sales_nk_idx
+	ON public.car_sales USING btree (created_at, id_sales_nk);
+
+COMMIT;
@@ -0,0 +1,17 @@
+-- Incremental loads: the high-water mark of each load, written in the same transaction as the rows.
+-- Run once against an existing warehouse database before the first incremental run, e.g.
+--   psql -d warhouse_car -f warehouse_data/migrations/002_etl_checkpoint.sql
+
+BEGIN;
+
+CREATE TABLE IF NOT EXISTS public.etl_checkpoint (
+	step varchar NOT NULL,
+	component varchar NOT NULL,
+	table_name varchar NOT NULL,
+	max_created_at timestamp NULL,
+	max_id int8 NULL,
+	updated_at timestamp DEFAULT now() NOT NULL,
+	CONSTRAINT etl_checkpoint_pk PRIMARY KEY (step, component, table_name)
+);
+
+COMMIT;